@@ -11,21 +11,22 @@ from flask import (
 import os
 from werkzeug.utils import secure_filename
 import contextlib
+import hashlib
 import uuid
+import zipfile
+from collections import OrderedDict
 
 from translator.idml_handler import (
-    extract_idml,
-    find_story_files,
-    repackage_idml,
-    copy_unpacked_dir
+    find_story_members,
+    write_idml,
 )
 from translator.text_extractor import (
-    load_story_xml,
-    extract_content_elements,
-    update_content_elements,
-    save_story_xml
+    load_zipped_story_templates,
+    collect_idml_texts,
 )
+from translator.jobs import JobSlots, JobWorkspace
 from translator.openai_client import (
+    batch_api_translate,
     batch_translate,
     async_batch_translate,
     DEFAULT_PROMPT,
@@ -35,10 +36,19 @@ from translator.token_estimator import (
     estimate_cost,
     estimate_total_tokens,
 )
+from translator.translation_memory import TranslationMemory
+from translator.prefilter import PassthroughFilter
+from translator.batch_sizer import BatchSizer
+from translator.history import HistoryPolicy
+from translator.glossary import load_glossary
+from translator.checkpoint import JobCheckpoint
+from translator.incremental import PreviousVersion
+from translator.fuzzy import FuzzyMatcher
+from translator.scheduler import RateLimit, RequestScheduler, TranslationError
+from translator.story_pool import story_pool
 import shutil
 import time
 import threading
-import tempfile
 import asyncio
 
 app = Flask(__name__)
@@ -47,6 +57,30 @@ PASSWORD = os.environ.get("APP_PASSWORD", "banana")
 DEFAULT_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o")
 USE_ASYNC = os.environ.get("USE_ASYNC_TRANSLATE", "false").lower() in ("1", "true", "yes")
 MAX_BATCH_TOKENS = int(os.environ.get("MAX_BATCH_TOKENS", "800"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+STORY_WORKERS = int(os.environ.get("STORY_WORKERS", str(os.cpu_count() or 1)))
+STREAM_STORY_BYTES = int(os.environ.get("STREAM_STORY_BYTES", str(32 * 1024 * 1024)))
+MERGE_PARAGRAPH_RUNS = os.environ.get("MERGE_PARAGRAPH_RUNS", "false").lower() in ("1", "true", "yes")
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "false").lower() in ("1", "true", "yes")
+MULTI_LANGUAGE_REQUESTS = os.environ.get("MULTI_LANGUAGE_REQUESTS", "false").lower() in ("1", "true", "yes")
+GROUP_BATCHES_BY_STORY = os.environ.get("GROUP_BATCHES_BY_STORY", "false").lower() in ("1", "true", "yes")
+HISTORY_STRATEGY = os.environ.get("HISTORY_STRATEGY", "full")
+HISTORY_PAIRS = int(os.environ.get("HISTORY_PAIRS", "20"))
+# termbase formats accepted for the optional per-job glossary upload
+GLOSSARY_EXTENSIONS = (".csv", ".tbx")
+ADAPTIVE_BATCH_SIZE = os.environ.get("ADAPTIVE_BATCH_SIZE", "true").lower() in ("1", "true", "yes")
+PREFILTER_SEGMENTS = os.environ.get("PREFILTER_SEGMENTS", "true").lower() in ("1", "true", "yes")
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("MAX_CONCURRENT_REQUESTS", "4"))
+OPENAI_RPM = int(os.environ.get("OPENAI_RPM", "0")) or None
+OPENAI_TPM = int(os.environ.get("OPENAI_TPM", "0")) or None
+MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "5"))
+TRANSLATION_MEMORY_PATH = os.environ.get("TRANSLATION_MEMORY_PATH", "")
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.environ.get("TRANSLATION_MEMORY_MAX_ENTRIES", "500000"))
+TRANSLATION_MEMORY_MAX_AGE = float(os.environ.get("TRANSLATION_MEMORY_MAX_AGE_DAYS", "365")) * 24 * 60 * 60
+BATCH_POLL_SECONDS = float(os.environ.get("BATCH_POLL_SECONDS", "60"))
+FUZZY_MATCHING = os.environ.get("FUZZY_MATCHING", "false").lower() in ("1", "true", "yes")
+FUZZY_MATCH_THRESHOLD = float(os.environ.get("FUZZY_MATCH_THRESHOLD", "0.75"))
+JOB_CHECKPOINT_PATH = os.environ.get("JOB_CHECKPOINT_PATH", "")
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['RESULT_FOLDER'] = 'results'
 
@@ -59,16 +93,35 @@ JOB_PROGRESS: dict[str, dict] = {}
 # Tokens consumed by the most recent translation job
 LAST_TOKENS_USED = 0
 
+# Texts of recently estimated uploads keyed by their SHA-256 digest
+ESTIMATE_CACHE_SIZE = 64
+_ESTIMATE_CACHE: OrderedDict[str, list[str]] = OrderedDict()
+_ESTIMATE_CACHE_LOCK = threading.Lock()
+
+# Translation jobs wait here until one of ``JOB_WORKERS`` slots is free
+JOB_SLOTS = JobSlots(JOB_WORKERS)
+
+# Translation memory shared by all jobs, opened on first use
+_TRANSLATION_MEMORY: TranslationMemory | None = None
+_TRANSLATION_MEMORY_LOCK = threading.Lock()
+_JOB_CHECKPOINT: JobCheckpoint | None = None
+_JOB_CHECKPOINT_LOCK = threading.Lock()
+# Request scheduler shared by all jobs, so the limits apply per API key
+_SCHEDULER: RequestScheduler | None = None
+_SCHEDULER_LOCK = threading.Lock()
+
 # Automatically remove old uploaded and result files
 MAX_FILE_AGE = 60 * 60  # seconds
 _CLEANUP_INTERVAL = 60 * 60
 
 
-def _cleanup_old_files(path: str) -> None:
-    """Remove files older than ``MAX_FILE_AGE`` from ``path``."""
+def _cleanup_old_files(path: str, keep: set[str] = frozenset()) -> None:
+    """Remove files older than ``MAX_FILE_AGE`` from ``path`` except ``keep``."""
 
     now = time.time()
     for name in os.listdir(path):
+        if name in keep:
+            continue
         file_path = os.path.join(path, name)
         try:
             mtime = os.path.getmtime(file_path)
@@ -82,25 +135,88 @@ def _cleanup_old_files(path: str) -> None:
                     os.remove(file_path)
 
 
+def _active_jobs() -> set[str]:
+    """Return the jobs that are queued or running in this process."""
+    return {job for job, info in list(JOB_PROGRESS.items()) if info.get('status') != 'finished'}
+
+
 def _cleanup_old_jobs() -> None:
-    """Remove stale entries from JOB_PROGRESS."""
+    """Remove stale entries of finished jobs from JOB_PROGRESS."""
     now = time.time()
-    stale = [job for job, info in JOB_PROGRESS.items() if now - info.get('timestamp', now) > MAX_FILE_AGE]
+    stale = [
+        job for job, info in list(JOB_PROGRESS.items())
+        if info.get('status') == 'finished' and now - info.get('timestamp', now) > MAX_FILE_AGE
+    ]
     for job in stale:
         JOB_PROGRESS.pop(job, None)
 
 
+def _cleanup() -> None:
+    """Purge old files, job metadata and expired memory entries once."""
+
+    # queued and running jobs may take far longer than MAX_FILE_AGE, e.g. in
+    # the Batch API, and workspaces of interrupted jobs are needed to resume them
+    keep = _active_jobs()
+    checkpoint = _get_job_checkpoint()
+    if checkpoint:
+        keep |= {job for job, _ in checkpoint.unfinished()}
+    _cleanup_old_files(app.config['UPLOAD_FOLDER'], keep)
+    _cleanup_old_files(app.config['RESULT_FOLDER'], keep)
+    _cleanup_old_jobs()
+    memory = _get_translation_memory()
+    if memory is not None:
+        memory.evict()
+
+
 def _cleanup_worker() -> None:
-    """Periodically purge old files and job metadata."""
+    """Periodically run :func:`_cleanup`."""
 
     while True:
-        _cleanup_old_files(app.config['UPLOAD_FOLDER'])
-        _cleanup_old_files(app.config['RESULT_FOLDER'])
-        _cleanup_old_jobs()
+        _cleanup()
         time.sleep(_CLEANUP_INTERVAL)
 
 
-threading.Thread(target=_cleanup_worker, daemon=True).start()
+def _get_translation_memory() -> TranslationMemory | None:
+    """Return the shared translation memory or ``None`` when disabled."""
+
+    global _TRANSLATION_MEMORY
+    if not TRANSLATION_MEMORY_PATH:
+        return None
+    with _TRANSLATION_MEMORY_LOCK:
+        if _TRANSLATION_MEMORY is None:
+            _TRANSLATION_MEMORY = TranslationMemory(
+                TRANSLATION_MEMORY_PATH,
+                max_entries=TRANSLATION_MEMORY_MAX_ENTRIES,
+                max_age=TRANSLATION_MEMORY_MAX_AGE,
+                fuzzy=FUZZY_MATCHING,
+            )
+    return _TRANSLATION_MEMORY
+
+
+def _get_job_checkpoint() -> JobCheckpoint | None:
+    """Return the shared job checkpoint or ``None`` when disabled."""
+
+    global _JOB_CHECKPOINT
+    if not JOB_CHECKPOINT_PATH:
+        return None
+    with _JOB_CHECKPOINT_LOCK:
+        if _JOB_CHECKPOINT is None:
+            _JOB_CHECKPOINT = JobCheckpoint(JOB_CHECKPOINT_PATH)
+    return _JOB_CHECKPOINT
+
+
+def _get_scheduler() -> RequestScheduler:
+    """Return the request scheduler shared by all jobs of this process."""
+
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = RequestScheduler(
+                MAX_CONCURRENT_REQUESTS,
+                default_limit=RateLimit(OPENAI_RPM, OPENAI_TPM),
+                max_retries=MAX_RETRIES,
+            )
+    return _SCHEDULER
 
 
 @app.template_filter('datetimeformat')
@@ -143,6 +259,15 @@ if pycountry:
     )
 
 
+def _output_language(filename: str, languages: list[str]) -> str | None:
+    """Return the language of a translated file named ``<name>-<lang>.idml``."""
+    stem = os.path.splitext(filename)[0]
+    for lang in languages:
+        if stem.endswith(f"-{lang}"):
+            return lang
+    return None
+
+
 def _run_translation_job(
     job_id: str,
     files: list[tuple[str, str]],
@@ -150,16 +275,89 @@ def _run_translation_job(
     source_lang: str,
     system_prompt: str | None,
     model: str,
+    glossary_path: str | None = None,
+    previous: tuple[str, dict[str, str]] | None = None,
+    batch_api: bool = False,
 ) -> None:
-    """Background worker that translates uploaded files."""
+    """Background worker that translates uploaded files.
+
+    ``previous`` holds the source and the translated outputs per language of
+    an earlier version; its unchanged stories and known segments are reused.
+    With ``batch_api`` the segments are translated through the OpenAI Batch
+    API, which is cheaper but may take up to a day.
+    """
     links: list[tuple[str, str, str]] = []  # (lang, url, filename)
-    total_steps = 0
-    for file_path, _ in files:
-        extract_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'unpacked_original')
-        extract_idml(file_path, extract_dir)
-        total_steps += len(find_story_files(extract_dir))
+    result_dir = os.path.join(app.config['RESULT_FOLDER'], job_id)
+    os.makedirs(result_dir, exist_ok=True)
+    previous_version = PreviousVersion(*previous) if previous else None
+    # Parse every story straight from the archives once; the templates give
+    # exact segment counts for progress reporting and are reused for writing.
+    # Stories unchanged since the previous version are neither parsed nor
+    # translated, they are copied from its outputs.
+    # One pool of story workers serves every document of the job.
+    documents = []
+    with story_pool(STORY_WORKERS) as pool:
+        for file_path, base_name in files:
+            unchanged = (
+                previous_version.unchanged(file_path, selected_languages)
+                if previous_version else set()
+            )
+            story_files = [m for m in find_story_members(file_path) if m not in unchanged]
+            templates = load_zipped_story_templates(
+                file_path, story_files, STREAM_STORY_BYTES, MERGE_PARAGRAPH_RUNS, pool=pool
+            )
+            documents.append((file_path, base_name, story_files, templates, sorted(unchanged)))
+
+    job_texts = [
+        text
+        for _, _, _, templates, _ in documents
+        for template in templates
+        for text in template.texts
+    ]
+    # index of the story every text comes from, used to keep stories together
+    job_stories = [
+        story
+        for story, template in enumerate(
+            template for _, _, _, templates, _ in documents for template in templates
+        )
+        for _ in template.texts
+    ] if GROUP_BATCHES_BY_STORY else None
+    # segments of changed stories whose old translation is known in every
+    # language are not sent again
+    reused = previous_version.translations(
+        list(dict.fromkeys(m for d in documents for m in d[2])),
+        selected_languages,
+        STREAM_STORY_BYTES,
+        MERGE_PARAGRAPH_RUNS,
+    ) if previous_version else {}
+    known = {
+        text for text in job_texts
+        if reused and all(text in reused[lang] for lang in selected_languages)
+    }
+    pending = [i for i, text in enumerate(job_texts) if text not in known]
+    pending_texts = [job_texts[i] for i in pending]
+    pending_stories = [job_stories[i] for i in pending] if job_stories else job_stories
+    total_segments = max(1, len(job_texts))
+    JOB_PROGRESS[job_id]["stories"] = sum(len(d[2]) + len(d[4]) for d in documents)
+    JOB_PROGRESS[job_id]["segments"] = len(job_texts)
+    JOB_PROGRESS[job_id]["unique_segments"] = len(set(job_texts))
+    JOB_PROGRESS[job_id]["estimated_tokens"] = estimate_total_tokens(
+        list(dict.fromkeys(pending_texts)), model, len(selected_languages)
+    )
+    if previous_version:
+        JOB_PROGRESS[job_id]["incremental"] = {
+            "stories_reused": sum(len(d[4]) for d in documents),
+            "segments_reused": len(job_texts) - len(pending_texts),
+        }
 
-    steps_done = 0
+    # 90 % of the progress bar covers translation and 10 % writing the files,
+    # both weighted by the number of segments rather than stories.
+    segments_written = 0
+    total_writes = total_segments * max(1, len(selected_languages))
+
+    def _report(translated: float) -> None:
+        pct = translated / total_segments * 90 + segments_written / total_writes * 10
+        JOB_PROGRESS[job_id]["progress"] = min(99, int(pct))
 
     global LAST_TOKENS_USED
     tokens_used = 0
@@ -168,28 +366,45 @@ def _run_translation_job(
         nonlocal tokens_used
         tokens_used += count
 
-    for file_path, base_name in files:
-        extract_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'unpacked_original')
-        extract_idml(file_path, extract_dir)
-
-        story_files = find_story_files(extract_dir)
-
-        all_contents = []
-        all_texts = []
-        for story_path in story_files:
-            tree = load_story_xml(story_path)
-            contents = extract_content_elements(tree)
-            all_contents.append((story_path, tree, contents))
-            for _, text, _ in contents:
-                all_texts.append(text)
-
-        def _progress(pct: int) -> None:
-            JOB_PROGRESS[job_id]["progress"] = int(pct * 0.9)
-
-        if USE_ASYNC:
+    def _progress(pct: int) -> None:
+        reused_segments = len(job_texts) - len(pending_texts)
+        _report(reused_segments + max(1, len(pending_texts)) * pct / 100)
+
+    memory = _get_translation_memory()
+    job_memory = memory.job() if memory else None
+    fuzzy = FuzzyMatcher(memory, FUZZY_MATCH_THRESHOLD) if memory and memory.fuzzy else None
+    prefilter = PassthroughFilter() if PREFILTER_SEGMENTS else None
+    sizer = BatchSizer(model, MAX_BATCH_TOKENS) if ADAPTIVE_BATCH_SIZE else None
+    history = HistoryPolicy(HISTORY_STRATEGY, pairs=HISTORY_PAIRS)
+    glossary = load_glossary(glossary_path, source_lang) if glossary_path else None
+    checkpoint = _get_job_checkpoint()
+    job_log = checkpoint.job(job_id) if checkpoint else None
+
+    # Segments of all files are translated together so text shared between
+    # the uploaded documents is only sent once per language.
+    try:
+        if batch_api:
+            translations_by_lang = batch_api_translate(
+                pending_texts,
+                selected_languages,
+                source_lang,
+                system_prompt,
+                progress_callback=_progress,
+                tokens_callback=_add_tokens,
+                max_tokens=MAX_BATCH_TOKENS,
+                model=model,
+                memory=job_memory,
+                prefilter=prefilter,
+                stories=pending_stories,
+                glossary=glossary,
+                checkpoint=job_log,
+                fuzzy=fuzzy,
+                poll_interval=BATCH_POLL_SECONDS,
+            )
+        elif USE_ASYNC:
             translations_by_lang = asyncio.run(
                 async_batch_translate(
-                    all_texts,
+                    pending_texts,
                     selected_languages,
                     source_lang,
                     system_prompt,
@@ -197,11 +412,22 @@ def _run_translation_job(
                     tokens_callback=_add_tokens,
                     max_tokens=MAX_BATCH_TOKENS,
                     model=model,
+                    memory=job_memory,
+                    scheduler=_get_scheduler(),
+                    multi_language=MULTI_LANGUAGE_REQUESTS,
+                    prefilter=prefilter,
+                    stories=pending_stories,
+                    sizer=sizer,
+                    history=history,
+                    glossary=glossary,
+                    checkpoint=job_log,
+                    fuzzy=fuzzy,
+                    stream=STREAM_RESPONSES,
                 )
             )
         else:
             translations_by_lang = batch_translate(
-                all_texts,
+                pending_texts,
                 selected_languages,
                 source_lang,
                 system_prompt,
@@ -209,41 +435,205 @@ def _run_translation_job(
                 tokens_callback=_add_tokens,
                 max_tokens=MAX_BATCH_TOKENS,
                 model=model,
+                memory=job_memory,
+                multi_language=MULTI_LANGUAGE_REQUESTS,
+                prefilter=prefilter,
+                stories=pending_stories,
+                sizer=sizer,
+                history=history,
+                glossary=glossary,
+                checkpoint=job_log,
+                fuzzy=fuzzy,
+                stream=STREAM_RESPONSES,
             )
+    except TranslationError as e:
+        JOB_PROGRESS[job_id]["error"] = str(e)
+        JOB_PROGRESS[job_id]["progress"] = 100
+        JOB_PROGRESS[job_id]["links"] = links
+        JOB_PROGRESS[job_id]["tokens"] = tokens_used
+        LAST_TOKENS_USED = tokens_used
+        return
+    finally:
+        if sizer:
+            JOB_PROGRESS[job_id]["batch_sizes"] = sizer.metrics()
+        JOB_PROGRESS[job_id]["history"] = history.metrics()
+        if fuzzy:
+            JOB_PROGRESS[job_id]["fuzzy"] = fuzzy.metrics()
+        if job_log and job_log.restored:
+            JOB_PROGRESS[job_id]["restored"] = job_log.restored
+        if glossary is not None:
+            JOB_PROGRESS[job_id]["glossary"] = {
+                "terms": len(glossary),
+                "injected": glossary.injected,
+            }
+
+    if reused:
+        fresh = {
+            lang: dict(zip(pending_texts, translations_by_lang[lang]))
+            for lang in selected_languages
+        }
+        translations_by_lang = {
+            lang: [reused[lang].get(t, fresh[lang].get(t, t)) for t in job_texts]
+            for lang in selected_languages
+        }
 
+    index = 0
+    for file_path, base_name, story_files, templates, unchanged in documents:
+        file_segments = sum(len(template.texts) for template in templates)
         for lang in selected_languages:
-            lang_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'unpacked_{lang}')
-            copy_unpacked_dir(extract_dir, lang_dir)
-
-            index = 0
-            for story_path, _, contents in all_contents:
-                rel_path = os.path.relpath(story_path, extract_dir)
-                new_story_path = os.path.join(lang_dir, rel_path)
-
-                tree = load_story_xml(new_story_path)
-                local_contents = extract_content_elements(tree)
-
-                translations = translations_by_lang[lang][index:index + len(local_contents)]
-                update_content_elements(local_contents, translations)
-                save_story_xml(tree, new_story_path)
-
-                index += len(local_contents)
+            replacements = {}
+            offset = index
+            for member, template in zip(story_files, templates):
+                count = len(template.texts)
+                translations = translations_by_lang[lang][offset:offset + count]
+                replacements[member] = template.render(translations)
+                offset += count
+            for member in unchanged:
+                replacements[member] = previous_version.member(lang, member)
 
             output_file = f"{base_name}-{lang}.idml"
-            output_path = os.path.join(app.config['RESULT_FOLDER'], output_file)
-            repackage_idml(lang_dir, output_path)
-            links.append((lang, f'/download/{output_file}', output_file))
-
-        steps_done += len(story_files)
-        JOB_PROGRESS[job_id]["progress"] = int((steps_done / max(1, total_steps)) * 100)
+            output_path = os.path.join(result_dir, output_file)
+            write_idml(file_path, output_path, replacements)
+            links.append((lang, f'/download/{job_id}/{output_file}', output_file))
+            segments_written += file_segments
+            _report(total_segments)
+        index += file_segments
 
     JOB_PROGRESS[job_id]["progress"] = 100
     JOB_PROGRESS[job_id]["links"] = links
     JOB_PROGRESS[job_id]["expires_at"] = JOB_PROGRESS[job_id]["timestamp"] + MAX_FILE_AGE
     JOB_PROGRESS[job_id]["tokens"] = tokens_used
+    if prefilter:
+        # every skipped segment saves its prompt and reply tokens per language
+        JOB_PROGRESS[job_id]["skipped"] = {
+            "segments": prefilter.skipped,
+            "tokens_saved": prefilter.tokens * 2 * len(selected_languages),
+            "rules": dict(prefilter.by_rule),
+        }
+    if job_memory:
+        JOB_PROGRESS[job_id]["memory"] = {
+            "hits": job_memory.hits,
+            "misses": job_memory.misses,
+        }
     LAST_TOKENS_USED = tokens_used
 
 
+def _start_job(
+    job_id: str,
+    workspace: JobWorkspace,
+    files: list[tuple[str, str]],
+    selected_languages: list[str],
+    source_lang: str,
+    system_prompt: str | None,
+    model: str,
+    glossary_path: str | None = None,
+    previous: tuple[str, dict[str, str]] | None = None,
+    batch_api: bool = False,
+) -> None:
+    """Run a queued job in its own workspace once a job slot is free.
+
+    With ``JOB_CHECKPOINT_PATH`` set the job is recorded until it finishes,
+    so :func:`_resume_jobs` can start it again after a restart.  Batch API
+    jobs start at once, outside the job slots.
+    """
+    checkpoint = _get_job_checkpoint()
+    if checkpoint:
+        checkpoint.start(job_id, {
+            "files": files,
+            "languages": selected_languages,
+            "source_lang": source_lang,
+            "system_prompt": system_prompt,
+            "model": model,
+            "glossary_path": glossary_path,
+            "previous": previous,
+            "batch_api": batch_api,
+        })
+
+    def _mark_running() -> None:
+        JOB_PROGRESS[job_id]["status"] = "running"
+        if checkpoint:
+            checkpoint.set_status(job_id, "running")
+
+    args = (
+        job_id,
+        files,
+        selected_languages,
+        source_lang,
+        system_prompt,
+        model,
+        glossary_path,
+        previous,
+        batch_api,
+    )
+    try:
+        if batch_api:
+            # a Batch API job mostly waits up to a day for OpenAI, so it does
+            # not hold one of the JOB_WORKERS slots meanwhile
+            _mark_running()
+            _run_translation_job(*args)
+        else:
+            JOB_SLOTS.run(_run_translation_job, *args, on_start=_mark_running)
+    except Exception as e:  # pragma: no cover - unexpected failures
+        print(f"❌ Chyba při překladu: {e}")
+        JOB_PROGRESS[job_id]["error"] = str(e)
+        JOB_PROGRESS[job_id]["progress"] = 100
+        JOB_PROGRESS[job_id].setdefault("links", [])
+    finally:
+        JOB_PROGRESS[job_id]["status"] = "finished"
+        workspace.cleanup()
+        if checkpoint:
+            checkpoint.finish(job_id)
+
+
+def _resume_jobs() -> list[str]:
+    """Start again every job left unfinished by a previous process.
+
+    Segments translated before the restart are read back from the checkpoint,
+    so only the rest is sent to the model.  Jobs whose uploads are gone are
+    dropped.  Returns the ids of the resumed jobs.
+    """
+    checkpoint = _get_job_checkpoint()
+    if not checkpoint:
+        return []
+    resumed = []
+    for job_id, params in checkpoint.unfinished():
+        files = [tuple(entry) for entry in params["files"]]
+        previous = params.get("previous")
+        paths = [path for path, _ in files] + [p for p in [params.get("glossary_path")] if p]
+        if previous:
+            previous = (previous[0], previous[1])
+            paths += [previous[0], *previous[1].values()]
+        if not all(os.path.exists(path) for path in paths):
+            checkpoint.finish(job_id)
+            continue
+        JOB_PROGRESS[job_id] = {
+            "timestamp": time.time(),
+            "progress": 0,
+            "prompt": params["system_prompt"] or DEFAULT_PROMPT,
+            "status": "queued",
+            "resumed": True,
+        }
+        workspace = JobWorkspace(app.config['UPLOAD_FOLDER'], job_id)
+        threading.Thread(
+            target=_start_job,
+            args=(
+                job_id,
+                workspace,
+                files,
+                params["languages"],
+                params["source_lang"],
+                params["system_prompt"],
+                params["model"],
+                params.get("glossary_path"),
+                previous,
+                params.get("batch_api", False),
+            ),
+            daemon=True,
+        ).start()
+        resumed.append(job_id)
+    return resumed
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     error = None
@@ -273,27 +663,65 @@ def index():
         source_lang = request.form.get('source_lang')
         system_prompt = request.form.get('prompt', '').strip() or None
         selected_model = request.form.get('model', DEFAULT_MODEL)
+        batch_api = request.form.get('batch_api') == 'on'
+        glossary_file = request.files.get('glossary')
+        glossary_ext = os.path.splitext(glossary_file.filename)[1].lower() if glossary_file and glossary_file.filename else None
 
         if not uploaded_files or any(not f.filename.endswith('.idml') for f in uploaded_files):
             return render_template('index.html', error="❌ Prosím nahraj platný .idml soubor.", selected_model=selected_model)
 
+        if glossary_ext and glossary_ext not in GLOSSARY_EXTENSIONS:
+            return render_template('index.html', error="❌ Glosář musí být soubor .csv nebo .tbx.", selected_model=selected_model)
+
+        previous_source = request.files.get('previous_source')
+        previous_results = [f for f in request.files.getlist('previous_results') if f.filename]
+        if any(not f.filename.endswith('.idml') for f in previous_results) or (
+            previous_source and previous_source.filename and not previous_source.filename.endswith('.idml')
+        ):
+            return render_template('index.html', error="❌ Předchozí verze musí být soubory .idml.", selected_model=selected_model)
+
         if source_lang in selected_languages:
             selected_languages.remove(source_lang)
 
         job_id = str(uuid.uuid4())
-        JOB_PROGRESS[job_id] = {"timestamp": time.time(), "progress": 0, "prompt": system_prompt or DEFAULT_PROMPT}
+        JOB_PROGRESS[job_id] = {
+            "timestamp": time.time(),
+            "progress": 0,
+            "prompt": system_prompt or DEFAULT_PROMPT,
+            "status": "queued",
+            "batch_api": batch_api,
+        }
 
+        workspace = JobWorkspace(app.config['UPLOAD_FOLDER'], job_id)
         file_info = []
-        for uploaded_file in uploaded_files:
+        for index, uploaded_file in enumerate(uploaded_files):
             filename = secure_filename(uploaded_file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            # prefix keeps files with the same name in one upload apart
+            file_path = workspace.file(f"{index}-{filename}")
             uploaded_file.save(file_path)
             base_name = os.path.splitext(filename)[0]
             file_info.append((file_path, base_name))
 
+        glossary_path = None
+        if glossary_ext:
+            glossary_path = workspace.file(f"glossary{glossary_ext}")
+            glossary_file.save(glossary_path)
+
+        previous = None
+        if previous_source and previous_source.filename:
+            outputs = {}
+            for result in previous_results:
+                lang = _output_language(secure_filename(result.filename), selected_languages)
+                if lang and lang not in outputs:
+                    outputs[lang] = workspace.file(f"previous-{lang}.idml")
+                    result.save(outputs[lang])
+            if outputs:
+                previous = (workspace.file("previous-source.idml"), outputs)
+                previous_source.save(previous[0])
+
         thread = threading.Thread(
-            target=_run_translation_job,
-            args=(job_id, file_info, selected_languages, source_lang, system_prompt, selected_model),
+            target=_start_job,
+            args=(job_id, workspace, file_info, selected_languages, source_lang, system_prompt, selected_model, glossary_path, previous, batch_api),
             daemon=True,
         )
         thread.start()
@@ -329,9 +757,10 @@ def index():
     )
 
 
-@app.route('/download/<filename>')
-def download_file(filename):
-    return send_from_directory(app.config['RESULT_FOLDER'], filename, as_attachment=True)
+@app.route('/download/<job_id>/<filename>')
+def download_file(job_id, filename):
+    job_dir = os.path.join(app.config['RESULT_FOLDER'], secure_filename(job_id))
+    return send_from_directory(job_dir, filename, as_attachment=True)
 
 
 @app.route('/estimate', methods=['POST'])
@@ -345,18 +774,11 @@ def estimate():
         return jsonify({'error': 'invalid file'}), 400
 
     texts: list[str] = []
-    with tempfile.TemporaryDirectory() as tmpdir:
-        for uploaded_file in uploaded_files:
-            fname = secure_filename(uploaded_file.filename)
-            idml_path = os.path.join(tmpdir, fname)
-            uploaded_file.save(idml_path)
-            extract_dir = os.path.join(tmpdir, 'extract')
-            extract_idml(idml_path, extract_dir)
-            for story_path in find_story_files(extract_dir):
-                tree = load_story_xml(story_path)
-                contents = extract_content_elements(tree)
-                for _, txt, _ in contents:
-                    texts.append(txt)
+    for uploaded_file in uploaded_files:
+        try:
+            texts.extend(_upload_texts(uploaded_file.stream))
+        except zipfile.BadZipFile:
+            return jsonify({'error': 'invalid file'}), 400
 
     texts = list(dict.fromkeys(texts))
     tokens = estimate_total_tokens(texts, model, len(selected_languages))
@@ -364,6 +786,26 @@ def estimate():
     return jsonify({'tokens': tokens, 'cost': round(cost, 4)})
 
 
+def _upload_texts(stream) -> list[str]:
+    """Return the translatable texts of an uploaded IDML, cached by content."""
+
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    key = digest.hexdigest()
+    with _ESTIMATE_CACHE_LOCK:
+        if key in _ESTIMATE_CACHE:
+            _ESTIMATE_CACHE.move_to_end(key)
+            return _ESTIMATE_CACHE[key]
+    stream.seek(0)
+    texts = list(dict.fromkeys(collect_idml_texts(stream)))
+    with _ESTIMATE_CACHE_LOCK:
+        _ESTIMATE_CACHE[key] = texts
+        while len(_ESTIMATE_CACHE) > ESTIMATE_CACHE_SIZE:
+            _ESTIMATE_CACHE.popitem(last=False)
+    return texts
+
+
 @app.route('/credit')
 def credit():
     """Return remaining credit for the configured API key."""
@@ -388,7 +830,14 @@ def progress(job_id: str):
     info = JOB_PROGRESS.get(job_id)
     if not info:
         return jsonify({'progress': 100, 'links': []})
-    return jsonify({'progress': info.get('progress', 0), 'links': info.get('links'), 'expires_at': info.get('expires_at')})
+    return jsonify({
+        'progress': info.get('progress', 0),
+        'links': info.get('links'),
+        'expires_at': info.get('expires_at'),
+        'error': info.get('error'),
+        'status': info.get('status'),
+        'skipped': info.get('skipped'),
+    })
 
 
 @app.route('/translations')
@@ -411,13 +860,17 @@ def translations():
 def remove_job(job_id: str):
     """Delete result files associated with a finished job."""
     info = JOB_PROGRESS.pop(job_id, None)
-    if info and info.get('links'):
-        for _, _, fname in info['links']:
-            path = os.path.join(app.config['RESULT_FOLDER'], fname)
-            with contextlib.suppress(FileNotFoundError):
-                os.remove(path)
+    if info:
+        job_dir = os.path.join(app.config['RESULT_FOLDER'], secure_filename(job_id))
+        shutil.rmtree(job_dir, ignore_errors=True)
     return redirect(url_for('index'))
 
 
+threading.Thread(target=_cleanup_worker, daemon=True).start()
+
+
 if __name__ == '__main__':
+    # resumed only by the serving process, never on a plain import, so
+    # several importing processes do not run the same jobs
+    _resume_jobs()
     app.run(host='0.0.0.0', port=5000)
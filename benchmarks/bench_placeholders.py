@@ -0,0 +1,86 @@
+"""Microbenchmark of the per-Content placeholder round trip.
+
+Measures the path used to write translated stories: ``_safe_inner_xml`` for
+every slot of a :class:`StoryTemplate` and ``StoryTemplate.render`` for a
+whole story.  The previous implementation (a ``findall`` over the text to
+check the placeholders, then escaping and a ``str.replace`` per tag) is
+compared with the current single split.  Run with::
+
+    python benchmarks/bench_placeholders.py
+"""
+
+from __future__ import annotations
+
+import html
+import os
+import sys
+import timeit
+
+from lxml import etree
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from translator import text_extractor  # noqa: E402
+from translator.text_extractor import (  # noqa: E402
+    PLACEHOLDER_PATTERN,
+    StoryTemplate,
+    _safe_inner_xml,
+)
+
+
+def _old_safe_inner_xml(text: str, tags: list[str]) -> str:
+    found = [int(m) for m in PLACEHOLDER_PATTERN.findall(text)]
+    if found == list(range(1, len(tags) + 1)):
+        text = html.escape(text, quote=False)
+        for i, tag in enumerate(tags, 1):
+            text = text.replace(f"[[TAG{i}]]", tag)
+        return text
+    return html.escape(PLACEHOLDER_PATTERN.sub("", text), quote=False) + "".join(tags)
+
+
+def _story(elements: int, tags_per_element: int) -> etree._ElementTree:
+    inner = "".join(
+        f"word {i} <b>bold {i}</b><Br/>" for i in range(tags_per_element // 3)
+    ) or "plain text"
+    body = "".join(f"<Content>{inner}tail</Content>" for _ in range(elements))
+    return etree.ElementTree(etree.fromstring(f"<Root>{body}</Root>"))
+
+
+def bench(elements: int = 2000, tags_per_element: int = 3, repeat: int = 15) -> None:
+    template = StoryTemplate.from_tree(_story(elements, tags_per_element))
+    translations = [text.upper() for text in template.texts]
+    slots = list(zip(translations, (tags for _, tags in template.segments)))
+
+    def old_slots() -> None:
+        for text, tags in slots:
+            _old_safe_inner_xml(text, tags)
+
+    def new_slots() -> None:
+        for text, tags in slots:
+            _safe_inner_xml(text, tags)
+
+    def old_render() -> None:
+        text_extractor._safe_inner_xml = _old_safe_inner_xml
+        try:
+            template.render(translations)
+        finally:
+            text_extractor._safe_inner_xml = _safe_inner_xml
+
+    def new_render() -> None:
+        template.render(translations)
+
+    print(f"{elements} Content elements, {len(template.segments[0][1])} tags each")
+    for name, func in (
+        ("inner XML, before", old_slots),
+        ("inner XML, after", new_slots),
+        ("render story, before", old_render),
+        ("render story, after", new_render),
+    ):
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print(f"  {name:<24} {best / elements * 1e6:8.2f} µs/element")
+
+
+if __name__ == "__main__":
+    # plain Content is by far the most common case in IDML stories
+    for tag_count in (0, 3, 30):
+        bench(tags_per_element=tag_count)
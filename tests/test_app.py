@@ -4,10 +4,12 @@ import io
 import zipfile
 import threading
 import time
+from lxml import etree
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from translator import token_estimator  # noqa: E402
+from translator.text_extractor import StoryTemplate  # noqa: E402
 os.environ.setdefault("OPENAI_API_KEY", "test")
 import app as app_module  # noqa: E402
 from app import app, JOB_PROGRESS, _cleanup_old_jobs, MAX_FILE_AGE  # noqa: E402
@@ -25,8 +27,8 @@ def test_index_non_idml_file_shows_error_message():
 
 def test_cleanup_old_jobs_removes_stale_entries():
     JOB_PROGRESS.clear()
-    JOB_PROGRESS['old'] = {'timestamp': time.time() - (MAX_FILE_AGE + 1), 'progress': 0}
-    JOB_PROGRESS['new'] = {'timestamp': time.time(), 'progress': 0}
+    JOB_PROGRESS['old'] = {'timestamp': time.time() - (MAX_FILE_AGE + 1), 'progress': 0, 'status': 'finished'}
+    JOB_PROGRESS['new'] = {'timestamp': time.time(), 'progress': 0, 'status': 'finished'}
 
     _cleanup_old_jobs()
 
@@ -34,6 +36,28 @@ def test_cleanup_old_jobs_removes_stale_entries():
     assert 'new' in JOB_PROGRESS
 
 
+def test_cleanup_keeps_running_jobs(monkeypatch, tmp_path):
+    uploads = tmp_path / 'uploads'
+    results = tmp_path / 'results'
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(uploads))
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(results))
+    monkeypatch.setattr(app_module, 'JOB_CHECKPOINT_PATH', '')
+    monkeypatch.setattr(app_module, 'TRANSLATION_MEMORY_PATH', '')
+    old = time.time() - (MAX_FILE_AGE + 1)
+    JOB_PROGRESS.clear()
+    for job, status in (('waiting', 'queued'), ('batch', 'running'), ('done', 'finished')):
+        JOB_PROGRESS[job] = {'timestamp': old, 'progress': 0, 'status': status}
+        for folder in (uploads, results):
+            (folder / job).mkdir(parents=True)
+            os.utime(folder / job, (old, old))
+
+    app_module._cleanup()
+
+    assert sorted(JOB_PROGRESS) == ['batch', 'waiting']
+    for folder in (uploads, results):
+        assert sorted(os.listdir(folder)) == ['batch', 'waiting']
+
+
 def test_index_template_has_autoscroll_script():
     path = os.path.join('templates', 'index.html')
     with open(path, encoding='utf-8') as f:
@@ -74,7 +98,7 @@ def _create_idml_duplicate(path: str) -> None:
 def test_index_passes_selected_model(monkeypatch, tmp_path):
     called = {}
 
-    def fake_run(job_id, files, langs, src, prompt, model):
+    def fake_run(job_id, files, langs, src, prompt, model, glossary_path=None, previous=None, batch_api=False):
         called['model'] = model
 
     class DummyThread:
@@ -157,23 +181,20 @@ def test_tokens_route_returns_last_value(monkeypatch):
 def test_run_translation_job_async(monkeypatch, tmp_path):
     called = {}
 
-    async def fake_async(texts, langs, src, prompt, progress_callback=None, tokens_callback=None, max_tokens=800, delay=None, model='gpt-4o'):
+    async def fake_async(texts, langs, src, prompt, progress_callback=None, tokens_callback=None, max_tokens=800, delay=None, model='gpt-4o', **kwargs):
         called['async'] = True
         called['max'] = max_tokens
+        called['stories'] = kwargs.get('stories')
         return {lang: ['x'] * len(texts) for lang in langs}
 
     def fake_batch(*args, **kwargs):
         called['batch'] = True
         return {lang: ['x'] * len(args[0]) for lang in args[1]}
 
-    monkeypatch.setattr(app_module, 'extract_idml', lambda src, dst: None)
-    monkeypatch.setattr(app_module, 'find_story_files', lambda d: [tmp_path / 's.xml'])
-    monkeypatch.setattr(app_module, 'load_story_xml', lambda p: None)
-    monkeypatch.setattr(app_module, 'extract_content_elements', lambda tree: [(None, 't', [])])
-    monkeypatch.setattr(app_module, 'update_content_elements', lambda c, t: None)
-    monkeypatch.setattr(app_module, 'save_story_xml', lambda tree, p: None)
-    monkeypatch.setattr(app_module, 'copy_unpacked_dir', lambda s, d: None)
-    monkeypatch.setattr(app_module, 'repackage_idml', lambda s, d: None)
+    monkeypatch.setattr(app_module, 'find_story_members', lambda p: ['Stories/s.xml', 'Stories/t.xml'])
+    monkeypatch.setattr(app_module, 'load_zipped_story_templates', lambda p, members, t, merge, pool: [StoryTemplate(['', ''], [('t', [])]) for _ in members])
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    monkeypatch.setattr(app_module, 'write_idml', lambda s, d, r=None: None)
     monkeypatch.setattr(app_module, 'async_batch_translate', fake_async)
     monkeypatch.setattr(app_module, 'batch_translate', fake_batch)
 
@@ -181,6 +202,8 @@ def test_run_translation_job_async(monkeypatch, tmp_path):
     monkeypatch.setenv('MAX_BATCH_TOKENS', '50')
     app_module.USE_ASYNC = True
     app_module.MAX_BATCH_TOKENS = 50
+    monkeypatch.setattr(app_module, 'GROUP_BATCHES_BY_STORY', True)
+    monkeypatch.setattr(app_module, 'ADAPTIVE_BATCH_SIZE', True)
 
     job_id = 'j'
     JOB_PROGRESS[job_id] = {'timestamp': time.time(), 'progress': 0}
@@ -188,4 +211,536 @@ def test_run_translation_job_async(monkeypatch, tmp_path):
 
     assert called.get('async') is True
     assert called.get('max') == 50
+    assert called.get('stories') == [0, 1]
+    # the batch size starts from MAX_BATCH_TOKENS within the model's bounds
+    assert JOB_PROGRESS[job_id]['batch_sizes']['initial'] == 100
+    assert JOB_PROGRESS[job_id]['history']['strategy'] == 'full'
     assert 'batch' not in called
+
+
+def test_run_translation_job_writes_translated_idml(monkeypatch, tmp_path):
+    def fake_batch(texts, langs, *args, **kwargs):
+        return {lang: [f'{t}-{lang}' for t in texts] for lang in langs}
+
+    monkeypatch.setattr(app_module, 'batch_translate', fake_batch)
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    app_module.USE_ASYNC = False
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+
+    idml_path = tmp_path / 'book.idml'
+    with zipfile.ZipFile(idml_path, 'w') as zf:
+        zf.writestr('mimetype', 'application/vnd.adobe.indesign-idml-package')
+        zf.writestr('Stories/Story_1.xml', '<Root><Content>Hello</Content></Root>')
+        zf.writestr('Stories/Story_2.xml', '<Root><Content>World</Content></Root>')
+        zf.writestr('designmap.xml', '<Document/>')
+
+    job_id = 'real'
+    JOB_PROGRESS[job_id] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job(job_id, [(str(idml_path), 'book')], ['cs', 'de'], 'en', None, 'gpt-4o')
+
+    info = JOB_PROGRESS[job_id]
+    assert info['progress'] == 100
+    assert [link[2] for link in info['links']] == ['book-cs.idml', 'book-de.idml']
+    assert info['links'][1][1] == '/download/real/book-de.idml'
+    with zipfile.ZipFile(tmp_path / 'real' / 'book-de.idml') as zf:
+        assert zf.namelist()[0] == 'mimetype'
+        assert b'<Content>World-de</Content>' in zf.read('Stories/Story_2.xml')
+        assert zf.read('designmap.xml') == b'<Document/>'
+
+
+def test_index_uses_isolated_workspace_per_job(monkeypatch, tmp_path):
+    seen = []
+
+    def fake_run(job_id, files, langs, src, prompt, model, glossary_path=None, previous=None, batch_api=False):
+        for path, base in files:
+            assert os.path.dirname(path) == os.path.join(str(tmp_path), job_id)
+            assert os.path.exists(path)
+            seen.append((job_id, base))
+
+    class DummyThread:
+        def __init__(self, target, args=(), daemon=None):
+            self.target = target
+            self.args = args
+
+        def start(self):
+            self.target(*self.args)
+
+    monkeypatch.setattr(app_module, '_run_translation_job', fake_run)
+    monkeypatch.setattr(threading, 'Thread', DummyThread)
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+
+    idml_path = tmp_path / 't.idml'
+    _create_idml(idml_path)
+    client = app.test_client()
+    for _ in range(2):
+        data = {
+            'idml_files': [(open(idml_path, 'rb'), 't.idml')],
+            'languages': 'cs',
+            'source_lang': 'en',
+        }
+        client.post('/', data=data, content_type='multipart/form-data')
+
+    assert len({job for job, _ in seen}) == 2
+    assert [base for _, base in seen] == ['t', 't']
+    for job, _ in seen:
+        # workspaces are removed once the job has finished
+        assert not os.path.exists(tmp_path / job)
+        assert JOB_PROGRESS[job]['status'] == 'finished'
+
+
+def test_remove_job_deletes_result_directory(monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+    (tmp_path / 'job1').mkdir()
+    (tmp_path / 'job1' / 'f-cs.idml').write_text('x')
+    JOB_PROGRESS['job1'] = {'progress': 100, 'timestamp': time.time(), 'links': []}
+    client = app.test_client()
+    client.post('/remove/job1')
+    assert not (tmp_path / 'job1').exists()
+    assert 'job1' not in JOB_PROGRESS
+
+
+def test_run_translation_job_weights_progress_by_segments(monkeypatch, tmp_path):
+    seen = []
+
+    def fake_batch(texts, langs, *args, progress_callback=None, **kwargs):
+        for pct in (25, 100):
+            progress_callback(pct)
+            seen.append(JOB_PROGRESS[job_id]['progress'])
+        return {lang: texts for lang in langs}
+
+    def fake_write(src, dst, replacements):
+        seen.append(JOB_PROGRESS[job_id]['progress'])
+
+    monkeypatch.setattr(app_module, 'write_idml', fake_write)
+
+    monkeypatch.setattr(app_module, 'batch_translate', fake_batch)
+    monkeypatch.setattr(app_module, 'estimate_total_tokens', lambda texts, model, languages: 42)
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    app_module.USE_ASYNC = False
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+
+    small = tmp_path / 'small.idml'
+    big = tmp_path / 'big.idml'
+    with zipfile.ZipFile(small, 'w') as zf:
+        zf.writestr('Stories/Story_1.xml', '<Root><Content>a</Content></Root>')
+    with zipfile.ZipFile(big, 'w') as zf:
+        zf.writestr('Stories/Story_1.xml', '<Root>' + '<Content>b</Content>' * 3 + '</Root>')
+
+    job_id = 'weighted'
+    JOB_PROGRESS[job_id] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job(
+        job_id, [(str(small), 'small'), (str(big), 'big')], ['cs'], 'en', None, 'gpt-4o'
+    )
+
+    # writing the small file (a quarter of all segments) adds 2.5 %
+    assert seen == [22, 90, 90, 92]
+    info = JOB_PROGRESS[job_id]
+    assert info['stories'] == 2
+    assert info['segments'] == 4
+    assert info['estimated_tokens'] == 42
+    assert info['progress'] == 100
+
+
+def test_run_translation_job_deduplicates_across_files(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_batch(texts, langs, *args, **kwargs):
+        calls.append(list(texts))
+        return {lang: [f'{t}-{lang}' for t in texts] for lang in langs}
+
+    monkeypatch.setattr(app_module, 'batch_translate', fake_batch)
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    app_module.USE_ASYNC = False
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+
+    first = tmp_path / 'first.idml'
+    second = tmp_path / 'second.idml'
+    with zipfile.ZipFile(first, 'w') as zf:
+        zf.writestr('Stories/Story_1.xml', '<Root><Content>Legal</Content><Content>One</Content></Root>')
+    with zipfile.ZipFile(second, 'w') as zf:
+        zf.writestr('Stories/Story_1.xml', '<Root><Content>Two</Content><Content>Legal</Content></Root>')
+
+    job_id = 'dedup'
+    JOB_PROGRESS[job_id] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job(
+        job_id, [(str(first), 'first'), (str(second), 'second')], ['cs'], 'en', None, 'gpt-4o'
+    )
+
+    assert len(calls) == 1
+    assert JOB_PROGRESS[job_id]['unique_segments'] == 3
+    with zipfile.ZipFile(tmp_path / job_id / 'second-cs.idml') as zf:
+        story = zf.read('Stories/Story_1.xml')
+    assert story.index(b'<Content>Two-cs</Content>') < story.index(b'<Content>Legal-cs</Content>')
+
+
+def test_estimate_caches_texts_by_upload_content(monkeypatch, tmp_path):
+    calls = []
+    real_collect = app_module.collect_idml_texts
+
+    def counting_collect(stream):
+        calls.append(1)
+        return real_collect(stream)
+
+    monkeypatch.setattr(app_module, 'collect_idml_texts', counting_collect)
+    monkeypatch.setattr(app_module, 'estimate_total_tokens', lambda texts, model, languages: len(texts))
+    app_module._ESTIMATE_CACHE.clear()
+
+    idml_path = tmp_path / 'cache.idml'
+    _create_idml(idml_path)
+    client = app.test_client()
+    for _ in range(2):
+        data = {
+            'idml_files': [(open(idml_path, 'rb'), 'cache.idml')],
+            'languages': ['cs'],
+            'model': 'gpt-4o',
+        }
+        resp = client.post('/estimate', data=data, content_type='multipart/form-data')
+        assert resp.get_json()['tokens'] == 1
+    assert len(calls) == 1
+
+
+def test_estimate_rejects_broken_archive():
+    client = app.test_client()
+    data = {'idml_files': [(io.BytesIO(b'not a zip'), 'bad.idml')], 'languages': ['cs']}
+    resp = client.post('/estimate', data=data, content_type='multipart/form-data')
+    assert resp.status_code == 400
+
+
+def test_run_translation_job_streams_large_stories(monkeypatch, tmp_path):
+    def fake_batch(texts, langs, *args, **kwargs):
+        return {lang: [f'{t}-{lang}' for t in texts] for lang in langs}
+
+    monkeypatch.setattr(app_module, 'batch_translate', fake_batch)
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    monkeypatch.setattr(app_module, 'STREAM_STORY_BYTES', 0)
+    app_module.USE_ASYNC = False
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+
+    idml_path = tmp_path / 'huge.idml'
+    with zipfile.ZipFile(idml_path, 'w') as zf:
+        zf.writestr('mimetype', 'application/vnd.adobe.indesign-idml-package')
+        zf.writestr('Stories/Story_1.xml', '<Root><Content>Hello</Content><Content>World</Content></Root>')
+
+    job_id = 'stream'
+    JOB_PROGRESS[job_id] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job(job_id, [(str(idml_path), 'huge')], ['cs'], 'en', None, 'gpt-4o')
+
+    with zipfile.ZipFile(tmp_path / job_id / 'huge-cs.idml') as zf:
+        assert zf.read('Stories/Story_1.xml') == b'<Root><Content>Hello-cs</Content><Content>World-cs</Content></Root>'
+
+
+def test_run_translation_job_reports_skipped_segments(monkeypatch, tmp_path):
+    def fake_batch(texts, langs, *args, prefilter=None, **kwargs):
+        skipped = prefilter.apply(texts, 'gpt-4o')
+        return {lang: [t if t in skipped else f'{t}-{lang}' for t in texts] for lang in langs}
+
+    from translator import prefilter as prefilter_module
+
+    monkeypatch.setattr(prefilter_module, 'count_tokens', lambda texts, model: 3 * len(texts))
+    monkeypatch.setattr(app_module, 'batch_translate', fake_batch)
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    monkeypatch.setattr(app_module, 'PREFILTER_SEGMENTS', True)
+    monkeypatch.setattr(app_module, 'write_idml', lambda *args: None)
+    app_module.USE_ASYNC = False
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+
+    idml_path = tmp_path / 'book.idml'
+    with zipfile.ZipFile(idml_path, 'w') as zf:
+        zf.writestr('Stories/Story_1.xml', '<Root><Content>Hello</Content><Content>42</Content></Root>')
+
+    job_id = 'skip'
+    JOB_PROGRESS[job_id] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job(job_id, [(str(idml_path), 'book')], ['cs', 'de'], 'en', None, 'gpt-4o')
+
+    skipped = JOB_PROGRESS[job_id]['skipped']
+    assert skipped['segments'] == 1
+    assert skipped['rules'] == {'number': 1}
+    assert skipped['tokens_saved'] == 3 * 2 * 2
+    with app.test_client() as client:
+        assert client.get(f'/progress/{job_id}').get_json()['skipped'] == skipped
+
+
+def test_run_translation_job_merges_paragraph_runs(monkeypatch, tmp_path):
+    sent = []
+
+    def fake_batch(texts, langs, *args, **kwargs):
+        sent.extend(texts)
+        return {lang: [t.upper() for t in texts] for lang in langs}
+
+    monkeypatch.setattr(app_module, 'batch_translate', fake_batch)
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    monkeypatch.setattr(app_module, 'MERGE_PARAGRAPH_RUNS', True)
+    app_module.USE_ASYNC = False
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+
+    idml_path = tmp_path / 'styled.idml'
+    with zipfile.ZipFile(idml_path, 'w') as zf:
+        zf.writestr('mimetype', 'application/vnd.adobe.indesign-idml-package')
+        zf.writestr(
+            'Stories/Story_1.xml',
+            '<Story><ParagraphStyleRange><Content>the </Content><Content>new</Content>'
+            '</ParagraphStyleRange></Story>',
+        )
+
+    job_id = 'merge'
+    JOB_PROGRESS[job_id] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job(job_id, [(str(idml_path), 'styled')], ['cs'], 'en', None, 'gpt-4o')
+
+    assert sent == ['the [[RUN1]]new']
+    assert JOB_PROGRESS[job_id]['segments'] == 1
+    with zipfile.ZipFile(tmp_path / job_id / 'styled-cs.idml') as zf:
+        story = etree.fromstring(zf.read('Stories/Story_1.xml'))
+    assert [el.text for el in story.iter('Content')] == ['THE ', 'NEW']
+
+
+def test_index_saves_uploaded_glossary(monkeypatch, tmp_path):
+    seen = {}
+
+    def fake_run(job_id, files, langs, src, prompt, model, glossary_path=None, previous=None, batch_api=False):
+        seen['path'] = glossary_path
+        with open(glossary_path, encoding='utf-8') as fh:
+            seen['content'] = fh.read()
+
+    class DummyThread:
+        def __init__(self, target, args=(), daemon=None):
+            self.target = target
+            self.args = args
+
+        def start(self):
+            self.target(*self.args)
+
+    monkeypatch.setattr(app_module, '_run_translation_job', fake_run)
+    monkeypatch.setattr(threading, 'Thread', DummyThread)
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+
+    idml_path = tmp_path / 't.idml'
+    _create_idml(idml_path)
+    client = app.test_client()
+    data = {
+        'idml_files': [(open(idml_path, 'rb'), 't.idml')],
+        'glossary': (io.BytesIO(b'Hello,Ahoj\n'), 'terms.CSV'),
+        'languages': 'cs',
+        'source_lang': 'en',
+    }
+    client.post('/', data=data, content_type='multipart/form-data')
+    assert seen['path'].endswith('glossary.csv')
+    assert seen['content'] == 'Hello,Ahoj\n'
+
+    data = {
+        'idml_files': [(open(idml_path, 'rb'), 't.idml')],
+        'glossary': (io.BytesIO(b'x'), 'terms.xlsx'),
+        'languages': 'cs',
+        'source_lang': 'en',
+    }
+    resp = client.post('/', data=data, content_type='multipart/form-data')
+    assert 'Glosář musí být soubor .csv nebo .tbx' in resp.get_data(as_text=True)
+
+
+def test_run_translation_job_passes_glossary(monkeypatch, tmp_path):
+    used = {}
+
+    def fake_batch(texts, langs, *args, glossary=None, **kwargs):
+        used['terms'] = glossary.terms(texts, langs)
+        return {lang: list(texts) for lang in langs}
+
+    monkeypatch.setattr(app_module, 'batch_translate', fake_batch)
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    monkeypatch.setattr(app_module, 'write_idml', lambda *args: None)
+    app_module.USE_ASYNC = False
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+
+    idml_path = tmp_path / 't.idml'
+    _create_idml(idml_path)
+    glossary_path = tmp_path / 'glossary.csv'
+    glossary_path.write_text('en,cs\nHello,Ahoj\nBye,Nashle\n', encoding='utf-8')
+
+    job_id = 'glossary'
+    JOB_PROGRESS[job_id] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job(
+        job_id, [(str(idml_path), 't')], ['cs'], 'en', None, 'gpt-4o', str(glossary_path)
+    )
+
+    assert used['terms'] == [('Hello', {'cs': 'Ahoj'})]
+    assert JOB_PROGRESS[job_id]['glossary'] == {'terms': 2, 'injected': 1}
+
+
+def test_resume_jobs_restarts_unfinished_jobs(monkeypatch, tmp_path):
+    from translator.checkpoint import JobCheckpoint
+
+    checkpoint = JobCheckpoint(str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setattr(app_module, '_JOB_CHECKPOINT', checkpoint)
+    monkeypatch.setattr(app_module, 'JOB_CHECKPOINT_PATH', str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    idml_path = tmp_path / 'kept' / '0-t.idml'
+    idml_path.parent.mkdir()
+    _create_idml(idml_path)
+    checkpoint.start('kept', {
+        'files': [[str(idml_path), 't']],
+        'languages': ['cs'],
+        'source_lang': 'en',
+        'system_prompt': None,
+        'model': 'gpt-4o',
+        'glossary_path': None,
+    })
+    checkpoint.start('gone', {
+        'files': [[str(tmp_path / 'gone' / '0-t.idml'), 't']],
+        'languages': ['cs'],
+        'source_lang': 'en',
+        'system_prompt': None,
+        'model': 'gpt-4o',
+        'glossary_path': None,
+    })
+    started = []
+
+    def fake_run(job_id, files, langs, src, prompt, model, glossary_path=None, previous=None, batch_api=False):
+        # the job is still recorded while it runs
+        assert job_id in [job for job, _ in checkpoint.unfinished()]
+        started.append((job_id, files, langs))
+
+    class DummyThread:
+        def __init__(self, target, args=(), daemon=None):
+            self.target = target
+            self.args = args
+
+        def start(self):
+            self.target(*self.args)
+
+    monkeypatch.setattr(app_module, '_run_translation_job', fake_run)
+    monkeypatch.setattr(threading, 'Thread', DummyThread)
+
+    assert app_module._resume_jobs() == ['kept']
+    assert started == [('kept', [(str(idml_path), 't')], ['cs'])]
+    assert JOB_PROGRESS['kept']['resumed'] is True
+    assert JOB_PROGRESS['kept']['status'] == 'finished'
+    assert checkpoint.unfinished() == []
+
+
+def test_run_translation_job_reuses_previous_version(monkeypatch, tmp_path):
+    sent = []
+
+    def fake_batch(texts, langs, *args, **kwargs):
+        sent.append(list(texts))
+        return {lang: [f'{t}-{lang}' for t in texts] for lang in langs}
+
+    monkeypatch.setattr(app_module, 'batch_translate', fake_batch)
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    app_module.USE_ASYNC = False
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+
+    def make(path, stories):
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr('mimetype', 'application/vnd.adobe.indesign-idml-package')
+            for name, texts in stories.items():
+                body = ''.join(f'<Content>{t}</Content>' for t in texts)
+                zf.writestr(f'Stories/{name}.xml', f'<Story>{body}</Story>')
+
+    v1 = tmp_path / 'v1.idml'
+    make(v1, {'Story_1': ['Hello'], 'Story_2': ['Bye', 'See you']})
+    JOB_PROGRESS['v1'] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job('v1', [(str(v1), 'book')], ['cs'], 'en', None, 'gpt-4o')
+    old_output = str(tmp_path / 'v1' / 'book-cs.idml')
+
+    v2 = tmp_path / 'v2.idml'
+    make(v2, {'Story_1': ['Hello'], 'Story_2': ['Bye', 'Later']})
+    JOB_PROGRESS['v2'] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job(
+        'v2', [(str(v2), 'book')], ['cs'], 'en', None, 'gpt-4o', None,
+        (str(v1), {'cs': old_output}),
+    )
+
+    assert sent[1] == ['Later']
+    assert JOB_PROGRESS['v2']['incremental'] == {'stories_reused': 1, 'segments_reused': 1}
+    assert JOB_PROGRESS['v2']['stories'] == 2
+    with zipfile.ZipFile(old_output) as old, zipfile.ZipFile(tmp_path / 'v2' / 'book-cs.idml') as new:
+        assert new.getinfo('Stories/Story_1.xml').CRC == old.getinfo('Stories/Story_1.xml').CRC
+        story = etree.fromstring(new.read('Stories/Story_2.xml'))
+    assert [el.text for el in story.iter('Content')] == ['Bye-cs', 'Later-cs']
+
+
+def test_index_saves_previous_version(monkeypatch, tmp_path):
+    seen = {}
+
+    def fake_run(job_id, files, langs, src, prompt, model, glossary_path=None, previous=None, batch_api=False):
+        seen['previous'] = previous
+        seen['exists'] = [os.path.exists(previous[0]), *map(os.path.exists, previous[1].values())]
+
+    class DummyThread:
+        def __init__(self, target, args=(), daemon=None):
+            self.target = target
+            self.args = args
+
+        def start(self):
+            self.target(*self.args)
+
+    monkeypatch.setattr(app_module, '_run_translation_job', fake_run)
+    monkeypatch.setattr(threading, 'Thread', DummyThread)
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+
+    idml_path = tmp_path / 't.idml'
+    _create_idml(idml_path)
+    client = app.test_client()
+    data = {
+        'idml_files': [(open(idml_path, 'rb'), 't.idml')],
+        'previous_source': (open(idml_path, 'rb'), 'old.idml'),
+        'previous_results': [
+            (open(idml_path, 'rb'), 'old-cs.idml'),
+            (open(idml_path, 'rb'), 'old-fr.idml'),
+        ],
+        'languages': 'cs',
+        'source_lang': 'en',
+    }
+    client.post('/', data=data, content_type='multipart/form-data')
+    source, outputs = seen['previous']
+    assert source.endswith('previous-source.idml')
+    assert list(outputs) == ['cs']
+    assert seen['exists'] == [True, True]
+
+
+def test_run_translation_job_uses_batch_api(monkeypatch, tmp_path):
+    used = {}
+
+    def fake_batch_api(texts, langs, *args, poll_interval=None, **kwargs):
+        used['poll_interval'] = poll_interval
+        return {lang: [f'{t}-{lang}' for t in texts] for lang in langs}
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError('synchronous requests must not be used')
+
+    monkeypatch.setattr(app_module, 'batch_api_translate', fake_batch_api)
+    monkeypatch.setattr(app_module, 'batch_translate', unexpected)
+    monkeypatch.setattr(app_module, 'STORY_WORKERS', 1)
+    monkeypatch.setattr(app_module, 'BATCH_POLL_SECONDS', 5.0)
+    app_module.USE_ASYNC = False
+    monkeypatch.setitem(app.config, 'RESULT_FOLDER', str(tmp_path))
+
+    idml_path = tmp_path / 't.idml'
+    _create_idml(idml_path)
+    job_id = 'batch-api'
+    JOB_PROGRESS[job_id] = {'timestamp': time.time(), 'progress': 0}
+    app_module._run_translation_job(
+        job_id, [(str(idml_path), 't')], ['cs'], 'en', None, 'gpt-4o', None, None, True
+    )
+
+    assert used['poll_interval'] == 5.0
+    assert JOB_PROGRESS[job_id]['progress'] == 100
+    with zipfile.ZipFile(tmp_path / job_id / 't-cs.idml') as zf:
+        assert b'Hello-cs' in zf.read('Stories/story.xml')
+
+
+def test_batch_api_jobs_do_not_take_a_job_slot(monkeypatch, tmp_path):
+    from translator.jobs import JobWorkspace
+
+    ran = []
+
+    class NoSlots:
+        def run(self, *args, **kwargs):
+            raise AssertionError('Batch API jobs must not wait for a slot')
+
+    monkeypatch.setattr(app_module, 'JOB_SLOTS', NoSlots())
+    monkeypatch.setattr(app_module, '_run_translation_job', lambda job_id, *args: ran.append((job_id, args[-1])))
+    JOB_PROGRESS['slotless'] = {'timestamp': time.time(), 'progress': 0}
+    app_module._start_job(
+        'slotless', JobWorkspace(str(tmp_path), 'slotless'), [], ['cs'], 'en', None, 'gpt-4o', batch_api=True
+    )
+    assert ran == [('slotless', True)]
+    assert JOB_PROGRESS['slotless']['status'] == 'finished'
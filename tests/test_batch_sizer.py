@@ -0,0 +1,49 @@
+import sys
+import os
+
+import openai
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from translator.batch_sizer import BatchSizer, failure_kind  # noqa: E402
+
+
+def test_initial_size_is_clamped_to_model_bounds():
+    assert BatchSizer("gpt-4o", 50).size == 200
+    assert BatchSizer("gpt-4", 10_000).size == 1_500
+    assert BatchSizer("unknown", 800, bounds=(10, 900)).size == 800
+
+
+def test_grows_while_latency_per_token_is_flat():
+    sizer = BatchSizer("gpt-4o", 400)
+    sizer.record_success(400, 4.0)
+    sizer.record_success(500, 5.2)
+    assert sizer.size == 625
+    # latency per token grew by half, so the size is kept
+    sizer.record_success(625, 9.5)
+    assert sizer.size == 625
+
+
+def test_shrinks_after_failures_and_reports_metrics():
+    sizer = BatchSizer("gpt-4o", 1_000)
+    sizer.record_failure("rate_limit")
+    sizer.record_failure("mismatch")
+    sizer.record_failure("mismatch")
+    assert sizer.size == 200
+    assert sizer.metrics() == {
+        "initial": 1_000,
+        "final": 200,
+        "min": 200,
+        "max": 1_000,
+        "changes": 3,
+        "failures": {"rate_limit": 1, "mismatch": 2},
+    }
+
+
+def test_failure_kind():
+    class RateLimited(Exception):
+        status_code = 429
+
+    assert failure_kind(RateLimited()) == "rate_limit"
+    assert failure_kind(openai.APITimeoutError(request=None)) == "timeout"
+    assert failure_kind(ValueError()) is None
@@ -0,0 +1,42 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from translator.checkpoint import JobCheckpoint  # noqa: E402
+
+
+def test_checkpoint_survives_reopening(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    checkpoint = JobCheckpoint(path)
+    checkpoint.start("a", {"files": [["a.idml", "a"]], "languages": ["cs"]})
+    checkpoint.start("b", {"files": [], "languages": ["de"]})
+    checkpoint.set_status("a", "running")
+    log = checkpoint.job("a")
+    log.put_many("cs", {"Hello": "Ahoj", "Bye": "Nashle"})
+    log.put_many("de", {"Hello": "Hallo"})
+    checkpoint.close()
+
+    checkpoint = JobCheckpoint(path)
+    assert checkpoint.unfinished() == [
+        ("a", {"files": [["a.idml", "a"]], "languages": ["cs"]}),
+        ("b", {"files": [], "languages": ["de"]}),
+    ]
+    log = checkpoint.job("a")
+    assert log.get_many("cs", ["Hello", "Bye", "New"]) == {"Hello": "Ahoj", "Bye": "Nashle"}
+    assert log.get_many("de", ["Bye"]) == {}
+    assert log.restored == 2
+    assert checkpoint.job("b").get_many("cs", ["Hello"]) == {}
+
+
+def test_finish_forgets_job_and_segments(tmp_path):
+    checkpoint = JobCheckpoint(str(tmp_path / "jobs.sqlite3"))
+    checkpoint.start("a", {})
+    checkpoint.job("a").put_many("cs", {"Hello": "Ahoj"})
+    checkpoint.job("a").put_batch(0, "batch-1", {"cs:0:0": ("cs", ["Hello"])})
+    assert checkpoint.get_batch("a", 0) == ("batch-1", {"cs:0:0": ("cs", ["Hello"])})
+    assert checkpoint.get_batch("a", 1) is None
+    checkpoint.finish("a")
+    assert checkpoint.unfinished() == []
+    assert checkpoint.get_many("a", "cs", ["Hello"]) == {}
+    assert checkpoint.get_batch("a", 0) is None
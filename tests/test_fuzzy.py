@@ -0,0 +1,74 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from translator.fuzzy import (  # noqa: E402
+    FuzzyMatcher,
+    minhash_bands,
+    minhash_signature,
+    substitute_numbers,
+)
+from translator.translation_memory import TranslationMemory  # noqa: E402
+
+
+def test_minhash_bands_ignore_numbers_and_depend_on_scope():
+    assert minhash_bands("Pack of 12 pens", "en-cs") == minhash_bands("Pack of 24 pens", "en-cs")
+    assert minhash_bands("Pack of 12 pens", "en-cs") != minhash_bands("Pack of 12 pens", "en-de")
+    similar = set(minhash_bands("Add the item to your basket now", "s"))
+    assert similar & set(minhash_bands("Add the items to your basket now", "s"))
+    assert not similar & set(minhash_bands("Completely unrelated sentence", "s"))
+
+    # the signature is computed once per text, whatever the scope
+    minhash_signature.cache_clear()
+    minhash_bands("Shared text", "en-cs")
+    minhash_bands("Shared text", "en-de")
+    assert minhash_signature.cache_info().misses == 1
+
+
+def test_substitute_numbers():
+    assert substitute_numbers("Pack of 12 pens", "Balení 12 per", "Pack of 24 pens") == "Balení 24 per"
+    assert substitute_numbers("Price 3.50 EUR", "Cena 3,50 EUR", "Price 4.20 EUR") is None
+    assert substitute_numbers("12 of 12", "12 z 12", "12 of 13") is None
+    assert substitute_numbers("Pack of 12 pens", "Balení 12 per", "Box of 24 pens") is None
+
+
+def test_fuzzy_matcher_reuses_and_references(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"), fuzzy=True)
+    memory.put_many(
+        {
+            "Pack of 12 pens": "Balení 12 per",
+            "Add the item to your basket now": "Přidejte položku do košíku",
+            "Completely unrelated sentence": "Úplně jiná věta",
+        },
+        "en", "cs", "gpt-4o", "prompt",
+    )
+    matcher = FuzzyMatcher(memory, threshold=0.8)
+    reused, references = matcher.match(
+        ["Pack of 24 pens", "Add the items to your basket now", "Nothing alike here"],
+        "en", "cs", "gpt-4o", "prompt",
+    )
+    assert reused == {"Pack of 24 pens": "Balení 24 per"}
+    assert references == {
+        "Add the items to your basket now": (
+            "Add the item to your basket now", "Přidejte položku do košíku"
+        )
+    }
+    assert matcher.metrics() == {
+        "lookups": 3, "reused": 1, "referenced": 1, "match_rate": 0.667,
+    }
+    # another prompt or language is a different setup
+    assert matcher.match(["Pack of 24 pens"], "en", "de", "gpt-4o", "prompt") == ({}, {})
+
+
+def test_band_index_follows_replaced_and_evicted_entries(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"), max_entries=1, fuzzy=True)
+    memory.put_many({"Pack of 12 pens": "A"}, "en", "cs", "m", "p")
+    memory.put_many({"Pack of 12 pens": "B"}, "en", "cs", "m", "p")
+    assert memory.fuzzy_many(["Pack of 13 pens"], "en", "cs", "m", "p") == {
+        "Pack of 13 pens": [("Pack of 12 pens", "B")]
+    }
+    memory.put_many({"Something else": "C"}, "en", "cs", "m", "p")
+    assert memory.fuzzy_many(["Pack of 13 pens"], "en", "cs", "m", "p") == {}
+    count = memory._conn.execute("SELECT COUNT(*) FROM bands").fetchone()[0]
+    assert count == len(minhash_bands("Something else", "s"))
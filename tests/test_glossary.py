@@ -0,0 +1,100 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from translator.glossary import (  # noqa: E402
+    Glossary,
+    TermIndex,
+    glossary_block,
+    load_glossary,
+)
+
+
+def test_term_index_matches_whole_words_only():
+    index = TermIndex(["pen", "Pen drive", "he"])
+    assert index.find("A pen drive, open it.") == {"pen", "pen drive"}
+    assert index.find("The PEN.") == {"pen"}
+    assert index.find("open happens") == set()
+
+
+def test_glossary_returns_only_terms_in_the_batch():
+    glossary = Glossary({
+        "invoice": {"cs": "faktura", "de": "Rechnung"},
+        "order": {"*": "objednávka"},
+        "unused": {"cs": "nepoužitý"},
+    })
+    terms = glossary.terms(["Your Invoice", "Order now"], ["cs"])
+    assert terms == [("invoice", {"cs": "faktura"}), ("order", {"cs": "objednávka"})]
+    assert glossary.terms(["Nothing here"], ["de"]) == []
+    assert glossary.injected == 2
+
+
+def test_glossary_block_lists_terms():
+    assert glossary_block([]) == ""
+    block = glossary_block([
+        ("invoice", {"cs": "faktura"}),
+        ("order", {"cs": "objednávka", "de": "Bestellung"}),
+    ])
+    assert block.splitlines()[1:-1] == [
+        "invoice => faktura",
+        "order => cs: objednávka; de: Bestellung",
+    ]
+    assert block.endswith("\n\n")
+
+
+def test_load_csv_with_language_header(tmp_path):
+    path = tmp_path / "terms.csv"
+    path.write_text("cs,en,de\nfaktura,invoice,Rechnung\n,order,Bestellung\n", encoding="utf-8")
+    glossary = load_glossary(str(path), "en")
+    assert glossary.entries == {
+        "invoice": {"cs": "faktura", "de": "Rechnung"},
+        "order": {"de": "Bestellung"},
+    }
+
+
+def test_load_csv_without_header_applies_to_all_languages(tmp_path):
+    path = tmp_path / "terms.csv"
+    path.write_text("Acme Widget;Acme Widget\nSKU list;seznam SKU\n", encoding="utf-8")
+    glossary = load_glossary(str(path), "en")
+    assert glossary.entries == {
+        "Acme Widget": {"*": "Acme Widget"},
+        "SKU list": {"*": "seznam SKU"},
+    }
+
+
+def test_load_csv_does_not_take_code_like_terms_for_a_header(tmp_path):
+    path = tmp_path / "terms.csv"
+    path.write_text("PDF,PDF\nUSB-C,USB-C\nIT,IT\n", encoding="utf-8")
+    glossary = load_glossary(str(path), "en")
+    assert glossary.entries == {
+        "PDF": {"*": "PDF"},
+        "USB-C": {"*": "USB-C"},
+        "IT": {"*": "IT"},
+    }
+    path.write_text("EN,de-DE\norder,Bestellung\n", encoding="utf-8")
+    assert load_glossary(str(path), "en").entries == {"order": {"de": "Bestellung"}}
+
+
+def test_load_tbx(tmp_path):
+    path = tmp_path / "terms.tbx"
+    path.write_text(
+        '<?xml version="1.0"?>'
+        '<martif type="TBX"><text><body>'
+        '<termEntry id="1">'
+        '<langSet xml:lang="en-US"><tig><term>invoice</term></tig></langSet>'
+        '<langSet xml:lang="cs"><tig><term>faktura</term></tig></langSet>'
+        '</termEntry>'
+        '<termEntry id="2">'
+        '<langSet xml:lang="de"><tig><term>Rechnung</term></tig></langSet>'
+        '</termEntry>'
+        '<termEntry id="3">'
+        '<langSet xml:lang="de"><tig><term>Lieferschein</term></tig></langSet>'
+        '<langSet xml:lang="cs"><tig><term>dodací list</term></tig></langSet>'
+        '</termEntry>'
+        '</body></text></martif>',
+        encoding="utf-8",
+    )
+    glossary = load_glossary(str(path), "en")
+    # the entry without an English term has no source term to match
+    assert glossary.entries == {"invoice": {"cs": "faktura"}}
@@ -0,0 +1,76 @@
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from translator import history as history_module  # noqa: E402
+from translator.history import HistoryPolicy  # noqa: E402
+
+
+class Translator:
+    def __init__(self):
+        self.messages = [{"role": "system", "content": "system"}]
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(
+        history_module,
+        "count_tokens",
+        lambda texts, model: sum(len(t.split()) for t in texts),
+    )
+
+
+def test_full_history_keeps_recent_messages():
+    policy = HistoryPolicy("full", messages=2)
+    translator = Translator()
+    policy.record(translator, "one", "jedna", {})
+    policy.record(translator, "two", "dva", {})
+    request = policy.build(translator, "three", "gpt-4o")
+    assert [m["content"] for m in request] == ["system", "two", "dva", "three"]
+    assert policy.metrics() == {
+        "strategy": "full",
+        "prompt_tokens": 4,
+        "history_tokens": 2,
+        "history_share": 0.5,
+    }
+
+
+def test_none_sends_only_system_and_prompt():
+    policy = HistoryPolicy("none")
+    translator = Translator()
+    policy.record(translator, "one", "jedna", {"one": "jedna"})
+    request = policy.build(translator, "two", "gpt-4o")
+    assert request == [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "two"},
+    ]
+    assert translator.messages == [{"role": "system", "content": "system"}]
+    assert policy.metrics()["history_share"] == 0.0
+
+
+def test_pairs_sends_last_segment_pairs():
+    policy = HistoryPolicy("pairs", pairs=2)
+    translator = Translator()
+    policy.record(translator, "p", "r", {"a": "A", "b": "B"})
+    policy.record(translator, "p", "r", {"c": "C"})
+    request = policy.build(translator, "next", "gpt-4o")
+    assert request[1]["content"].splitlines()[1:] == ["b => B", "c => C"]
+    assert policy.exchanges == 2
+
+
+def test_glossary_keeps_recent_short_segments():
+    policy = HistoryPolicy("glossary", pairs=2, glossary_words=2)
+    translator = Translator()
+    policy.record(translator, "p", "r", {"red pen": "červené pero", "a long sentence here": "x"})
+    policy.record(translator, "p", "r", {"ink": "inkoust", "paper": "papír"})
+    policy.record(translator, "p", "r", {"ink": "inkoust"})
+    request = policy.build(translator, "next", "gpt-4o")
+    assert request[1]["content"].splitlines()[1:] == ["paper => papír", "ink => inkoust"]
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        HistoryPolicy("everything")
@@ -1,11 +1,10 @@
 import zipfile
-import pytest
 
 from translator.idml_handler import (
-    extract_idml,
-    ExtractionError,
-    repackage_idml,
-    copy_unpacked_dir,
+    ArchiveMember,
+    find_story_members,
+    story_digests,
+    write_idml,
 )
 
 
@@ -15,41 +14,60 @@ def create_zip(files, path):
             zf.writestr(name, content)
 
 
-def test_extract_idml_extracts_files(tmp_path):
-    zip_path = tmp_path / "test.idml"
-    create_zip({"test.txt": "content"}, zip_path)
+def test_write_idml_copies_members_and_keeps_mimetype_first(tmp_path):
+    src = tmp_path / "src.idml"
+    with zipfile.ZipFile(src, "w") as zf:
+        zf.writestr("designmap.xml", "<Document/>" * 100, compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("mimetype", "application/vnd.adobe.indesign-idml-package", compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("Stories/Story_u1.xml", "<Root>old</Root>", compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("Resources/Fonts.xml", "<Fonts/>")
 
-    output_dir = tmp_path / "out"
-    extract_idml(zip_path, output_dir)
+    out = tmp_path / "out.idml"
+    write_idml(src, out, {"Stories/Story_u1.xml": b"<Root>new</Root>"})
 
-    assert (output_dir / "test.txt").read_text() == "content"
+    with zipfile.ZipFile(src) as original, zipfile.ZipFile(out) as zf:
+        assert zf.testzip() is None
+        infos = zf.infolist()
+        assert infos[0].filename == "mimetype"
+        assert infos[0].compress_type == zipfile.ZIP_STORED
+        assert zf.read("mimetype") == b"application/vnd.adobe.indesign-idml-package"
+        assert zf.read("Stories/Story_u1.xml") == b"<Root>new</Root>"
+        for name in ("designmap.xml", "Resources/Fonts.xml"):
+            assert zf.read(name) == original.read(name)
+            assert zf.getinfo(name).compress_type == original.getinfo(name).compress_type
+            assert zf.getinfo(name).compress_size == original.getinfo(name).compress_size
 
 
-def test_extract_idml_prevents_path_traversal(tmp_path):
-    zip_path = tmp_path / "evil.idml"
-    create_zip({"../evil.txt": "bad"}, zip_path)
+def test_find_story_members_lists_only_stories(tmp_path):
+    src = tmp_path / "src.idml"
+    create_zip(
+        {
+            "mimetype": "",
+            "Stories/Story_a.xml": "<Root/>",
+            "Stories/nested/Story_b.xml": "<Root/>",
+            "Spreads/Spread_a.xml": "<Root/>",
+        },
+        src,
+    )
+    assert find_story_members(src) == ["Stories/Story_a.xml"]
 
-    with pytest.raises(ExtractionError):
-        extract_idml(zip_path, tmp_path / "out")
 
+def test_story_digests_and_archive_member_copy(tmp_path):
+    old = tmp_path / "old-cs.idml"
+    new = tmp_path / "new.idml"
+    create_zip({"mimetype": "x", "Stories/Story_a.xml": "<a>Ahoj</a>"}, old)
+    create_zip({
+        "mimetype": "x",
+        "Stories/Story_a.xml": "<a>Hello</a>",
+        "Stories/Story_b.xml": "<b>Hello</b>",
+    }, new)
+    digests = story_digests(new)
+    assert set(digests) == {"Stories/Story_a.xml", "Stories/Story_b.xml"}
+    assert digests["Stories/Story_a.xml"] != story_digests(old)["Stories/Story_a.xml"]
 
-def test_repackage_idml_roundtrip(tmp_path):
-    src = tmp_path / "src"
-    (src / "Stories").mkdir(parents=True)
-    (src / "Stories" / "story.xml").write_text("<Root/>")
     out = tmp_path / "out.idml"
-    repackage_idml(src, out)
-    assert zipfile.is_zipfile(out)
+    write_idml(new, out, {"Stories/Story_a.xml": ArchiveMember(str(old), "Stories/Story_a.xml")})
     with zipfile.ZipFile(out) as zf:
-        assert "Stories/story.xml" in zf.namelist()
-
-
-def test_copy_unpacked_dir_overwrites(tmp_path):
-    src = tmp_path / "src"
-    src.mkdir()
-    (src / "a.txt").write_text("ok")
-    dest = tmp_path / "dest"
-    dest.mkdir()
-    (dest / "a.txt").write_text("old")
-    copy_unpacked_dir(src, dest)
-    assert (dest / "a.txt").read_text() == "ok"
+        assert zf.testzip() is None
+        assert zf.read("Stories/Story_a.xml") == b"<a>Ahoj</a>"
+        assert zf.read("Stories/Story_b.xml") == b"<b>Hello</b>"
@@ -0,0 +1,36 @@
+import sys
+import os
+import zipfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from translator.idml_handler import ArchiveMember  # noqa: E402
+from translator.incremental import PreviousVersion  # noqa: E402
+
+
+def _idml(path, stories):
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("mimetype", "application/vnd.adobe.indesign-idml-package")
+        for name, contents in stories.items():
+            body = "".join(f"<Content>{c}</Content>" for c in contents)
+            zf.writestr(f"Stories/{name}.xml", f"<Story>{body}</Story>")
+    return str(path)
+
+
+def test_previous_version_matches_stories_by_name_and_hash(tmp_path):
+    source = _idml(tmp_path / "v1.idml", {"A": ["Hello"], "B": ["Bye", "Later"]})
+    outputs = {
+        "cs": _idml(tmp_path / "v1-cs.idml", {"A": ["Ahoj"], "B": ["Nashle", "Pak"]}),
+        "de": _idml(tmp_path / "v1-de.idml", {"A": ["Hallo"]}),
+    }
+    new = _idml(tmp_path / "v2.idml", {"A": ["Hello"], "B": ["Bye", "Soon"], "C": ["New"]})
+    previous = PreviousVersion(source, outputs)
+
+    assert previous.unchanged(new, ["cs"]) == {"Stories/A.xml"}
+    # B is missing from the German output, A is still copied
+    assert previous.unchanged(new, ["cs", "de"]) == {"Stories/A.xml"}
+    assert previous.unchanged(new, ["cs", "pl"]) == set()
+    assert previous.member("cs", "Stories/A.xml") == ArchiveMember(outputs["cs"], "Stories/A.xml")
+
+    found = previous.translations(["Stories/B.xml", "Stories/C.xml"], ["cs", "de"])
+    assert found == {"cs": {"Bye": "Nashle", "Later": "Pak"}, "de": {}}
@@ -0,0 +1,45 @@
+import threading
+import time
+
+from translator.jobs import JobSlots, JobWorkspace
+
+
+def test_workspace_is_private_and_cleaned_up(tmp_path):
+    with JobWorkspace(str(tmp_path), "a") as first, JobWorkspace(str(tmp_path), "b") as second:
+        assert first.path != second.path
+        with open(first.file("x.idml"), "w") as f:
+            f.write("data")
+        assert not (tmp_path / "b" / "x.idml").exists()
+    assert not (tmp_path / "a").exists()
+    assert not (tmp_path / "b").exists()
+
+
+def test_job_slots_limit_parallel_jobs():
+    slots = JobSlots(2)
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+    started = []
+
+    def job(name):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+            started.append(name)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    threads = []
+    for i in range(5):
+        t = threading.Thread(target=slots.run, args=(job, i))
+        t.start()
+        threads.append(t)
+        time.sleep(0.002)
+    for t in threads:
+        t.join()
+
+    assert peak == 2
+    assert sorted(started) == list(range(5))
+    assert slots.running == 0 and slots.waiting == 0
@@ -7,6 +7,13 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 from translator import openai_client  # noqa: E402
 
 
+def _async_api(create):
+    """Return a stand-in for ``AsyncOpenAI`` whose completions call ``create``."""
+    from types import SimpleNamespace
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
 def test_batch_translate_batches_and_caches(monkeypatch):
     calls = []
 
@@ -69,14 +76,12 @@ def test_async_batch_translate(monkeypatch):
         models.append(kwargs.get("model"))
         return resp
 
-    monkeypatch.setattr(
-        openai_client.async_client.chat.completions, "create", fake_create
-    )
+    api = _async_api(fake_create)
 
     texts = ["Hi", "Bye"]
     result = asyncio.run(
         openai_client.async_batch_translate(
-            texts, ["cs", "de"], "en", delay=None, model="gpt-3.5-turbo"
+            texts, ["cs", "de"], "en", delay=None, model="gpt-3.5-turbo", api=api
         )
     )
     assert result["cs"] == ["Hi_t", "Bye_t"]
@@ -84,21 +89,80 @@ def test_async_batch_translate(monkeypatch):
     assert len(calls) == 2
     assert models == ["gpt-3.5-turbo", "gpt-3.5-turbo"]
 
+    # without ``api`` every call, i.e. every job's event loop, has its own client
+    clients = []
+
+    def make_client(**kwargs):
+        client = _async_api(fake_create)
+
+        async def close():
+            client.closed = True
+
+        client.close = close
+        clients.append(client)
+        return client
+
+    monkeypatch.setattr(openai_client, "AsyncOpenAI", make_client)
+    for _ in range(2):
+        asyncio.run(openai_client.async_batch_translate(texts, ["cs"], "en", delay=None))
+    assert len(clients) == 2 and all(c.closed for c in clients)
+
 
 def test_split_batches_respects_tokens(monkeypatch):
     monkeypatch.setattr(
-        openai_client, "count_tokens", lambda texts, model: len(texts[0])
+        openai_client, "token_counts", lambda texts, model: [len(t) for t in texts]
     )
 
+    monkeypatch.setattr(openai_client, "SEGMENT_MARKER_TOKENS", 0)
+
     texts = ["aaaaa", "bb", "ccc"]
     batches = openai_client._split_batches(texts, 5, "gpt-3.5-turbo")
     assert batches == [["aaaaa"], ["bb", "ccc"]]
 
 
+def test_split_batches_counts_markers_and_model_limits(monkeypatch):
+    monkeypatch.setattr(
+        openai_client, "token_counts", lambda texts, model: [len(t) for t in texts]
+    )
+    monkeypatch.setattr(openai_client, "SEGMENT_MARKER_TOKENS", 2)
+
+    texts = ["aaa", "bb", "c"]
+    # every segment carries two tokens for its label
+    assert openai_client._split_batches(texts, 9, "gpt-4o") == [["aaa", "bb"], ["c"]]
+
+    # 8192 tokens over 4 exchanges leave (2048 - 48) // 2 = 1000 per batch side
+    assert openai_client._batch_budget(5000, "gpt-4", overhead=48) == 1000
+    # two reply languages triple the tokens of every exchange
+    assert openai_client._batch_budget(5000, "gpt-3.5-turbo", outputs=2) == 1365
+    assert openai_client._batch_budget(800, "gpt-4o", overhead=100, outputs=3) == 800
+
+
+def test_split_batches_keeps_stories_together(monkeypatch):
+    monkeypatch.setattr(
+        openai_client, "token_counts", lambda texts, model: [len(t) for t in texts]
+    )
+    monkeypatch.setattr(openai_client, "SEGMENT_MARKER_TOKENS", 0)
+
+    texts = ["aaaa", "bb", "cc", "dddddddddd", "e"]
+    stories = {"aaaa": 1, "bb": 2, "cc": 2, "dddddddddd": 3, "e": 3}
+    assert openai_client._split_batches(texts, 6, "gpt-4o") == [
+        ["aaaa", "bb"], ["cc"], ["dddddddddd"], ["e"]
+    ]
+    # story 2 fits a batch of its own; story 3 is too long and is split anyway
+    assert openai_client._split_batches(texts, 6, "gpt-4o", stories=stories) == [
+        ["aaaa"], ["bb", "cc"], ["dddddddddd"], ["e"]
+    ]
+
+
 def test_parse_segments_preserves_spaces():
     translated = "[[SEG1]]  Hello \n[[SEG2]]  World  "
-    result = openai_client._parse_segments(translated)
-    assert result == [" Hello ", " World  "]
+    result = openai_client._parse_segments(translated, 2)
+    assert result == {1: " Hello ", 2: " World  "}
+
+
+def test_parse_segments_matches_labels():
+    reply = "[[SEG2]] B\n[[SEG1]] A\n[[SEG2]] again\n[[SEG4]] D\n[[SEG9]] extra"
+    assert openai_client._parse_segments(reply, 4) == {1: "A", 2: "B", 4: "D"}
 
 
 def test_get_remaining_credit(monkeypatch):
@@ -127,3 +191,601 @@ def test_get_remaining_credit(monkeypatch):
     monkeypatch.setattr(openai_client.httpx, "Client", DummyClient)
     os.environ["OPENAI_API_KEY"] = "test"
     assert openai_client.get_remaining_credit() == 1.23
+
+
+def test_batch_translate_uses_translation_memory(monkeypatch, tmp_path):
+    from translator.translation_memory import TranslationMemory
+
+    calls = []
+
+    def fake_create(*args, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        lines = [
+            line for line in prompt.splitlines() if line.strip().startswith("[[SEG")
+        ]
+        pieces = [line.split("]]", 1)[1].strip() for line in lines]
+
+        class M:
+            pass
+
+        resp = M()
+        resp.choices = [M()]
+        resp.choices[0].message = M()
+        resp.choices[0].message.content = "\n".join(
+            f"[[SEG{i + 1}]] {p}_t" for i, p in enumerate(pieces)
+        )
+        calls.append(pieces)
+        return resp
+
+    monkeypatch.setattr(openai_client.client.chat.completions, "create", fake_create)
+
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"))
+    first = openai_client.batch_translate(
+        ["Hello", "World"], ["cs"], "en", delay=None, memory=memory
+    )
+    second = openai_client.batch_translate(
+        ["Hello", "World", "New"], ["cs"], "en", delay=None, memory=memory
+    )
+
+    assert first["cs"] == ["Hello_t", "World_t"]
+    assert second["cs"] == ["Hello_t", "World_t", "New_t"]
+    assert calls == [["Hello", "World"], ["New"]]
+    assert memory.hits == 2
+
+
+def _multi_fake_create(calls, drop=()):
+    def fake_create(*args, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        calls.append(prompt)
+        lines = [
+            line for line in prompt.splitlines() if line.strip().startswith("[[SEG")
+        ]
+        pieces = [line.split("]]", 1)[1].strip() for line in lines]
+
+        class M:
+            pass
+
+        resp = M()
+        resp.choices = [M()]
+        resp.choices[0].message = M()
+        if "into each of these languages" in prompt:
+            out = [
+                f"[[SEG{i + 1}:{lang}]] {p}_{lang}"
+                for i, p in enumerate(pieces)
+                for lang in ("cs", "de")
+                if (i + 1, lang) not in drop
+            ]
+        else:
+            lang = "cs" if "Czech" in kwargs["messages"][0]["content"] else "de"
+            out = [f"[[SEG{i + 1}]] {p}_{lang}" for i, p in enumerate(pieces)]
+        resp.choices[0].message.content = "\n".join(out)
+        return resp
+
+    return fake_create
+
+
+def test_batch_translate_multi_language_single_request(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        openai_client.client.chat.completions, "create", _multi_fake_create(calls)
+    )
+
+    result = openai_client.batch_translate(
+        ["Hi", "Bye", "Hi"], ["cs", "de"], "en", delay=None, multi_language=True
+    )
+    assert result["cs"] == ["Hi_cs", "Bye_cs", "Hi_cs"]
+    assert result["de"] == ["Hi_de", "Bye_de", "Hi_de"]
+    assert len(calls) == 1
+
+
+def test_batch_translate_multi_language_falls_back_per_language(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        openai_client.client.chat.completions,
+        "create",
+        _multi_fake_create(calls, drop={(2, "de")}),
+    )
+
+    result = openai_client.batch_translate(
+        ["Hi", "Bye"], ["cs", "de"], "en", delay=None, multi_language=True
+    )
+    assert result["cs"] == ["Hi_cs", "Bye_cs"]
+    assert result["de"] == ["Hi_de", "Bye_de"]
+    # only the segment missing from the reply is requested again
+    assert len(calls) == 2
+    assert "[[SEG1]] Bye" in calls[1]
+    assert "Hi" not in calls[1].split(":\n", 1)[1]
+
+
+def test_async_batch_translate_multi_language(monkeypatch):
+    calls = []
+    sync_fake = _multi_fake_create(calls)
+
+    async def fake_create(*args, **kwargs):
+        return sync_fake(*args, **kwargs)
+
+    api = _async_api(fake_create)
+    result = asyncio.run(
+        openai_client.async_batch_translate(
+            ["Hi"], ["cs", "de"], "en", multi_language=True, api=api
+        )
+    )
+    assert result == {"cs": ["Hi_cs"], "de": ["Hi_de"]}
+    assert len(calls) == 1
+
+
+def test_parse_language_segments_ignores_unknown_labels():
+    reply = "[[SEG1:cs]] Ahoj\n[[SEG1:de]] Hallo\n[[SEG3:cs]] extra\n[[SEG2:fr]] Salut"
+    result = openai_client._parse_language_segments(reply, ["cs", "de"], 2)
+    assert result == {"cs": {1: "Ahoj"}, "de": {1: "Hallo"}}
+
+
+def test_batch_translate_skips_prefiltered_segments(monkeypatch):
+    from translator.prefilter import PassthroughFilter
+
+    calls = []
+    monkeypatch.setattr(
+        openai_client.client.chat.completions, "create", _multi_fake_create(calls)
+    )
+    progress = []
+    prefilter = PassthroughFilter()
+    result = openai_client.batch_translate(
+        ["Hi", "42", "[[TAG1]]", "42"],
+        ["cs"],
+        "en",
+        progress_callback=progress.append,
+        delay=None,
+        prefilter=prefilter,
+    )
+    assert result["cs"] == ["Hi_cs", "42", "[[TAG1]]", "42"]
+    assert len(calls) == 1
+    assert "42" not in calls[0] and "TAG1" not in calls[0]
+    assert prefilter.skipped == 2
+    assert progress[0] == 75 and progress[-1] == 100
+
+
+def test_batch_translate_adapts_batch_size(monkeypatch):
+    from translator.batch_sizer import BatchSizer
+
+    monkeypatch.setattr(
+        openai_client, "token_counts", lambda texts, model: [len(t) for t in texts]
+    )
+    monkeypatch.setattr(openai_client, "SEGMENT_MARKER_TOKENS", 0)
+    calls = []
+    fake = _multi_fake_create(calls)
+
+    def fake_create(*args, **kwargs):
+        resp = fake(*args, **kwargs)
+        # drop the last segment of the first reply
+        if len(calls) == 1:
+            resp.choices[0].message.content = resp.choices[0].message.content.rsplit("\n", 1)[0]
+        return resp
+
+    monkeypatch.setattr(openai_client.client.chat.completions, "create", fake_create)
+    sizer = BatchSizer("gpt-4o", 20, bounds=(10, 40))
+    texts = [f"{i:04d}x" for i in range(8)]
+    result = openai_client.batch_translate(
+        texts, ["cs"], "en", delay=None, sizer=sizer
+    )
+    # four segments of 5 tokens fill the first batch, two the later ones
+    # after the dropped segment was requested again
+    sent = [[line for line in call.splitlines() if line.startswith("[[SEG")] for call in calls]
+    assert [len(lines) for lines in sent] == [4, 1, 2, 2]
+    assert sizer.metrics()["failures"] == {"mismatch": 1}
+    assert result["cs"] == [f"{t}_cs" for t in texts]
+
+
+def _misaligned_create(calls):
+    fake = _multi_fake_create(calls)
+
+    def fake_create(*args, **kwargs):
+        resp = fake(*args, **kwargs)
+        if len(calls) == 1:
+            # the first reply drops SEG2 and swaps the remaining lines
+            lines = resp.choices[0].message.content.splitlines()
+            resp.choices[0].message.content = "\n".join([lines[2], lines[0]])
+        return resp
+
+    return fake_create
+
+
+def test_batch_translate_requests_only_missing_segments(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        openai_client.client.chat.completions, "create", _misaligned_create(calls)
+    )
+    result = openai_client.batch_translate(["A", "B", "C"], ["cs"], "en", delay=None)
+    assert result["cs"] == ["A_cs", "B_cs", "C_cs"]
+    assert len(calls) == 2
+    assert calls[1].endswith("[[SEG1]] B")
+
+
+def test_async_batch_translate_requests_only_missing_segments(monkeypatch):
+    calls = []
+    sync_fake = _misaligned_create(calls)
+
+    async def fake_create(*args, **kwargs):
+        return sync_fake(*args, **kwargs)
+
+    api = _async_api(fake_create)
+    result = asyncio.run(
+        openai_client.async_batch_translate(["A", "B", "C"], ["cs"], "en", api=api)
+    )
+    assert result["cs"] == ["A_cs", "B_cs", "C_cs"]
+    assert len(calls) == 2
+    assert calls[1].endswith("[[SEG1]] B")
+
+
+def test_batch_translate_sends_history_of_the_policy(monkeypatch):
+    from translator import history as history_module
+    from translator.history import HistoryPolicy
+
+    monkeypatch.setattr(
+        history_module, "count_tokens", lambda texts, model: sum(map(len, texts))
+    )
+    requests = []
+    fake = _multi_fake_create([])
+
+    def fake_create(*args, **kwargs):
+        requests.append(kwargs["messages"])
+        return fake(*args, **kwargs)
+
+    monkeypatch.setattr(openai_client.client.chat.completions, "create", fake_create)
+    monkeypatch.setattr(
+        openai_client, "token_counts", lambda texts, model: [len(t) for t in texts]
+    )
+    monkeypatch.setattr(openai_client, "SEGMENT_MARKER_TOKENS", 0)
+    history = HistoryPolicy("pairs", pairs=1)
+    result = openai_client.batch_translate(
+        ["a" * 300, "b" * 300], ["cs"], "en", delay=None, max_tokens=300, history=history
+    )
+    assert result["cs"] == ["a" * 300 + "_cs", "b" * 300 + "_cs"]
+    assert len(requests[0]) == 2
+    assert requests[1][1]["content"].endswith("a" * 300 + " => " + "a" * 300 + "_cs")
+    assert history.metrics()["history_tokens"] > 0
+
+
+def test_batch_translate_injects_only_terms_of_the_batch(monkeypatch):
+    from translator.glossary import Glossary
+
+    calls = []
+    monkeypatch.setattr(
+        openai_client.client.chat.completions, "create", _multi_fake_create(calls)
+    )
+    monkeypatch.setattr(
+        openai_client, "token_counts", lambda texts, model: [len(t) for t in texts]
+    )
+    monkeypatch.setattr(openai_client, "SEGMENT_MARKER_TOKENS", 0)
+    glossary = Glossary({"invoice": {"cs": "faktura"}, "order": {"cs": "objednávka"}})
+    result = openai_client.batch_translate(
+        ["Pay the invoice" + " " * 290, "Track order" + " " * 290],
+        ["cs"],
+        "en",
+        delay=None,
+        max_tokens=300,
+        glossary=glossary,
+    )
+    assert result["cs"] == ["Pay the invoice_cs", "Track order_cs"]
+    assert "invoice => faktura" in calls[0] and "order" not in calls[0]
+    assert "order => objednávka" in calls[1] and "invoice" not in calls[1]
+    assert glossary.injected == 2
+
+
+def test_batch_translate_resumes_from_checkpoint(monkeypatch, tmp_path):
+    from translator.checkpoint import JobCheckpoint
+
+    checkpoint = JobCheckpoint(str(tmp_path / "jobs.sqlite3"))
+    log = checkpoint.job("job")
+    log.put_many("cs", {"Hi": "Ahoj"})
+    calls = []
+    monkeypatch.setattr(
+        openai_client.client.chat.completions, "create", _multi_fake_create(calls)
+    )
+    progress = []
+    result = openai_client.batch_translate(
+        ["Hi", "Bye", "Hi"],
+        ["cs"],
+        "en",
+        progress_callback=progress.append,
+        delay=None,
+        checkpoint=log,
+    )
+    assert result["cs"] == ["Ahoj", "Bye_cs", "Ahoj"]
+    assert len(calls) == 1 and "Hi" not in calls[0]
+    assert progress[0] == 66
+    # the new batch was checkpointed as soon as it was parsed
+    assert checkpoint.get_many("job", "cs", ["Bye"]) == {"Bye": "Bye_cs"}
+
+
+def test_batch_translate_uses_fuzzy_matches(monkeypatch, tmp_path):
+    from translator.fuzzy import FuzzyMatcher
+    from translator.translation_memory import TranslationMemory
+
+    calls = []
+    monkeypatch.setattr(
+        openai_client.client.chat.completions, "create", _multi_fake_create(calls)
+    )
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"), fuzzy=True)
+    prompt = openai_client.ChatTranslator("en", "cs").messages[0]["content"]
+    memory.put_many(
+        {"Pack of 12 pens": "Balení 12 per", "Add the item to your basket": "Do košíku"},
+        "en", "cs", "gpt-4o", prompt,
+    )
+    fuzzy = FuzzyMatcher(memory, threshold=0.8)
+    result = openai_client.batch_translate(
+        ["Pack of 24 pens", "Add the items to your basket"],
+        ["cs"],
+        "en",
+        delay=None,
+        memory=memory,
+        fuzzy=fuzzy,
+    )
+    assert result["cs"] == ["Balení 24 per", "Add the items to your basket_cs"]
+    assert len(calls) == 1
+    assert "Pack of" not in calls[0]
+    assert "[[SEG1]] Add the items to your basket\n=> Do košíku" in calls[0]
+    assert fuzzy.metrics()["match_rate"] == 1.0
+    # a guess with substituted numbers is not stored as an exact translation
+    assert memory.get("Pack of 24 pens", "en", "cs", "gpt-4o", prompt) is None
+
+
+def test_split_batches_counts_shown_translations(monkeypatch):
+    monkeypatch.setattr(
+        openai_client, "token_counts", lambda texts, model: [len(t) for t in texts]
+    )
+    monkeypatch.setattr(openai_client, "SEGMENT_MARKER_TOKENS", 0)
+    monkeypatch.setattr(openai_client, "EDIT_MARKER_TOKENS", 0)
+    texts = ["aa", "bb", "cc"]
+    references = {t: (t, "xx") for t in texts}
+    assert openai_client._split_batches(texts, 6, "gpt-4o") == [texts]
+    assert openai_client._split_batches(
+        texts, 6, "gpt-4o", references=references
+    ) == [["aa"], ["bb"], ["cc"]]
+
+
+def _batch_stub(canned, polls=1, drop=()):
+    """Return an OpenAI client backed by a stub of the Batch API.
+
+    The stub replays ``canned`` translations of the uploaded segments and
+    reports the batch as in progress for ``polls`` retrievals.
+    """
+    import json
+    import re
+
+    import httpx
+    from openai import OpenAI
+
+    state = {"uploads": [], "polls": 0, "output": ""}
+
+    def handler(request):
+        path = request.url.path
+        if path.endswith("/files") and request.method == "POST":
+            body = request.content.decode("utf-8")
+            lines = [json.loads(line) for line in body.splitlines() if line.startswith('{"custom_id"')]
+            state["uploads"].append(lines)
+            out = []
+            for item in lines:
+                prompt = item["body"]["messages"][-1]["content"]
+                segs = re.findall(r"^\[\[SEG(\d+)\]\] (.*)$", prompt, re.M)
+                reply = "\n".join(
+                    f"[[SEG{n}]] {canned[text]}" for n, text in segs if text not in drop
+                )
+                out.append(json.dumps({
+                    "custom_id": item["custom_id"],
+                    "response": {"status_code": 200, "body": {
+                        "choices": [{"message": {"role": "assistant", "content": reply}}],
+                        "usage": {"total_tokens": 10},
+                    }},
+                }))
+            state["output"] = "\n".join(out)
+            return httpx.Response(200, json={
+                "id": "file-in", "object": "file", "bytes": 1, "created_at": 0,
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed",
+            })
+        if path.endswith("/content"):
+            return httpx.Response(200, text=state["output"])
+        batch = {
+            "id": "batch-1", "object": "batch", "endpoint": "/v1/chat/completions",
+            "input_file_id": "file-in", "completion_window": "24h", "created_at": 0,
+            "status": "in_progress",
+        }
+        if request.method == "GET":
+            state["polls"] += 1
+            if state["polls"] > polls:
+                batch.update(status="completed", output_file_id="file-out")
+        return httpx.Response(200, json=batch)
+
+    api = OpenAI(
+        api_key="x",
+        base_url="http://stub/v1",
+        http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+    )
+    return api, state
+
+
+def test_batch_api_translate_submits_jsonl_and_polls(monkeypatch):
+    monkeypatch.setattr(openai_client.time, "sleep", lambda s: None)
+    api, state = _batch_stub(
+        {"Hi": "Ahoj", "Bye": "Nashle", "Later": "Pozdeji"}, polls=2, drop={"Later"}
+    )
+    tokens = []
+    result = openai_client.batch_api_translate(
+        ["Hi", "Bye", "Hi", "Later"],
+        ["cs"],
+        "en",
+        tokens_callback=tokens.append,
+        api=api,
+    )
+    # the segment missing from the first reply is submitted once more and
+    # keeps its source text when it is missing again
+    assert result["cs"] == ["Ahoj", "Nashle", "Ahoj", "Later"]
+    assert len(state["uploads"]) == 2
+    first = state["uploads"][0]
+    assert [item["custom_id"] for item in first] == ["cs:0:0"]
+    assert first[0]["url"] == "/v1/chat/completions"
+    assert first[0]["body"]["messages"][0]["role"] == "system"
+    assert "Later" in state["uploads"][1][0]["body"]["messages"][-1]["content"]
+    assert "Hi" not in state["uploads"][1][0]["body"]["messages"][-1]["content"]
+    assert state["polls"] >= 2
+    assert sum(tokens) == 20
+
+
+def test_batch_api_translate_resumes_submitted_batch(monkeypatch, tmp_path):
+    import json
+
+    from translator.checkpoint import JobCheckpoint
+
+    monkeypatch.setattr(openai_client.time, "sleep", lambda s: None)
+    api, state = _batch_stub({}, polls=1)
+    checkpoint = JobCheckpoint(str(tmp_path / "jobs.sqlite3"))
+    log = checkpoint.job("job")
+    # submitted before a restart, its results are ready now
+    log.put_batch(0, "batch-1", {"cs:0:0": ("cs", ["Hi", "Bye"])})
+    state["output"] = json.dumps({
+        "custom_id": "cs:0:0",
+        "response": {"status_code": 200, "body": {
+            "choices": [{"message": {"content": "[[SEG1]] Ahoj\n[[SEG2]] Nashle"}}],
+        }},
+    })
+    result = openai_client.batch_api_translate(
+        ["Hi", "Bye"], ["cs"], "en", checkpoint=log, api=api
+    )
+    assert result["cs"] == ["Ahoj", "Nashle"]
+    assert state["uploads"] == []
+    assert log.get_many("cs", ["Hi"]) == {"Hi": "Ahoj"}
+
+
+def test_batch_api_translate_raises_on_failed_batch(monkeypatch):
+    import httpx
+    import pytest
+    from openai import OpenAI
+
+    def handler(request):
+        if request.url.path.endswith("/files"):
+            return httpx.Response(200, json={
+                "id": "f", "object": "file", "bytes": 1, "created_at": 0,
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed",
+            })
+        return httpx.Response(200, json={
+            "id": "b", "object": "batch", "endpoint": "/v1/chat/completions",
+            "input_file_id": "f", "completion_window": "24h", "created_at": 0,
+            "status": "failed",
+        })
+
+    api = OpenAI(
+        api_key="x",
+        base_url="http://stub/v1",
+        http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+    )
+    with pytest.raises(openai_client.TranslationError):
+        openai_client.batch_api_translate(["Hi"], ["cs"], "en", api=api)
+
+
+def _chunk(content=None, finish_reason=None, usage=None):
+    from types import SimpleNamespace
+
+    choices = [] if usage else [SimpleNamespace(
+        delta=SimpleNamespace(content=content), finish_reason=finish_reason
+    )]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def _streaming_create(calls, replies):
+    """Stream ``replies`` in small pieces; a reply ending in ``None`` is cut off."""
+    from types import SimpleNamespace
+
+    def create(*args, **kwargs):
+        assert kwargs["stream"] is True
+        calls.append(kwargs["messages"][-1]["content"])
+        reply = replies[len(calls) - 1]
+
+        def chunks():
+            text = reply.rstrip("\0")
+            for start in range(0, len(text), 4):
+                yield _chunk(text[start:start + 4])
+            if reply.endswith("\0"):
+                raise ConnectionError("stream cut off")
+            yield _chunk(finish_reason="stop")
+            yield _chunk(usage=SimpleNamespace(total_tokens=7))
+
+        return chunks()
+
+    return create
+
+
+def test_batch_translate_streams_segments(monkeypatch):
+    calls = []
+    replies = [
+        "[[SEG1]] A_cs\n[[SEG2]] B_cs\n[[SEG3]] C_\0",
+        "[[SEG1]] C_cs",
+    ]
+    monkeypatch.setattr(
+        openai_client.client.chat.completions, "create", _streaming_create(calls, replies)
+    )
+    progress = []
+    tokens = []
+    stored = []
+
+    class Memory:
+        def get_many(self, texts, *args):
+            return {}
+
+        def put_many(self, pairs, *args):
+            stored.append(dict(pairs))
+
+    result = openai_client.batch_translate(
+        ["A", "B", "C"],
+        ["cs"],
+        "en",
+        progress_callback=progress.append,
+        tokens_callback=tokens.append,
+        delay=None,
+        memory=Memory(),
+        stream=True,
+    )
+    assert result["cs"] == ["A_cs", "B_cs", "C_cs"]
+    # segments were committed one by one, the cut-off one was asked for again
+    assert progress == [33, 66, 100]
+    # the memory is written once per streamed batch, not once per segment
+    assert [pairs for pairs in stored if pairs] == [{"A": "A_cs", "B": "B_cs"}, {"C": "C_cs"}]
+    assert len(calls) == 2
+    assert "[[SEG1]] C" in calls[1] and "[[SEG2]]" not in calls[1]
+    assert tokens == [7]
+
+
+def test_segment_stream_waits_for_the_next_label():
+    received = []
+    segments = openai_client._SegmentStream(2, received.append)
+    for piece in ["[[SEG1]] Ahoj ", "světe\n[[SE", "G2]] Na", "shle"]:
+        segments.feed(_chunk(piece))
+    assert received == [{1: "Ahoj světe"}]
+    segments.feed(_chunk(finish_reason="stop"))
+    assert segments.close() == {1: "Ahoj světe", 2: "Nashle"}
+    assert received[-1] == {2: "Nashle"}
+
+
+def test_async_batch_translate_streams_segments(monkeypatch):
+    calls = []
+    replies = ["[[SEG1]] A_cs\n[[SEG2]] B_\0", "[[SEG1]] B_cs"]
+    sync_create = _streaming_create(calls, replies)
+
+    async def fake_create(*args, **kwargs):
+        chunks = sync_create(*args, **kwargs)
+
+        async def agen():
+            for chunk in chunks:
+                yield chunk
+
+        return agen()
+
+    api = _async_api(fake_create)
+    progress = []
+    result = asyncio.run(
+        openai_client.async_batch_translate(
+            ["A", "B"], ["cs"], "en", progress_callback=progress.append, stream=True,
+            api=api,
+        )
+    )
+    assert result["cs"] == ["A_cs", "B_cs"]
+    assert progress == [50, 100]
+    assert len(calls) == 2 and "A" not in calls[1].split("\n", 1)[1]
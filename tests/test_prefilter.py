@@ -0,0 +1,50 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from translator.prefilter import PassthroughFilter  # noqa: E402
+
+
+def test_classify_passthrough_segments():
+    prefilter = PassthroughFilter()
+    assert prefilter.classify("1 250,50") == "number"
+    assert prefilter.classify("25 %") == "number"
+    assert prefilter.classify("€ 19.99") == "price"
+    assert prefilter.classify("1 290 Kč") == "price"
+    assert prefilter.classify("AB-1234/X") == "sku"
+    assert prefilter.classify("https://example.com/a?b=1") == "url"
+    assert prefilter.classify("info@example.com") == "email"
+    assert prefilter.classify(" – ") == "empty"
+    assert prefilter.classify("[[TAG1]][[TAG2]]") == "empty"
+    assert prefilter.classify("[[TAG1]]42[[TAG2]]") == "number"
+    assert prefilter.classify("€ [[RUN1]]19.99") == "price"
+
+
+def test_classify_keeps_translatable_text():
+    prefilter = PassthroughFilter()
+    for text in [
+        "Hello", "10 apples", "Page 3", "OK", "ABC", "Call [[TAG1]]now",
+        "199 Kč/ks", "5 EUR / day", "10 / den", "2 / pc",
+    ]:
+        assert prefilter.classify(text) is None
+
+
+def test_apply_counts_unique_segments(monkeypatch):
+    from translator import prefilter as prefilter_module
+
+    monkeypatch.setattr(
+        prefilter_module, "count_tokens", lambda texts, model: 3 * len(texts)
+    )
+    prefilter = PassthroughFilter()
+    passthrough = prefilter.apply(["42", "42", "Hello", "www.example.com"], "gpt-4o")
+    assert passthrough == {"42", "www.example.com"}
+    assert prefilter.skipped == 2
+    assert prefilter.tokens == 6
+    assert prefilter.by_rule == {"number": 1, "url": 1}
+
+
+def test_custom_rules():
+    prefilter = PassthroughFilter({"brand": lambda text: text == "ACME"})
+    assert prefilter.classify("ACME") == "brand"
+    assert prefilter.classify("42") is None
@@ -0,0 +1,139 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from translator import scheduler as scheduler_module
+from translator.scheduler import RateLimit, RequestScheduler, TranslationError
+
+
+def _rate_limit_error(retry_after: str | None = None) -> openai.RateLimitError:
+    headers = {"retry-after": retry_after} if retry_after else {}
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("slow down", response=response, body=None)
+
+
+def test_scheduler_bounds_concurrency():
+    sched = RequestScheduler(max_concurrency=2)
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*(sched.run("m", 1, call) for _ in range(6)))
+
+    assert asyncio.run(main()) == ["ok"] * 6
+    assert peak == 2
+
+
+def test_scheduler_bounds_concurrency_across_threads():
+    import threading
+    import time
+
+    sched = RequestScheduler(max_concurrency=2)
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.005)
+        await asyncio.sleep(0.005)
+        with lock:
+            running -= 1
+        return "ok"
+
+    async def job():
+        return await asyncio.gather(*(sched.run("m", 1, call) for _ in range(4)))
+
+    results = []
+    # every job thread runs its own event loop, as asyncio.run does in the app
+    threads = [
+        threading.Thread(target=lambda: results.append(asyncio.run(job())))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [["ok"] * 4] * 3
+    assert peak == 2
+
+
+def test_scheduler_retries_and_honours_retry_after(monkeypatch):
+    sleeps = []
+    now = [0.0]
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        now[0] += delay
+        await real_sleep(0)
+
+    monkeypatch.setattr(scheduler_module.asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(scheduler_module.time, "monotonic", lambda: now[0])
+    sched = RequestScheduler(base_delay=0.001, max_retries=3)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _rate_limit_error("2")
+        return "done"
+
+    assert asyncio.run(sched.run("m", 1, call)) == "done"
+    assert len(attempts) == 3
+    assert sched.retries == 2
+    # the server supplied delay wins over the tiny jittered backoff
+    assert sleeps[0] >= 2
+
+
+def test_scheduler_raises_after_max_retries(monkeypatch):
+    sched = RequestScheduler(base_delay=0, max_retries=1)
+
+    async def call():
+        raise _rate_limit_error()
+
+    with pytest.raises(TranslationError):
+        asyncio.run(sched.run("m", 1, call))
+
+
+def test_scheduler_does_not_retry_client_errors():
+    sched = RequestScheduler(base_delay=0)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(TranslationError):
+        asyncio.run(sched.run("m", 1, call))
+    assert len(attempts) == 1
+
+
+def test_budget_waits_for_request_window():
+    budget = scheduler_module._Budget(RateLimit(requests_per_minute=2, tokens_per_minute=100))
+    budget.record(10, 0.0)
+    budget.record(10, 1.0)
+    assert budget.wait_time(10, 5.0) == pytest.approx(55.0)
+    assert budget.wait_time(10, 60.0) == 0.0
+
+
+def test_budget_waits_for_token_window():
+    budget = scheduler_module._Budget(RateLimit(tokens_per_minute=100))
+    budget.record(60, 0.0)
+    budget.record(30, 10.0)
+    assert budget.wait_time(20, 20.0) == pytest.approx(40.0)
+    assert budget.wait_time(10, 20.0) == 0.0
@@ -0,0 +1,52 @@
+from translator.story_pool import map_stories, story_pool
+from translator.text_extractor import story_template_from_bytes
+
+
+def _write_story(path, words):
+    body = "".join(f"<Content>{w}</Content>" for w in words)
+    path.write_text(f"<Root>{body}</Root>")
+
+
+def test_map_stories_inline_reports_progress():
+    progress = []
+    result = map_stories(divmod, [(7, 2), (9, 4)], 1, lambda d, t: progress.append((d, t)))
+    assert result == [(3, 1), (2, 1)]
+    assert progress == [(1, 2), (2, 2)]
+
+
+def test_map_stories_process_pool_keeps_order(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"Story_{i}.xml"
+        _write_story(path, [f"w{i}a", f"w{i}b"])
+        paths.append(path)
+
+    progress = []
+    templates = map_stories(
+        story_template_from_bytes,
+        [(p.read_bytes(),) for p in paths],
+        2,
+        lambda d, t: progress.append(d),
+    )
+    assert [t.texts for t in templates] == [[f"w{i}a", f"w{i}b"] for i in range(6)]
+    assert sorted(progress) == list(range(1, 7))
+
+    out = templates[3].render(["x", "y"]).decode("utf-8")
+    assert "<Content>x</Content>" in out
+    assert "<Content>y</Content>" in out
+
+
+def test_story_pool_is_shared_and_not_forked(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"Story_{i}.xml"
+        _write_story(path, [f"w{i}"])
+        paths.append(path)
+
+    with story_pool(2) as pool:
+        assert pool._mp_context.get_start_method() != "fork"
+        first = map_stories(story_template_from_bytes, [(p.read_bytes(),) for p in paths[:2]], pool=pool)
+        second = map_stories(story_template_from_bytes, [(p.read_bytes(),) for p in paths[2:]], pool=pool)
+    assert [t.texts for t in first + second] == [[f"w{i}"] for i in range(4)]
+    with story_pool(1) as pool:
+        assert pool is None
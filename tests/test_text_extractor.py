@@ -2,7 +2,12 @@ from lxml import etree
 import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from translator.text_extractor import extract_content_elements, update_content_elements  # noqa: E402
+from translator.text_extractor import StoryTemplate, extract_content_elements  # noqa: E402
+
+
+def _render(xml, translations):
+    template = StoryTemplate.from_tree(etree.ElementTree(etree.fromstring(xml)))
+    return template.render(translations).decode("utf-8")
 
 
 def test_extract_content_elements_ignores_empty():
@@ -31,8 +36,7 @@ def test_extract_and_update_with_markup():
     assert results[0][1] == "Hello[[TAG1]]bold[[TAG2]]!"
     assert results[0][2] == ["<b>", "</b>"]
 
-    update_content_elements(results, ["Ahoj[[TAG1]]tučně[[TAG2]]!"])
-    content = etree.tostring(tree, encoding="unicode")
+    content = _render(xml, ["Ahoj[[TAG1]]tučně[[TAG2]]!"])
     assert "Ahoj<b>tučně</b>!" in content
 
 
@@ -47,20 +51,208 @@ def test_extract_and_update_with_br():
     assert results[0][1] == "Hello[[TAG1]]World"
     assert results[0][2] == ["<br/>"]
 
-    update_content_elements(results, ["Ahoj[[TAG1]]Svete"])
-    content = etree.tostring(tree, encoding="unicode")
+    content = _render(xml, ["Ahoj[[TAG1]]Svete"])
     assert "Ahoj<br/>Svete" in content
 
 
-def test_update_content_elements_escapes_ampersand():
+def test_render_escapes_ampersand():
     xml = """
     <Root>
         <Content>Hello<b>bold</b></Content>
     </Root>
     """
-    tree = etree.fromstring(xml)
-    results = extract_content_elements(tree)
-    update_content_elements(results, ["Hi & [[TAG1]]x[[TAG2]]"])
-    content = etree.tostring(tree, encoding="unicode")
-    etree.fromstring(content)
+    content = _render(xml, ["Hi & [[TAG1]]x[[TAG2]]"])
+    etree.fromstring(content.encode("utf-8"))
     assert "Hi &amp; <b>x</b>" in content
+
+
+def test_story_template_renders_each_language_without_reparsing():
+    xml = """<Root a="1"><Content>Hello<b>bold</b>!</Content><Content> </Content><Content>Two</Content></Root>"""
+    template = StoryTemplate.from_tree(etree.ElementTree(etree.fromstring(xml)))
+    assert template.texts == ["Hello[[TAG1]]bold[[TAG2]]!", "Two"]
+
+    cs = template.render(["Ahoj[[TAG1]]tučně[[TAG2]]!", "Dva & tři"])
+    de = template.render(["Hallo[[TAG1]]fett[[TAG2]]!"])
+    cs_root = etree.fromstring(cs)
+    de_root = etree.fromstring(de)
+    assert etree.tostring(cs_root[0], encoding="unicode", with_tail=False) == "<Content>Ahoj<b>tučně</b>!</Content>"
+    assert cs_root[2].text == "Dva & tři"
+    assert etree.tostring(de_root[0], encoding="unicode", with_tail=False) == "<Content>Hallo<b>fett</b>!</Content>"
+    # a missing translation keeps the source text
+    assert de_root[2].text == "Two"
+    assert cs_root.get("a") == "1"
+
+
+def test_story_template_keeps_xml_valid_with_broken_placeholders():
+    xml = "<Root><Content>Hello<b>bold</b></Content></Root>"
+    template = StoryTemplate.from_tree(etree.ElementTree(etree.fromstring(xml)))
+    out = template.render(["[[TAG2]]Ahoj[[TAG1]]"])
+    root = etree.fromstring(out)
+    assert etree.tostring(root[0], encoding="unicode", with_tail=False) == "<Content>Ahoj<b/></Content>"
+
+
+def test_iter_content_texts_matches_tree_extraction():
+    import io
+    from translator.text_extractor import iter_content_texts
+
+    xml = (
+        '<Root xmlns="urn:x"><P><Content>Hello<b>bold</b>!</Content><Content> </Content></P>'
+        '<P><Content>a &amp; b</Content><Br/><Content>Last</Content></P></Root>'
+    )
+    expected = [(text, tags) for _, text, tags in extract_content_elements(etree.fromstring(xml))]
+    streamed = list(iter_content_texts(io.BytesIO(xml.encode("utf-8"))))
+    assert streamed == expected
+    assert [text for text, _ in streamed] == ["Hello[[TAG1]]bold[[TAG2]]!", "a & b", "Last"]
+
+
+def test_load_zipped_story_templates_opens_archive_once(monkeypatch, tmp_path):
+    import zipfile
+    from translator import text_extractor
+
+    path = tmp_path / "doc.idml"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("Stories/Story_a.xml", "<Story><Content>A</Content></Story>")
+        zf.writestr("Stories/Story_b.xml", "<Story><Content>B</Content><Content>C</Content></Story>")
+    opened = []
+    real_zipfile = zipfile.ZipFile
+
+    def counting_zipfile(*args, **kwargs):
+        opened.append(args[0])
+        return real_zipfile(*args, **kwargs)
+
+    monkeypatch.setattr(text_extractor.zipfile, "ZipFile", counting_zipfile)
+    templates = text_extractor.load_zipped_story_templates(
+        str(path), ["Stories/Story_b.xml", "Stories/Story_a.xml"], stream_threshold=40
+    )
+    assert len(opened) == 1
+    assert isinstance(templates[0], text_extractor.StreamedStory)
+    assert templates[0].texts == ["B", "C"]
+    assert templates[1].texts == ["A"]
+
+
+def test_iter_content_texts_drops_processed_paragraphs(monkeypatch):
+    import io
+    from translator.text_extractor import iter_content_texts
+
+    parsers = []
+    real_iterparse = etree.iterparse
+
+    def recording_iterparse(*args, **kwargs):
+        parsers.append(real_iterparse(*args, **kwargs))
+        return parsers[-1]
+
+    monkeypatch.setattr(etree, "iterparse", recording_iterparse)
+    paragraph = (
+        '<ParagraphStyleRange><CharacterStyleRange><Properties/>'
+        '<Content>Text</Content><Br/></CharacterStyleRange></ParagraphStyleRange>'
+    )
+    xml = f'<Story><Properties/>{paragraph * 500}</Story>'.encode("utf-8")
+    assert len(list(iter_content_texts(io.BytesIO(xml)))) == 500
+    # only the last paragraph is left below the root
+    assert sum(1 for _ in parsers[0].root.iter()) < 10
+
+
+def test_iter_content_texts_accepts_nodes_before_the_root():
+    import io
+    from translator.text_extractor import iter_content_texts
+
+    xml = b'<?xml version="1.0"?><!-- c --><?aid x?><Root><P><Content>A</Content></P><P><Content>B</Content></P></Root>'
+    assert [text for text, _ in iter_content_texts(io.BytesIO(xml))] == ["A", "B"]
+
+
+def test_write_translated_story_streams_in_small_chunks(monkeypatch):
+    import io
+    from translator import text_extractor
+    from translator.text_extractor import iter_content_texts, write_translated_story
+
+    monkeypatch.setattr(text_extractor, "_STREAM_CHUNK", 7)
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Root xmlns="urn:x"><P a="1"><Content>Hello<Br/>you</Content><Content>  </Content>'
+        '<ContentX>keep</ContentX><Content/></P><P><Content>a &amp; b</Content></P></Root>'
+    ).encode("utf-8")
+    segments = list(iter_content_texts(io.BytesIO(xml)))
+    assert [text for text, _ in segments] == ["Hello[[TAG1]]you", "a & b"]
+
+    output = io.BytesIO()
+    write_translated_story(io.BytesIO(xml), output, ["Ahoj[[TAG1]]ty", "a & b <cs>"])
+    result = output.getvalue().decode("utf-8")
+    assert '<P a="1"><Content>Ahoj<Br/>ty</Content><Content>  </Content>' in result
+    assert "<ContentX>keep</ContentX><Content/>" in result
+    assert "<Content>a &amp; b &lt;cs&gt;</Content>" in result
+    etree.fromstring(output.getvalue())
+
+
+def test_write_translated_story_keeps_self_closing_content_with_space():
+    import io
+    from translator.text_extractor import write_translated_story
+
+    xml = (
+        b'<Root><P><Content /><Content>Hello</Content>'
+        b'<Content Note="a/b">Bye</Content></P></Root>'
+    )
+    output = io.BytesIO()
+    write_translated_story(io.BytesIO(xml), output, ["Ahoj", "Nashle"])
+    assert output.getvalue() == (
+        b'<Root><P><Content /><Content>Ahoj</Content>'
+        b'<Content Note="a/b">Nashle</Content></P></Root>'
+    )
+
+
+def test_render_rebuilds_nested_and_namespaced_tags():
+    xml = '<Root xmlns="urn:x"><Content>A<b k="v">B<i>C</i>D</b>E<Br/>F</Content></Root>'
+    results = extract_content_elements(etree.fromstring(xml))
+    assert len(results[0][2]) == 5
+
+    content = _render(xml, ["a[[TAG1]]b[[TAG2]]c[[TAG3]]d[[TAG4]]e[[TAG5]]f"])
+    assert (
+        '<Content>a<b xmlns="urn:x" k="v">b<i>c</i>d</b>e<Br xmlns="urn:x"/>f</Content>'
+    ) in content
+    # text pieces may be empty around adjacent tags
+    content = _render(xml, ["[[TAG1]][[TAG2]]x[[TAG3]][[TAG4]][[TAG5]]"])
+    assert (
+        '<Content><b xmlns="urn:x" k="v"><i>x</i></b><Br xmlns="urn:x"/></Content>'
+    ) in content
+
+
+def test_render_keeps_xml_valid_when_placeholders_are_reordered():
+    content = _render("<Root><Content>Hello<b>bold</b></Content></Root>", ["[[TAG2]]Ahoj[[TAG1]]"])
+    etree.fromstring(content.encode("utf-8"))
+    assert "<Content>Ahoj<b></b></Content>" in content
+
+
+def test_story_template_merges_runs_of_a_paragraph():
+    xml = (
+        '<Story xmlns="urn:x"><ParagraphStyleRange>'
+        '<CharacterStyleRange><Content>Try the </Content></CharacterStyleRange>'
+        '<CharacterStyleRange><Content>new<b>!</b></Content></CharacterStyleRange>'
+        '<CharacterStyleRange><Content> model</Content><Br/><Content>Next line</Content>'
+        '</CharacterStyleRange></ParagraphStyleRange>'
+        '<ParagraphStyleRange><Content>Other</Content></ParagraphStyleRange></Story>'
+    )
+    template = StoryTemplate.from_tree(etree.ElementTree(etree.fromstring(xml)), merge_runs=True)
+    assert template.texts == [
+        "Try the [[RUN1]]new[[TAG1]]![[TAG2]][[RUN2]] model",
+        "Next line",
+        "Other",
+    ]
+
+    out = template.render([
+        "Zkus [[RUN1]]nový[[TAG1]]![[TAG2]][[RUN2]] model",
+        "Další řádek",
+        "Jiný",
+    ])
+    contents = [
+        "".join(el.itertext()) for el in etree.fromstring(out).iter("{urn:x}Content")
+    ]
+    assert contents == ["Zkus ", "nový!", " model", "Další řádek", "Jiný"]
+    assert etree.fromstring(out).find(".//{urn:x}b").text == "!"
+
+
+def test_split_runs_falls_back_to_first_run_without_markers():
+    from translator.text_extractor import join_runs, split_runs
+
+    runs = [("a", []), ("b[[TAG1]]c[[TAG2]]", ["<b>", "</b>"]), ("d", [])]
+    assert split_runs(join_runs(runs), runs) == ["a", "b[[TAG1]]c[[TAG2]]", "d"]
+    # the tags of dropped placeholders are appended by their own runs
+    assert split_runs("A [[TAG1]]B[[TAG2]] D", runs) == ["A B D", "", ""]
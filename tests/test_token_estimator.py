@@ -1,6 +1,11 @@
+from collections import OrderedDict
+
+import pytest
 import tiktoken
+from translator import token_estimator
 from translator.token_estimator import (
     count_tokens,
+    token_counts,
     estimate_cost,
     MODEL_RATES,
     estimate_total_tokens,
@@ -13,6 +18,12 @@ class DummyEncoder:
         return text.split()
 
 
+@pytest.fixture(autouse=True)
+def _fresh_encoder(monkeypatch):
+    monkeypatch.setattr(token_estimator, "_ENCODER", None)
+    monkeypatch.setattr(token_estimator, "_TOKEN_COUNTS", OrderedDict())
+
+
 def test_estimate_cost_matches_manual(monkeypatch):
     monkeypatch.setattr(tiktoken, "get_encoding", lambda name: DummyEncoder())
     texts = ["Hello world", "Bye"]
@@ -62,3 +73,35 @@ def test_estimate_total_tokens_adds_overhead(monkeypatch):
     ]
     assert captured[3] == ['[[SEG1]]', '[[SEG2]]']
     assert tokens > sum(len(c) for c in captured)
+
+
+def test_encoder_is_created_once_and_counts_memoised(monkeypatch):
+    created = []
+    batches = []
+
+    class BatchEncoder(DummyEncoder):
+        def encode_batch(self, texts, num_threads=1):
+            batches.append(list(texts))
+            return [self.encode(t) for t in texts]
+
+    def get_encoding(name):
+        created.append(name)
+        return BatchEncoder()
+
+    monkeypatch.setattr(tiktoken, "get_encoding", get_encoding)
+    assert token_counts(["a b", "c", "a b"], "gpt-4o") == [2, 1, 2]
+    assert token_counts(["c", "d e f"], "gpt-4o") == [1, 3]
+    assert count_tokens(["a b", "d e f"], "gpt-4o") == 5
+
+    assert created == ["cl100k_base"]
+    # only texts not seen before are encoded, each unique text once
+    assert batches == [["a b", "c"]]
+
+
+def test_token_counts_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: DummyEncoder())
+    monkeypatch.setattr(token_estimator, "MAX_MEMO_SIZE", 2)
+    assert token_counts(["a", "b c"], "gpt-4o") == [1, 2]
+    # a full memo keeps the counts of earlier texts until they are returned
+    assert token_counts(["a", "d e f", "b c"], "gpt-4o") == [1, 3, 2]
+    assert list(token_estimator._TOKEN_COUNTS) == ["b c", "d e f"]
@@ -0,0 +1,86 @@
+from translator.translation_memory import TranslationMemory
+
+
+def test_memory_roundtrip_and_counters(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"))
+    memory.put_many({"Hello": "Ahoj"}, "en", "cs", "gpt-4o", "prompt")
+
+    assert memory.get("Hello", "en", "cs", "gpt-4o", "prompt") == "Ahoj"
+    # different model, language or prompt must not match
+    assert memory.get("Hello", "en", "cs", "gpt-4", "prompt") is None
+    assert memory.get("Hello", "en", "de", "gpt-4o", "prompt") is None
+    assert memory.get("Hello", "en", "cs", "gpt-4o", "other") is None
+    assert memory.stats() == {"hits": 1, "misses": 3, "entries": 1}
+
+
+def test_job_memory_counts_its_own_lookups(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"))
+    first, second = memory.job(), memory.job()
+    first.put_many({"Hello": "Ahoj"}, "en", "cs", "gpt-4o", "prompt")
+
+    assert first.get_many(["Hello", "Bye", "Bye"], "en", "cs", "gpt-4o", "prompt") == {
+        "Hello": "Ahoj"
+    }
+    second.get_many(["Hello"], "en", "cs", "gpt-4o", "prompt")
+
+    assert (first.hits, first.misses) == (1, 1)
+    assert (second.hits, second.misses) == (1, 0)
+    assert (memory.hits, memory.misses) == (2, 1)
+
+
+def test_memory_persists_between_instances(tmp_path):
+    path = str(tmp_path / "tm.sqlite3")
+    first = TranslationMemory(path)
+    first.put_many({"Hi": "Ahoj"}, "en", "cs", "gpt-4o", "p")
+    first.close()
+
+    second = TranslationMemory(path)
+    assert second.get_many(["Hi", "Bye"], "en", "cs", "gpt-4o", "p") == {"Hi": "Ahoj"}
+
+
+def test_memory_evicts_least_recently_used(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("translator.translation_memory.time.time", lambda: now[0])
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"), max_entries=2)
+    memory.put_many({"a": "A"}, "en", "cs", "m", "p")
+    now[0] += 1
+    memory.put_many({"b": "B"}, "en", "cs", "m", "p")
+    now[0] += 1
+    assert memory.get("a", "en", "cs", "m", "p") == "A"
+    now[0] += 1
+    memory.put_many({"c": "C"}, "en", "cs", "m", "p")
+
+    assert len(memory) == 2
+    assert memory.get("b", "en", "cs", "m", "p") is None
+    assert memory.get("a", "en", "cs", "m", "p") == "A"
+
+
+def test_memory_evicts_only_past_the_limit(tmp_path, monkeypatch):
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"), max_entries=10)
+    evictions = []
+    real_evict = memory._evict
+
+    def counting_evict():
+        evictions.append(len(evictions))
+        real_evict()
+
+    monkeypatch.setattr(memory, "_evict", counting_evict)
+    for i in range(10):
+        memory.put_many({f"t{i}": f"T{i}"}, "en", "cs", "m", "p")
+    assert evictions == []
+    memory.put_many({"t10": "T10"}, "en", "cs", "m", "p")
+    # a tenth of the limit is freed, so the next writes do not evict again
+    assert len(evictions) == 1 and len(memory) == 9
+    memory.put_many({"t11": "T11"}, "en", "cs", "m", "p")
+    assert len(evictions) == 1
+
+
+def test_memory_drops_expired_entries(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("translator.translation_memory.time.time", lambda: now[0])
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"), max_age=10)
+    memory.put_many({"a": "A"}, "en", "cs", "m", "p")
+    now[0] += 11
+    assert memory.get("a", "en", "cs", "m", "p") is None
+    memory.evict()
+    assert len(memory) == 0
@@ -0,0 +1,89 @@
+"""Runtime adaptation of the batch token size."""
+
+from __future__ import annotations
+
+import asyncio
+
+import openai
+
+# smallest and largest batch size in segment tokens per model
+MODEL_BATCH_BOUNDS: dict[str, tuple[int, int]] = {
+    "gpt-3.5-turbo": (100, 2_000),
+    "gpt-4": (100, 1_500),
+    "gpt-4o": (200, 4_000),
+}
+DEFAULT_BATCH_BOUNDS = (100, 2_000)
+
+
+def failure_kind(exc: BaseException) -> str | None:
+    """Return ``"rate_limit"`` or ``"timeout"`` for errors caused by batch size."""
+    if isinstance(exc, openai.RateLimitError) or getattr(exc, "status_code", None) == 429:
+        return "rate_limit"
+    if isinstance(exc, (openai.APITimeoutError, asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    return None
+
+
+class BatchSizer:
+    """Adapt the batch token size to the observed behaviour of a model.
+
+    The size starts at ``initial`` and stays within the bounds of ``model``
+    from :data:`MODEL_BATCH_BOUNDS`.  It is multiplied by ``shrink`` after a
+    rate limit, a timeout or a reply whose segments do not line up with the
+    batch, and by ``growth`` after a successful request whose latency per
+    token stays within ``tolerance`` of the best one seen so far.  Every size
+    used is kept in :attr:`sizes` for the job metrics.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        initial: int,
+        *,
+        bounds: tuple[int, int] | None = None,
+        growth: float = 1.25,
+        shrink: float = 0.5,
+        tolerance: float = 0.25,
+    ) -> None:
+        self.minimum, self.maximum = bounds or MODEL_BATCH_BOUNDS.get(
+            model, DEFAULT_BATCH_BOUNDS
+        )
+        self.growth = growth
+        self.shrink = shrink
+        self.tolerance = tolerance
+        self.size = max(self.minimum, min(self.maximum, initial))
+        self.sizes = [self.size]
+        self.failures: dict[str, int] = {}
+        self.best_latency: float | None = None
+
+    def _resize(self, size: float) -> None:
+        size = max(self.minimum, min(self.maximum, int(size)))
+        if size != self.size:
+            self.size = size
+            self.sizes.append(size)
+
+    def record_success(self, tokens: int, seconds: float) -> None:
+        """Grow the batches if ``tokens`` took no longer per token than before."""
+        if tokens <= 0:
+            return
+        latency = seconds / tokens
+        if self.best_latency is None or latency < self.best_latency:
+            self.best_latency = latency
+        if latency <= self.best_latency * (1 + self.tolerance):
+            self._resize(self.size * self.growth)
+
+    def record_failure(self, kind: str) -> None:
+        """Shrink the batches after a failure of the given ``kind``."""
+        self.failures[kind] = self.failures.get(kind, 0) + 1
+        self._resize(self.size * self.shrink)
+
+    def metrics(self) -> dict:
+        """Return a summary of the sizes used, suitable for job information."""
+        return {
+            "initial": self.sizes[0],
+            "final": self.size,
+            "min": min(self.sizes),
+            "max": max(self.sizes),
+            "changes": len(self.sizes) - 1,
+            "failures": dict(self.failures),
+        }
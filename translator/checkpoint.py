@@ -0,0 +1,213 @@
+"""Durable job state so interrupted translation jobs can be resumed."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any
+
+
+def _hash(text: str) -> str:
+    """Return a stable hex digest for ``text``."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class JobCheckpoint:
+    """SQLite log of unfinished jobs and the segments they have translated.
+
+    A job is recorded with the parameters needed to start it again when it
+    is queued and removed by :meth:`finish` once its results are written.
+    Every batch is appended through :meth:`put_many` as soon as its reply is
+    parsed, so after a restart :meth:`unfinished` lists the interrupted jobs
+    and :meth:`get_many` returns the segments that need not be sent again.
+    Files submitted to the OpenAI Batch API are recorded by :meth:`put_batch`
+    so a resumed job polls them instead of submitting the segments again.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS segments (
+                job_id TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                key TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                PRIMARY KEY (job_id, target_lang, key)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS batches (
+                job_id TEXT NOT NULL,
+                attempt INTEGER NOT NULL,
+                batch_id TEXT NOT NULL,
+                planned TEXT NOT NULL,
+                PRIMARY KEY (job_id, attempt)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def start(self, job_id: str, params: dict[str, Any]) -> None:
+        """Record ``job_id`` as queued with the JSON-serialisable ``params``."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs VALUES (?, ?, 'queued', ?, ?)
+                ON CONFLICT (job_id) DO UPDATE SET
+                    params = excluded.params, status = 'queued', updated = excluded.updated
+                """,
+                (job_id, json.dumps(params), now, now),
+            )
+            self._conn.commit()
+
+    def set_status(self, job_id: str, status: str) -> None:
+        """Update the recorded status of ``job_id``."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE job_id = ?",
+                (status, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def finish(self, job_id: str) -> None:
+        """Forget ``job_id`` together with its translated segments."""
+        with self._lock:
+            self._conn.execute("DELETE FROM segments WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM batches WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def unfinished(self) -> list[tuple[str, dict[str, Any]]]:
+        """Return ``(job_id, params)`` of recorded jobs in the order they arrived."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, params FROM jobs ORDER BY created"
+            ).fetchall()
+        return [(job_id, json.loads(params)) for job_id, params in rows]
+
+    def put_many(self, job_id: str, target_lang: str, pairs: dict[str, str]) -> None:
+        """Append the translated ``pairs`` of one batch of ``job_id``."""
+        if not pairs:
+            return
+        rows = [(job_id, target_lang, _hash(src), dst) for src, dst in pairs.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def get_many(
+        self, job_id: str, target_lang: str, texts: list[str]
+    ) -> dict[str, str]:
+        """Return the translations of ``texts`` already recorded for ``job_id``."""
+        keys = {_hash(t): t for t in texts}
+        found: dict[str, str] = {}
+        with self._lock:
+            items = list(keys)
+            for start in range(0, len(items), 500):
+                chunk = items[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, translation FROM segments WHERE job_id = ? "
+                    f"AND target_lang = ? AND key IN ({marks})",
+                    [job_id, target_lang, *chunk],
+                ).fetchall()
+                for key, translation in rows:
+                    found[keys[key]] = translation
+        return found
+
+    def put_batch(
+        self,
+        job_id: str,
+        attempt: int,
+        batch_id: str,
+        planned: dict[str, tuple[str, list[str]]],
+    ) -> None:
+        """Record the Batch API ``batch_id`` submitted by ``attempt`` of ``job_id``.
+
+        ``planned`` maps the ``custom_id`` of every request in the batch to
+        its target language and segments.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?)",
+                (job_id, attempt, batch_id, json.dumps(planned)),
+            )
+            self._conn.commit()
+
+    def get_batch(
+        self, job_id: str, attempt: int
+    ) -> tuple[str, dict[str, tuple[str, list[str]]]] | None:
+        """Return ``(batch_id, planned)`` recorded for ``attempt`` or ``None``."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT batch_id, planned FROM batches WHERE job_id = ? AND attempt = ?",
+                (job_id, attempt),
+            ).fetchone()
+        if row is None:
+            return None
+        planned = {
+            custom_id: (lang, batch)
+            for custom_id, (lang, batch) in json.loads(row[1]).items()
+        }
+        return row[0], planned
+
+    def job(self, job_id: str) -> "JobLog":
+        """Return the view of this checkpoint for a single job."""
+        return JobLog(self, job_id)
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class JobLog:
+    """Segments of one job in a :class:`JobCheckpoint`.
+
+    This is what :func:`translator.openai_client.batch_translate` takes as
+    ``checkpoint``; ``restored`` counts the segments read back from it.
+    """
+
+    def __init__(self, checkpoint: JobCheckpoint, job_id: str) -> None:
+        self.checkpoint = checkpoint
+        self.job_id = job_id
+        self.restored = 0
+
+    def get_many(self, target_lang: str, texts: list[str]) -> dict[str, str]:
+        found = self.checkpoint.get_many(self.job_id, target_lang, texts)
+        self.restored += len(found)
+        return found
+
+    def put_many(self, target_lang: str, pairs: dict[str, str]) -> None:
+        self.checkpoint.put_many(self.job_id, target_lang, pairs)
+
+    def put_batch(
+        self, attempt: int, batch_id: str, planned: dict[str, tuple[str, list[str]]]
+    ) -> None:
+        self.checkpoint.put_batch(self.job_id, attempt, batch_id, planned)
+
+    def get_batch(
+        self, attempt: int
+    ) -> tuple[str, dict[str, tuple[str, list[str]]]] | None:
+        return self.checkpoint.get_batch(self.job_id, attempt)
@@ -0,0 +1,157 @@
+"""Fuzzy matching of new segments against the translation memory."""
+
+from __future__ import annotations
+
+import difflib
+import functools
+import hashlib
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover - import cycle only needed for typing
+    from translator.translation_memory import TranslationMemory
+
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+# 8 bands of 4 MinHash rows find pairs whose trigram sets overlap by about
+# 60 % or more with high probability
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+
+_PRIME = (1 << 61) - 1
+_SEEDS = [
+    (
+        int.from_bytes(hashlib.sha256(b"a%d" % i).digest()[:8], "big") % _PRIME or 1,
+        int.from_bytes(hashlib.sha256(b"b%d" % i).digest()[:8], "big") % _PRIME,
+    )
+    for i in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+
+def _normalise(text: str) -> str:
+    return " ".join(NUMBER.sub("#", text.lower()).split())
+
+
+def _shingles(text: str) -> set[int]:
+    text = f" {_normalise(text)} "
+    grams = {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+    return {
+        int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big")
+        for g in grams
+    }
+
+
+@functools.lru_cache(maxsize=65_536)
+def minhash_signature(text: str) -> tuple[int, ...]:
+    """Return the MinHash signature of ``text``.
+
+    The signature does not depend on the translation setup, so it is
+    computed once per text and shared by all target languages.
+    """
+    shingles = _shingles(text)
+    return tuple(min((a * x + b) % _PRIME for x in shingles) for a, b in _SEEDS)
+
+
+def minhash_bands(text: str, scope: str) -> list[int]:
+    """Return the LSH band keys of ``text`` within ``scope``.
+
+    Texts sharing at least one band key are candidate near matches.  Numbers
+    are normalised away first, so segments differing only in a number share
+    every band.  ``scope`` separates translation setups, e.g. languages; it
+    is only mixed into the band keys of the cached :func:`minhash_signature`.
+    """
+    signature = minhash_signature(text)
+    bands = []
+    for band in range(MINHASH_BANDS):
+        rows = signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+        key = f"{scope}\x1f{band}\x1f" + ",".join(map(str, rows))
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        bands.append(int.from_bytes(digest, "big") >> 1)  # fits SQLite INTEGER
+    return bands
+
+
+def similarity(a: str, b: str) -> float:
+    """Return the similarity ratio of ``a`` and ``b`` between 0 and 1."""
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def substitute_numbers(source: str, translation: str, new_source: str) -> str | None:
+    """Adapt ``translation`` of ``source`` to ``new_source`` by swapping numbers.
+
+    Returns ``None`` unless the two sources differ only in their numbers and
+    every changed number occurs exactly once in ``translation``.
+    """
+    if NUMBER.sub("#", source) != NUMBER.sub("#", new_source):
+        return None
+    changes = {
+        old: new
+        for old, new in zip(NUMBER.findall(source), NUMBER.findall(new_source))
+        if old != new
+    }
+    if not changes:
+        return translation
+    found = NUMBER.findall(translation)
+    if any(found.count(old) != 1 for old in changes):
+        return None
+    return NUMBER.sub(lambda m: changes.get(m.group(0), m.group(0)), translation)
+
+
+class FuzzyMatcher:
+    """Find near matches of new segments in a :class:`TranslationMemory`.
+
+    Candidates come from the memory's MinHash band index, so a lookup only
+    compares a segment with the few entries sharing a band.  The best
+    candidate with a :func:`similarity` of at least ``threshold`` is used:
+    when only numbers differ its translation is reused with the numbers
+    substituted, otherwise it is returned as a reference pair for the prompt.
+    """
+
+    def __init__(self, memory: TranslationMemory, threshold: float = 0.75) -> None:
+        self.memory = memory
+        self.threshold = threshold
+        self.lookups = 0
+        self.reused = 0
+        self.referenced = 0
+
+    def match(
+        self,
+        texts: list[str],
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        prompt: str,
+    ) -> tuple[dict[str, str], dict[str, tuple[str, str]]]:
+        """Return reusable translations and ``(source, translation)`` references."""
+        candidates = self.memory.fuzzy_many(texts, source_lang, target_lang, model, prompt)
+        reused: dict[str, str] = {}
+        references: dict[str, tuple[str, str]] = {}
+        for text in texts:
+            scored = [
+                (similarity(text, source), source, translation)
+                for source, translation in candidates.get(text, ())
+                if source != text
+            ]
+            if not scored:
+                continue
+            score, source, translation = max(scored)
+            if score < self.threshold:
+                continue
+            adapted = substitute_numbers(source, translation, text)
+            if adapted is not None:
+                reused[text] = adapted
+            else:
+                references[text] = (source, translation)
+        self.lookups += len(texts)
+        self.reused += len(reused)
+        self.referenced += len(references)
+        return reused, references
+
+    def metrics(self) -> dict:
+        """Return the lookup counts and the share of segments matched."""
+        matched = self.reused + self.referenced
+        return {
+            "lookups": self.lookups,
+            "reused": self.reused,
+            "referenced": self.referenced,
+            "match_rate": round(matched / self.lookups, 3) if self.lookups else 0.0,
+        }
@@ -0,0 +1,233 @@
+"""Job glossaries injected into batch prompts term by term."""
+
+from __future__ import annotations
+
+import csv
+import os
+import re
+from collections import deque
+from typing import Iterable
+
+from lxml import etree
+
+try:  # optional, used to recognise language codes in CSV headers
+    import pycountry  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    pycountry = None
+
+# translation used for every target language when a glossary has no columns
+ANY_LANGUAGE = "*"
+
+LANGUAGE_CODE = re.compile(r"[A-Za-z]{2,3}(?:[-_][A-Za-z0-9]+)*")
+# primary subtags accepted in a CSV header row
+LANGUAGE_CODES = {"cs", "sk", "pl", "en", "de", "hu"}
+if pycountry:
+    LANGUAGE_CODES.update(
+        lang.alpha_2 for lang in pycountry.languages if hasattr(lang, "alpha_2")
+    )
+
+
+def _language(code: str) -> str:
+    """Return the primary subtag of ``code`` in lower case, e.g. ``en-US`` -> ``en``."""
+    return re.split(r"[-_]", code.strip())[0].lower()
+
+
+def _is_language_header(cells: list[str]) -> bool:
+    """Return ``True`` when ``cells`` name a different known language each.
+
+    Terms that look like codes, e.g. ``PDF,PDF`` or ``USB-C,USB-C``, are not
+    mistaken for a header.
+    """
+    if len(cells) < 2 or not all(LANGUAGE_CODE.fullmatch(cell) for cell in cells):
+        return False
+    langs = [_language(cell) for cell in cells]
+    return all(lang in LANGUAGE_CODES for lang in langs) and len(set(langs)) == len(langs)
+
+
+class TermIndex:
+    """Aho–Corasick automaton finding all terms of a glossary in one pass.
+
+    Matching is case-insensitive and only whole words count, so ``pen`` is
+    found in "a pen." but not in "open".  Lookup time depends on the length
+    of the text and the number of matches, not on the number of terms.
+    """
+
+    def __init__(self, terms: Iterable[str]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[str]] = [[]]
+        for term in terms:
+            self._add(term.lower())
+        self._link()
+
+    def _add(self, term: str) -> None:
+        node = 0
+        for char in term:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        if term:
+            self._out[node].append(term)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text: str) -> set[str]:
+        """Return the lower-cased terms occurring in ``text`` as whole words."""
+        text = text.lower()
+        found: set[str] = set()
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for term in self._out[node]:
+                start = end - len(term) + 1
+                before = text[start - 1] if start > 0 else " "
+                after = text[end + 1] if end + 1 < len(text) else " "
+                if not before.isalnum() and not after.isalnum():
+                    found.add(term)
+        return found
+
+
+class Glossary:
+    """Source terms with their required translations per target language.
+
+    ``entries`` maps a source term to translations keyed by language code;
+    the key ``"*"`` applies to every language.  :meth:`terms` returns only the
+    entries occurring in the given segments, so prompts stay small even for
+    large glossaries.  ``injected`` counts the terms returned so far.
+    """
+
+    def __init__(self, entries: dict[str, dict[str, str]]) -> None:
+        self.entries = entries
+        self._terms = {term.lower(): term for term in entries}
+        self.index = TermIndex(self._terms)
+        self.injected = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def terms(
+        self, texts: Iterable[str], langs: list[str]
+    ) -> list[tuple[str, dict[str, str]]]:
+        """Return ``(term, {lang: translation})`` for terms found in ``texts``."""
+        found: set[str] = set()
+        for text in texts:
+            found |= self.index.find(text)
+        result = []
+        for key in sorted(found):
+            term = self._terms[key]
+            translations = self.entries[term]
+            targets = {
+                lang: translations.get(lang, translations.get(ANY_LANGUAGE))
+                for lang in langs
+            }
+            targets = {lang: target for lang, target in targets.items() if target}
+            if targets:
+                result.append((term, targets))
+        self.injected += len(result)
+        return result
+
+
+def _read_csv(path: str, source_lang: str | None) -> dict[str, dict[str, str]]:
+    """Read a CSV glossary.
+
+    A first row made only of distinct known language codes names the
+    language of each column and the column of ``source_lang`` (or the first one) holds the
+    source terms.  Without such a header every row is ``term,translation``
+    and the translation applies to all target languages.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        sample = fh.read(4096)
+        fh.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        rows = [row for row in csv.reader(fh, dialect) if any(cell.strip() for cell in row)]
+    if not rows:
+        return {}
+
+    header = [cell.strip() for cell in rows[0]]
+    if _is_language_header(header):
+        langs = [_language(cell) for cell in header]
+        source = langs.index(source_lang) if source_lang in langs else 0
+        rows = rows[1:]
+    else:
+        langs = [None, ANY_LANGUAGE]
+        source = 0
+
+    entries: dict[str, dict[str, str]] = {}
+    for row in rows:
+        if len(row) <= source or not row[source].strip():
+            continue
+        targets = {
+            lang: cell.strip()
+            for i, (lang, cell) in enumerate(zip(langs, row))
+            if i != source and lang and cell.strip()
+        }
+        if targets:
+            entries.setdefault(row[source].strip(), {}).update(targets)
+    return entries
+
+
+def _read_tbx(path: str, source_lang: str | None) -> dict[str, dict[str, str]]:
+    """Read a TBX termbase; entries without a ``source_lang`` term are skipped.
+
+    Without ``source_lang`` the first term of every entry is its source.
+    """
+    xml_lang = "{http://www.w3.org/XML/1998/namespace}lang"
+    entries: dict[str, dict[str, str]] = {}
+    tree = etree.parse(path)
+    for concept in tree.xpath('//*[local-name()="termEntry" or local-name()="conceptEntry"]'):
+        terms: dict[str, str] = {}
+        for lang_set in concept.xpath('.//*[local-name()="langSet" or local-name()="langSec"]'):
+            lang = _language(lang_set.get(xml_lang) or lang_set.get("lang") or "")
+            term = lang_set.xpath('string(.//*[local-name()="term"])').strip()
+            if lang and term:
+                terms.setdefault(lang, term)
+        source = source_lang if source_lang is not None else next(iter(terms), None)
+        if source not in terms:
+            continue
+        targets = {lang: term for lang, term in terms.items() if lang != source}
+        if targets:
+            entries.setdefault(terms[source], {}).update(targets)
+    return entries
+
+
+def load_glossary(path: str, source_lang: str | None = None) -> Glossary:
+    """Load a ``.csv`` or ``.tbx`` glossary file."""
+    if os.path.splitext(path)[1].lower() == ".tbx":
+        return Glossary(_read_tbx(path, source_lang))
+    return Glossary(_read_csv(path, source_lang))
+
+
+def glossary_block(terms: list[tuple[str, dict[str, str]]]) -> str:
+    """Return prompt lines asking the model to use ``terms``."""
+    if not terms:
+        return ""
+    lines = []
+    for term, targets in terms:
+        if len(targets) == 1:
+            lines.append(f"{term} => {next(iter(targets.values()))}")
+        else:
+            lines.append(
+                f"{term} => " + "; ".join(f"{lang}: {t}" for lang, t in targets.items())
+            )
+    return "Always translate these terms as given:\n" + "\n".join(lines) + "\n\n"
@@ -0,0 +1,123 @@
+"""Conversation context sent along with batch translation requests."""
+
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from typing import Any
+
+from translator.token_estimator import count_tokens
+
+HISTORY_STRATEGIES = ("full", "none", "pairs", "glossary")
+
+REFERENCE_HEADER = "Earlier translations for reference, do not translate them again:"
+
+
+class HistoryPolicy:
+    """Decide which earlier translations accompany every batch request.
+
+    ``strategy`` is one of:
+
+    ``full``
+        the last ``messages`` messages of the conversation, i.e. whole
+        earlier batches and their replies;
+    ``none``
+        only the system prompt and the current batch;
+    ``pairs``
+        the last ``pairs`` translated segments as ``source => translation``
+        lines;
+    ``glossary``
+        up to ``pairs`` of the most recent segments of at most
+        ``glossary_words`` words, a compact list of the terms used so far.
+
+    Prompt tokens and the part of them spent on history are counted for every
+    request so the cost of the context can be reported with :meth:`metrics`.
+    """
+
+    def __init__(
+        self,
+        strategy: str = "full",
+        *,
+        pairs: int = 20,
+        glossary_words: int = 4,
+        messages: int = 6,
+    ) -> None:
+        if strategy not in HISTORY_STRATEGIES:
+            raise ValueError(f"unknown history strategy: {strategy}")
+        self.strategy = strategy
+        self.pairs = pairs
+        self.glossary_words = glossary_words
+        self.messages = messages
+        self.prompt_tokens = 0
+        self.history_tokens = 0
+        self._recent: dict[Any, deque[tuple[str, str]]] = {}
+        self._terms: dict[Any, OrderedDict[str, str]] = {}
+
+    @property
+    def exchanges(self) -> int:
+        """Return how many batches of text one request may hold at most."""
+        if self.strategy == "full":
+            return self.messages // 2 + 1
+        return 1 if self.strategy == "none" else 2
+
+    def _reference(self, key: Any) -> list[dict[str, str]]:
+        if self.strategy == "pairs":
+            entries = self._recent.get(key, ())
+        else:
+            entries = self._terms.get(key, {}).items()
+        lines = [f"{source} => {target}" for source, target in entries]
+        if not lines:
+            return []
+        return [{"role": "user", "content": "\n".join([REFERENCE_HEADER] + lines)}]
+
+    def build(self, translator, prompt: str, model: str) -> list[dict[str, str]]:
+        """Return the messages to send for ``prompt`` on ``translator``."""
+        system = translator.messages[0]
+        if self.strategy == "full":
+            history = translator.messages[1:]
+        elif self.strategy == "none":
+            history = []
+        else:
+            history = self._reference(translator)
+        request = [system] + history + [{"role": "user", "content": prompt}]
+        history_tokens = count_tokens([m["content"] for m in history], model)
+        self.history_tokens += history_tokens
+        self.prompt_tokens += history_tokens + count_tokens(
+            [system["content"], prompt], model
+        )
+        return request
+
+    def record(
+        self, translator, prompt: str, reply: str, pairs: dict[str, str]
+    ) -> None:
+        """Remember the exchange of ``prompt`` and ``reply`` on ``translator``.
+
+        ``pairs`` maps the source segments of the batch to their translations.
+        """
+        if self.strategy == "full":
+            translator.messages.append({"role": "user", "content": prompt})
+            translator.messages.append({"role": "assistant", "content": reply})
+            if len(translator.messages) > self.messages + 1:
+                translator.messages = [
+                    translator.messages[0]
+                ] + translator.messages[-self.messages:]
+        elif self.strategy == "pairs":
+            recent = self._recent.setdefault(translator, deque(maxlen=self.pairs))
+            recent.extend(pairs.items())
+        elif self.strategy == "glossary":
+            terms = self._terms.setdefault(translator, OrderedDict())
+            for source, target in pairs.items():
+                if len(source.split()) <= self.glossary_words:
+                    terms.pop(source, None)
+                    terms[source] = target
+            while len(terms) > self.pairs:
+                terms.popitem(last=False)
+
+    def metrics(self) -> dict:
+        """Return the prompt tokens and the share of them spent on history."""
+        share = self.history_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        return {
+            "strategy": self.strategy,
+            "prompt_tokens": self.prompt_tokens,
+            "history_tokens": self.history_tokens,
+            "history_share": round(share, 3),
+        }
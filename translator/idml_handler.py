@@ -2,57 +2,144 @@
 
 from __future__ import annotations
 
-import os
-import shutil
+import contextlib
+import copy
+import hashlib
+import struct
 import zipfile
 from pathlib import Path
+from typing import BinaryIO, Callable, NamedTuple
 
+MIMETYPE = "mimetype"
+_COPY_CHUNK = 1024 * 1024
 
-class ExtractionError(Exception):
-    """Raised when an invalid archive tries to escape extraction directory."""
 
+class ArchiveMember(NamedTuple):
+    """Member ``name`` of the archive at ``path``, copied still compressed."""
 
-def _safe_extract(zip_ref: zipfile.ZipFile, output_dir: str) -> None:
-    """Extract ``zip_ref`` into ``output_dir`` preventing directory traversal."""
-    for member in zip_ref.namelist():
-        member_path = os.path.join(output_dir, member)
-        abs_target = os.path.realpath(member_path)
-        if not abs_target.startswith(os.path.realpath(output_dir)):
-            raise ExtractionError(member)
-        zip_ref.extract(member, output_dir)
+    path: str
+    name: str
 
 
-def extract_idml(idml_path: str, output_dir: str) -> None:
-    """Extract an IDML file into ``output_dir`` ensuring a clean directory."""
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir, exist_ok=True)
+def story_members(zip_ref: zipfile.ZipFile) -> list[str]:
+    """Return the names of ``Stories/*.xml`` members of an open archive."""
 
-    with zipfile.ZipFile(idml_path, "r") as zip_ref:
-        _safe_extract(zip_ref, output_dir)
-
-
-def find_story_files(unpacked_dir: str | Path) -> list[Path]:
-    """Return the list of ``.xml`` story files contained in ``unpacked_dir``."""
+    return [
+        name
+        for name in zip_ref.namelist()
+        if name.startswith("Stories/") and name.endswith(".xml") and name.count("/") == 1
+    ]
 
-    stories_path = Path(unpacked_dir) / "Stories"
-    return list(stories_path.glob("*.xml"))
 
+def find_story_members(idml_path: str | Path) -> list[str]:
+    """Return the names of ``Stories/*.xml`` members inside ``idml_path``."""
 
-def repackage_idml(source_dir: str | Path, output_idml_path: str | Path) -> None:
-    """Create a new IDML archive from ``source_dir``."""
-
-    with zipfile.ZipFile(output_idml_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for foldername, _subfolders, filenames in os.walk(source_dir):
-            for filename in filenames:
-                filepath = os.path.join(foldername, filename)
-                relpath = os.path.relpath(filepath, source_dir)
-                zipf.write(filepath, arcname=relpath)
+    with zipfile.ZipFile(idml_path, "r") as zip_ref:
+        return story_members(zip_ref)
 
 
-def copy_unpacked_dir(source_dir: str | Path, target_dir: str | Path) -> None:
-    """Copy an unpacked IDML directory to ``target_dir``."""
+def story_digests(idml_path: str | Path) -> dict[str, str]:
+    """Return the SHA-256 of the uncompressed content of every story member."""
 
-    if os.path.exists(target_dir):
-        shutil.rmtree(target_dir)
-    shutil.copytree(source_dir, target_dir)
+    digests = {}
+    with zipfile.ZipFile(idml_path, "r") as zip_ref:
+        for name in story_members(zip_ref):
+            digest = hashlib.sha256()
+            with zip_ref.open(name) as member:
+                for chunk in iter(lambda: member.read(_COPY_CHUNK), b""):
+                    digest.update(chunk)
+            digests[name] = digest.hexdigest()
+    return digests
+
+
+def _copy_raw_member(
+    raw: BinaryIO,
+    info: zipfile.ZipInfo,
+    target: zipfile.ZipFile,
+) -> None:
+    """Copy the still compressed data of ``info`` from ``raw`` to ``target``.
+
+    ``zipfile`` has no public API for this, so the local header is written with
+    ``ZipInfo.FileHeader`` and the entry registered the same way
+    ``ZipFile.writestr`` does it.
+    """
+    raw.seek(info.header_offset)
+    header = raw.read(zipfile.sizeFileHeader)
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    name_length = fields[zipfile._FH_FILENAME_LENGTH]
+    extra_length = fields[zipfile._FH_EXTRA_FIELD_LENGTH]
+    raw.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+
+    new_info = copy.copy(info)
+    # sizes are known up front, so no trailing data descriptor is needed
+    new_info.flag_bits &= ~0x08
+    new_info.extra = zipfile._strip_extra(info.extra, (1,))
+    new_info.header_offset = target.fp.tell()
+    target.fp.write(new_info.FileHeader())
+
+    remaining = info.compress_size
+    while remaining:
+        chunk = raw.read(min(_COPY_CHUNK, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"truncated member {info.filename}")
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+
+    target.filelist.append(new_info)
+    target.NameToInfo[new_info.filename] = new_info
+    target.start_dir = target.fp.tell()
+    target._didModify = True
+
+
+def write_idml(
+    source_idml_path: str | Path,
+    output_idml_path: str | Path,
+    replacements: dict[str, bytes | Callable[[BinaryIO], None] | ArchiveMember] | None = None,
+) -> None:
+    """Write a copy of ``source_idml_path`` with ``replacements`` applied.
+
+    Members not listed in ``replacements`` are copied without being
+    decompressed and recompressed.  A replacement is either the new member
+    content, a callable that streams it into the binary file object it
+    receives or an :class:`ArchiveMember` of another archive, which is
+    copied still compressed as well.  The ``mimetype`` entry is always written first and stored
+    uncompressed as the IDML format requires.
+    """
+
+    replacements = replacements or {}
+    # other archives are opened once and kept open while the copy runs
+    others: dict[str, tuple[zipfile.ZipFile, BinaryIO]] = {}
+    with contextlib.ExitStack() as stack:
+        source = stack.enter_context(zipfile.ZipFile(source_idml_path, "r"))
+        raw = stack.enter_context(open(source_idml_path, "rb"))
+        target = stack.enter_context(
+            zipfile.ZipFile(output_idml_path, "w", zipfile.ZIP_DEFLATED)
+        )
+        if MIMETYPE in source.NameToInfo or MIMETYPE in replacements:
+            data = replacements.get(MIMETYPE)
+            if data is None:
+                data = source.read(MIMETYPE)
+            target.writestr(MIMETYPE, data, compress_type=zipfile.ZIP_STORED)
+        for info in source.infolist():
+            if info.filename == MIMETYPE:
+                continue
+            if info.filename in replacements:
+                new_info = zipfile.ZipInfo(info.filename, info.date_time)
+                new_info.compress_type = zipfile.ZIP_DEFLATED
+                new_info.external_attr = info.external_attr
+                replacement = replacements[info.filename]
+                if isinstance(replacement, ArchiveMember):
+                    if replacement.path not in others:
+                        others[replacement.path] = (
+                            stack.enter_context(zipfile.ZipFile(replacement.path, "r")),
+                            stack.enter_context(open(replacement.path, "rb")),
+                        )
+                    other, other_raw = others[replacement.path]
+                    _copy_raw_member(other_raw, other.getinfo(replacement.name), target)
+                elif callable(replacement):
+                    with target.open(new_info, "w") as dest:
+                        replacement(dest)
+                else:
+                    target.writestr(new_info, replacement)
+            else:
+                _copy_raw_member(raw, info, target)
@@ -0,0 +1,78 @@
+"""Reuse of an earlier translated version of a document."""
+
+from __future__ import annotations
+
+from translator.idml_handler import ArchiveMember, story_digests
+from translator.text_extractor import load_zipped_story_templates
+
+
+class PreviousVersion:
+    """Source and translated outputs of an earlier version of a document.
+
+    ``outputs`` maps target languages to the translated archives produced
+    from ``source_path``.  Stories of a new version are matched by member
+    name: a story whose content hash did not change is copied from the old
+    output of every language as it is, a changed story reuses the old
+    translations of the segments it still contains.
+    """
+
+    def __init__(self, source_path: str, outputs: dict[str, str]) -> None:
+        self.source_path = source_path
+        self.outputs = outputs
+        self.digests = story_digests(source_path)
+        self._output_digests = {
+            lang: story_digests(path) for lang, path in outputs.items()
+        }
+
+    def unchanged(self, idml_path: str, langs: list[str]) -> set[str]:
+        """Return the stories of ``idml_path`` that can be copied for ``langs``.
+
+        A story qualifies when its content equals the old source and every
+        language has an old output containing it.
+        """
+        if any(lang not in self.outputs for lang in langs):
+            return set()
+        same = {
+            member
+            for member, digest in story_digests(idml_path).items()
+            if self.digests.get(member) == digest
+        }
+        for lang in langs:
+            same &= set(self._output_digests[lang])
+        return same
+
+    def member(self, lang: str, member: str) -> ArchiveMember:
+        """Return ``member`` of the old output for ``lang``."""
+        return ArchiveMember(self.outputs[lang], member)
+
+    def translations(
+        self,
+        members: list[str],
+        langs: list[str],
+        stream_threshold: int | None = None,
+        merge_runs: bool = False,
+    ) -> dict[str, dict[str, str]]:
+        """Return old translations per language of the segments of ``members``.
+
+        Segments are paired with their translations by position, so a story
+        whose old output does not have the same number of segments as its
+        old source is skipped.
+        """
+        found: dict[str, dict[str, str]] = {lang: {} for lang in langs}
+        members = [m for m in members if m in self.digests]
+        sources = load_zipped_story_templates(
+            self.source_path, members, stream_threshold, merge_runs
+        )
+        for lang in langs:
+            if lang not in self.outputs:
+                continue
+            present = self._output_digests[lang]
+            pairs = [(m, s) for m, s in zip(members, sources) if m in present]
+            targets = load_zipped_story_templates(
+                self.outputs[lang], [m for m, _ in pairs], stream_threshold, merge_runs
+            )
+            for (_, source), target in zip(pairs, targets):
+                if len(target.texts) == len(source.texts):
+                    for text, translation in zip(source.texts, target.texts):
+                        found[lang].setdefault(text, translation)
+        return found
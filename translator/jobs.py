@@ -0,0 +1,77 @@
+"""Isolation and scheduling helpers for background translation jobs."""
+
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+from typing import Any, Callable
+
+
+class JobWorkspace:
+    """Private working directory of a single translation job.
+
+    Every job gets its own directory below ``root`` so concurrent jobs never
+    share uploaded or intermediate files.  The directory is removed by
+    :meth:`cleanup` or when used as a context manager.
+    """
+
+    def __init__(self, root: str, job_id: str) -> None:
+        self.path = os.path.join(root, job_id)
+        os.makedirs(self.path, exist_ok=True)
+
+    def file(self, name: str) -> str:
+        """Return the path of ``name`` inside the workspace."""
+        return os.path.join(self.path, name)
+
+    def cleanup(self) -> None:
+        """Delete the workspace directory with everything in it."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self) -> "JobWorkspace":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.cleanup()
+
+
+class JobSlots:
+    """Limit how many jobs run at once; the rest wait in arrival order."""
+
+    def __init__(self, slots: int) -> None:
+        self.slots = max(1, slots)
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting: list[object] = []
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def run(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        on_start: Callable[[], None] | None = None,
+    ) -> Any:
+        """Wait for a free slot, then call ``func(*args)`` in this thread."""
+        ticket = object()
+        with self._cond:
+            self._waiting.append(ticket)
+            while self._waiting[0] is not ticket or self._running >= self.slots:
+                self._cond.wait()
+            self._waiting.pop(0)
+            self._running += 1
+            self._cond.notify_all()
+        try:
+            if on_start:
+                on_start()
+            return func(*args)
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
@@ -3,11 +3,29 @@
 from __future__ import annotations
 
 import os
+import re
+import json
 import time
 import asyncio
+import functools
+import itertools
+from typing import Callable, Iterator
 from openai import OpenAI, AsyncOpenAI
 from openai.types.chat import ChatCompletionMessageParam
-from translator.token_estimator import count_tokens
+from translator.token_estimator import (
+    DEFAULT_MODEL_LIMITS,
+    MODEL_LIMITS,
+    count_tokens,
+    token_counts,
+)
+from translator.translation_memory import TranslationMemory
+from translator.prefilter import PassthroughFilter
+from translator.batch_sizer import BatchSizer, failure_kind
+from translator.history import HistoryPolicy
+from translator.glossary import Glossary, glossary_block
+from translator.checkpoint import JobLog
+from translator.fuzzy import FuzzyMatcher
+from translator.scheduler import RequestScheduler, TranslationError
 import httpx
 
 try:
@@ -23,7 +41,6 @@ DEFAULT_PROMPT = (
 )
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 
 def get_remaining_credit() -> float | None:
@@ -147,42 +164,568 @@ def translate_text(
         return text
 
 
-def _split_batches(texts: list[str], max_tokens: int, model: str) -> list[list[str]]:
-    """Split ``texts`` so each batch stays within the ``max_tokens`` limit."""
-    batches: list[list[str]] = []
+# approximate tokens of a "[[SEGn]] " label and line break per segment
+SEGMENT_MARKER_TOKENS = 6
+# approximate tokens of the "=> " line of an earlier translation in an edit prompt
+EDIT_MARKER_TOKENS = 2
+
+
+def _batch_budget(
+    max_tokens: int,
+    model: str,
+    overhead: int = 0,
+    outputs: int = 1,
+    exchanges: int | None = None,
+) -> int:
+    """Return the largest cost of a batch of segments sent to ``model``.
+
+    A request carries the system prompt and instructions (``overhead``) and
+    the batch, together with earlier history of up to ``exchanges - 1``
+    batches and replies (by default ``HISTORY_LIMIT`` messages), while the
+    reply repeats the batch once per language in ``outputs``.  The budget
+    keeps the whole exchange within the model's context window and the reply
+    within its output limit, and never exceeds ``max_tokens``.
+    """
+    context, output_limit = MODEL_LIMITS.get(model, DEFAULT_MODEL_LIMITS)
+    if exchanges is None:
+        exchanges = ChatTranslator.HISTORY_LIMIT // 2 + 1
+    fits_context = (context // exchanges - overhead) // (1 + outputs)
+    return max(1, min(max_tokens, fits_context, output_limit // outputs))
+
+
+def _iter_batches(
+    texts: list[str],
+    budget: Callable[[], int],
+    model: str,
+    *,
+    overhead: int = 0,
+    outputs: int = 1,
+    stories: dict[str, object] | None = None,
+    exchanges: int | None = None,
+    references: dict[str, tuple[str, str]] | None = None,
+) -> Iterator[list[str]]:
+    """Yield batches of ``texts`` that fit the request and reply budget.
+
+    Every segment costs its tokens plus ``SEGMENT_MARKER_TOKENS`` for its
+    label, and batches are filled in document order up to
+    :func:`_batch_budget` of the size returned by ``budget()``.  ``budget``
+    is called whenever a batch starts, so a size adapted while the previous
+    batch was translated applies to the next one.  ``stories`` maps texts to
+    the story they come from; a story that would straddle two batches but
+    fits in one starts a new batch so related segments are translated
+    together.  ``exchanges`` is passed to :func:`_batch_budget`.  With
+    ``references`` every text is sent in an :func:`_edit_prompt` and the
+    earlier translation shown with it counts toward its cost.
+    """
+    costs = [count + SEGMENT_MARKER_TOKENS for count in token_counts(texts, model)]
+    if references is not None:
+        shown = token_counts([references[t][1] for t in texts], model)
+        costs = [cost + count + EDIT_MARKER_TOKENS for cost, count in zip(costs, shown)]
+    run_costs: list[int] = []
+    if stories is not None:
+        # cost of the run of same-story segments starting at every position
+        run = 0
+        for i in range(len(texts) - 1, -1, -1):
+            same = i + 1 < len(texts) and stories.get(texts[i]) == stories.get(texts[i + 1])
+            run = costs[i] + (run if same else 0)
+            run_costs.append(run)
+        run_costs.reverse()
+
     current: list[str] = []
     tokens = 0
-    for text in texts:
-        count = count_tokens([text], model)
-        if current and tokens + count > max_tokens:
-            batches.append(current)
+    limit = 0
+    for i, (text, cost) in enumerate(zip(texts, costs)):
+        if not current:
+            limit = _batch_budget(budget(), model, overhead, outputs, exchanges)
+        full = tokens + cost > limit
+        if run_costs and i and stories.get(text) != stories.get(texts[i - 1]):
+            # start a story that fits one batch in a new batch, not halfway
+            full = full or tokens + run_costs[i] > limit >= run_costs[i]
+        if current and full:
+            yield current
             current = []
             tokens = 0
+            limit = _batch_budget(budget(), model, overhead, outputs, exchanges)
         current.append(text)
-        tokens += count
+        tokens += cost
     if current:
-        batches.append(current)
-    return batches
+        yield current
+
+
+def _split_batches(
+    texts: list[str],
+    max_tokens: int,
+    model: str,
+    **kwargs,
+) -> list[list[str]]:
+    """Split ``texts`` into batches of at most ``max_tokens``.
+
+    Keyword arguments are passed to :func:`_iter_batches`.
+    """
+    return list(_iter_batches(texts, lambda: max_tokens, model, **kwargs))
 
 
-def _parse_segments(translated: str) -> list[str]:
-    """Return the ordered list of segments from a marked-up translation."""
-    import re
+def _parse_segments(translated: str, size: int) -> dict[int, str]:
+    """Return the segments of a reply labelled ``[[SEGn]]`` keyed by ``n``.
 
+    Segments are matched by their label rather than their position, so a
+    dropped or reordered line does not shift the following ones.  Only labels
+    ``1..size`` are kept and the first of duplicate labels wins; the caller
+    re-requests whatever is missing.
+    """
     pattern = re.compile(r"\[\[SEG(\d+)\]\]")
     parts = pattern.split(translated)
-    results: list[str] = []
+    results: dict[int, str] = {}
     i = 1
     while i < len(parts):
-        text = parts[i + 1]
+        index, text = int(parts[i]), parts[i + 1]
         if text.startswith(" "):
             text = text[1:]
         text = text.rstrip("\r\n")
-        results.append(text)
+        if 1 <= index <= size:
+            results.setdefault(index, text)
         i += 2
     return results
 
 
+SEGMENT_LABEL = re.compile(r"\[\[SEG\d+\]\]")
+
+
+class _SegmentStream:
+    """Parse a streamed ``[[SEGn]]`` reply segment by segment.
+
+    A segment is complete once the label of the next one has arrived, and the
+    last one once the stream finished normally; ``on_segment`` receives every
+    newly completed ``{n: text}``.  After a cut-off stream the unfinished last
+    segment is dropped so the caller re-requests it.  The chunks' ``usage``
+    is kept, so the stream can stand in for a response when recording it.
+    """
+
+    def __init__(self, size: int, on_segment: Callable[[dict[int, str]], None]) -> None:
+        self.size = size
+        self.on_segment = on_segment
+        self.parsed: dict[int, str] = {}
+        self.text = ""
+        self.usage = None
+        self.finished = False
+        self._tail = ""
+
+    def feed(self, chunk) -> None:
+        """Add one streamed completion chunk."""
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        for choice in chunk.choices:
+            content = choice.delta.content
+            if content:
+                self.text += content
+                self._tail += content
+                last = None
+                for last in SEGMENT_LABEL.finditer(self._tail):
+                    pass
+                if last is not None and last.start() > 0:
+                    self._emit(self._tail[:last.start()])
+                    self._tail = self._tail[last.start():]
+            if choice.finish_reason == "stop":
+                self.finished = True
+
+    def _emit(self, text: str) -> None:
+        fresh = {
+            index: segment
+            for index, segment in _parse_segments(text, self.size).items()
+            if index not in self.parsed
+        }
+        if fresh:
+            self.parsed.update(fresh)
+            self.on_segment(fresh)
+
+    def close(self) -> dict[int, str]:
+        """End the stream and return all segments received."""
+        if self.finished:
+            self._emit(self._tail)
+        self._tail = ""
+        return self.parsed
+
+
+def _prefill_from_memory(
+    memory: TranslationMemory | None,
+    translator: ChatTranslator,
+    texts: list[str],
+    source_lang: str,
+    target_lang: str,
+) -> dict[str, str]:
+    """Fill ``translator.cache`` with ``texts`` already stored in ``memory``."""
+    if memory is None:
+        return {}
+    found = memory.get_many(
+        texts,
+        source_lang,
+        target_lang,
+        translator.model,
+        translator.messages[0]["content"],
+    )
+    translator.cache.update(found)
+    return found
+
+
+def _prefill_from_checkpoint(
+    checkpoint: JobLog | None,
+    translator: ChatTranslator,
+    texts: list[str],
+    target_lang: str,
+) -> dict[str, str]:
+    """Fill ``translator.cache`` with ``texts`` translated before a restart."""
+    if checkpoint is None:
+        return {}
+    found = checkpoint.get_many(target_lang, texts)
+    translator.cache.update(found)
+    return found
+
+
+def _match_fuzzy(
+    fuzzy: FuzzyMatcher | None,
+    translator: ChatTranslator,
+    texts: list[str],
+    source_lang: str,
+    target_lang: str,
+) -> tuple[dict[str, str], dict[str, tuple[str, str]]]:
+    """Return near matches of ``texts`` as reusable translations and references."""
+    if fuzzy is None or not texts:
+        return {}, {}
+    return fuzzy.match(
+        texts,
+        source_lang,
+        target_lang,
+        translator.model,
+        translator.messages[0]["content"],
+    )
+
+
+def _prefill_passthrough(
+    prefilter: PassthroughFilter | None,
+    translators: dict[str, ChatTranslator],
+    texts: list[str],
+    model: str,
+) -> set[str]:
+    """Copy segments accepted by ``prefilter`` verbatim into every cache."""
+    if prefilter is None:
+        return set()
+    passthrough = prefilter.apply(texts, model)
+    for translator in translators.values():
+        for text in passthrough:
+            translator.cache[text] = text
+    return passthrough
+
+
+def _store_in_memory(
+    memory: TranslationMemory | None,
+    translator: ChatTranslator,
+    pairs: dict[str, str],
+    source_lang: str,
+    target_lang: str,
+) -> None:
+    """Persist freshly translated ``pairs`` to ``memory``."""
+    if memory is None or not pairs:
+        return
+    memory.put_many(
+        pairs,
+        source_lang,
+        target_lang,
+        translator.model,
+        translator.messages[0]["content"],
+    )
+
+
+def _batch_prompt(batch: list[str]) -> str:
+    """Return the user prompt asking for translation of ``batch``."""
+    marked = "\n".join(f"[[SEG{i + 1}]] {t}" for i, t in enumerate(batch))
+    return (
+        f"Translate the following segments labelled [[SEG1]]..[[SEG{len(batch)}]]. "
+        "Provide the translations on separate lines using the same labels:\n" + marked
+    )
+
+
+def _edit_prompt(batch: list[str], references: dict[str, tuple[str, str]]) -> str:
+    """Return the user prompt asking to adapt earlier translations for ``batch``.
+
+    Every segment is followed by the translation of its near match from
+    ``references``, which the model edits instead of translating anew.
+    """
+    marked = "\n".join(
+        f"[[SEG{i + 1}]] {t}\n=> {references[t][1]}" for i, t in enumerate(batch)
+    )
+    return (
+        f"Each segment labelled [[SEG1]]..[[SEG{len(batch)}]] is followed by the "
+        "translation of a similar segment. Edit that translation to match the "
+        "segment, changing only what differs. Provide the edited translations "
+        "on separate lines using the same labels:\n" + marked
+    )
+
+
+def _multi_batch_prompt(batch: list[str], target_langs: list[str]) -> str:
+    """Return a prompt asking for ``batch`` in all ``target_langs`` at once."""
+    marked = "\n".join(f"[[SEG{i + 1}]] {t}" for i, t in enumerate(batch))
+    langs = ", ".join(
+        f"{lang} ({LANGUAGE_MAP.get(lang, lang)})" for lang in target_langs
+    )
+    return (
+        f"Translate the following segments labelled [[SEG1]]..[[SEG{len(batch)}]] "
+        f"into each of these languages: {langs}. "
+        "For every segment provide one line per language labelled with the "
+        f"segment number and language code, e.g. [[SEG1:{target_langs[0]}]]:\n"
+        f"{marked}"
+    )
+
+
+def _with_terms(
+    glossary: Glossary | None, batch: list[str], langs: list[str], prompt: str
+) -> str:
+    """Prefix ``prompt`` with the ``glossary`` terms occurring in ``batch``."""
+    if glossary is None:
+        return prompt
+    return glossary_block(glossary.terms(batch, langs)) + prompt
+
+
+def _fanout_translator(
+    source_lang: str,
+    target_langs: list[str],
+    system_prompt: str | None,
+    model: str,
+) -> ChatTranslator:
+    """Return a translator whose conversation covers all ``target_langs``."""
+    names = ", ".join(LANGUAGE_MAP.get(lang, lang) for lang in target_langs)
+    return ChatTranslator(source_lang, names, system_prompt, model)
+
+
+def _parse_language_segments(
+    translated: str, target_langs: list[str], size: int
+) -> dict[str, dict[int, str]]:
+    """Demultiplex a reply labelled ``[[SEGn:lang]]`` into per-language segments.
+
+    Only labels for the requested languages and segment numbers ``1..size`` are
+    kept; the caller decides what to do with anything missing.
+    """
+    pattern = re.compile(r"\[\[SEG(\d+):([A-Za-z_-]+)\]\]")
+    parts = pattern.split(translated)
+    results: dict[str, dict[int, str]] = {lang: {} for lang in target_langs}
+    i = 1
+    while i < len(parts):
+        index, lang, text = int(parts[i]), parts[i + 1], parts[i + 2]
+        if text.startswith(" "):
+            text = text[1:]
+        text = text.rstrip("\r\n")
+        if lang in results and 1 <= index <= size:
+            results[lang].setdefault(index, text)
+        i += 3
+    return results
+
+
+def _record_latency(sizer: BatchSizer | None, response, seconds: float) -> None:
+    """Report how long ``response`` took to ``sizer`` if it carries usage."""
+    usage = getattr(response, "usage", None)
+    if sizer and usage:
+        sizer.record_success(getattr(usage, "total_tokens", 0), seconds)
+
+
+def _record_fanout(
+    history: HistoryPolicy,
+    fanout: ChatTranslator,
+    prompt: str,
+    reply: str,
+    batch: list[str],
+    first: dict[int, str],
+) -> None:
+    """Remember a multi-language exchange, keeping pairs of the first language."""
+    pairs = {t: first[i] for i, t in enumerate(batch, 1) if i in first}
+    history.record(fanout, prompt, reply, pairs)
+
+
+def _check_alignment(sizer: BatchSizer | None, size: int, parsed: list[int]) -> None:
+    """Shrink batches when a reply did not return all ``size`` segments."""
+    if sizer and any(count != size for count in parsed):
+        sizer.record_failure("mismatch")
+
+
+class _TranslationRun:
+    """Translators and progress of one call of the batch translation functions.
+
+    Shared by :func:`batch_translate`, :func:`async_batch_translate` and
+    :func:`batch_api_translate`.  Progress counts every occurrence of a text
+    in every language; :meth:`commit` fills a translator cache and reports
+    progress, :meth:`persist` writes pairs to ``memory`` and ``checkpoint``.
+    :meth:`plan` cuts batches at the current size of ``sizer``, or
+    ``max_tokens`` without one, for requests holding up to ``exchanges``
+    batches of text.  ``references`` holds the near matches per language
+    found by :meth:`prefill`.
+    """
+
+    def __init__(
+        self,
+        texts: list[str],
+        target_langs: list[str],
+        source_lang: str,
+        system_prompt: str | None,
+        model: str,
+        *,
+        memory: TranslationMemory | None,
+        checkpoint: JobLog | None,
+        stories: list[object] | None,
+        progress_callback: callable | None,
+        max_tokens: int = 800,
+        sizer: BatchSizer | None = None,
+        exchanges: int = 1,
+    ) -> None:
+        self.texts = texts
+        self.source_lang = source_lang
+        self.model = model
+        self.max_tokens = max_tokens
+        self.sizer = sizer
+        self.exchanges = exchanges
+        self._overheads: dict[str, int] = {}
+        self.references: dict[str, dict[str, tuple[str, str]]] = {}
+        self.memory = memory
+        self.checkpoint = checkpoint
+        self.progress_callback = progress_callback
+        self.translators = {
+            lang: ChatTranslator(source_lang, lang, system_prompt, model)
+            for lang in target_langs
+        }
+        self.counts: dict[str, int] = {}
+        for t in texts:
+            self.counts[t] = self.counts.get(t, 0) + 1
+        self.total = max(1, len(texts) * len(target_langs))
+        self.done = 0
+        self.unique_texts = list(dict.fromkeys(texts))
+        self.story_of: dict[str, object] | None = None
+        if stories is not None:
+            self.story_of = {}
+            for text, story in zip(texts, stories):
+                self.story_of.setdefault(text, story)
+
+    def _report(self) -> None:
+        if self.progress_callback:
+            self.progress_callback(int(self.done / self.total * 100))
+
+    def plan(
+        self,
+        pending: list[str],
+        prompt: str,
+        outputs: int = 1,
+        references: dict[str, tuple[str, str]] | None = None,
+    ) -> Iterator[list[str]]:
+        """Return the batches of ``pending`` for requests built like ``prompt``."""
+        if prompt not in self._overheads:
+            system = next(iter(self.translators.values())).messages[0]["content"]
+            self._overheads[prompt] = count_tokens([system, prompt], self.model)
+        return _iter_batches(
+            pending,
+            lambda: self.sizer.size if self.sizer else self.max_tokens,
+            self.model,
+            overhead=self._overheads[prompt],
+            outputs=outputs,
+            stories=self.story_of,
+            exchanges=self.exchanges,
+            references=references,
+        )
+
+    def plan_language(self, lang: str, pending: list[str]) -> Iterator[list[str]]:
+        """Return the batches of ``pending`` for requests in ``lang`` alone.
+
+        Near matches with a reference are batched apart from the other
+        segments, for the edit prompts returned by :meth:`prompt`.
+        """
+        references = self.references.get(lang, {})
+        return itertools.chain(
+            self.plan([t for t in pending if t not in references], _batch_prompt([])),
+            self.plan(
+                [t for t in pending if t in references],
+                _edit_prompt([], {}),
+                references=references,
+            ),
+        )
+
+    def prompt(self, lang: str, batch: list[str]) -> str:
+        """Return the user prompt of a request for ``batch`` in ``lang`` alone."""
+        references = self.references.get(lang, {})
+        if batch and all(t in references for t in batch):
+            return _edit_prompt(batch, references)
+        return _batch_prompt(batch)
+
+    def stream_for(self, lang: str, batch: list[str]) -> _SegmentStream:
+        """Return a stream committing the segments of ``batch`` as they arrive.
+
+        Segments reach the cache and the progress as soon as they are
+        complete; the caller persists the batch once the stream ends.
+        """
+        return _SegmentStream(
+            len(batch),
+            lambda fresh: self.commit(
+                lang, {batch[i - 1]: t for i, t in fresh.items()}, persist=False
+            ),
+        )
+
+    def commit(self, lang: str, pairs: dict[str, str], persist: bool = True) -> None:
+        """Cache ``pairs`` for ``lang`` and report progress for each of them."""
+        translator = self.translators[lang]
+        for original, translated in pairs.items():
+            translator.cache[original] = translated
+            self.done += self.counts.get(original, 1)
+            self._report()
+        if persist:
+            self.persist(lang, pairs)
+
+    def persist(self, lang: str, pairs: dict[str, str]) -> None:
+        """Write ``pairs`` for ``lang`` to the memory and the checkpoint."""
+        _store_in_memory(
+            self.memory, self.translators[lang], pairs, self.source_lang, lang
+        )
+        if self.checkpoint is not None:
+            self.checkpoint.put_many(lang, pairs)
+
+    def prefill(
+        self, prefilter: PassthroughFilter | None, fuzzy: FuzzyMatcher | None
+    ) -> None:
+        """Fill the caches before any request and collect the fuzzy references.
+
+        Passthrough segments come first, then the checkpoint, the memory and
+        the fuzzy matches reused with substituted numbers.  Reused matches are
+        guesses, so they are not persisted.
+        """
+        passthrough = _prefill_passthrough(
+            prefilter, self.translators, self.unique_texts, self.model
+        )
+        self.done += sum(self.counts[t] for t in passthrough) * len(self.translators)
+        lookup = [t for t in self.unique_texts if t not in passthrough]
+        for lang, translator in self.translators.items():
+            restored = _prefill_from_checkpoint(self.checkpoint, translator, lookup, lang)
+            for original in restored:
+                self.done += self.counts.get(original, 1)
+            for original in _prefill_from_memory(
+                self.memory,
+                translator,
+                [t for t in lookup if t not in restored],
+                self.source_lang,
+                lang,
+            ):
+                self.done += self.counts.get(original, 1)
+            reused, self.references[lang] = _match_fuzzy(
+                fuzzy,
+                translator,
+                [t for t in lookup if t not in translator.cache],
+                self.source_lang,
+                lang,
+            )
+            self.commit(lang, reused, persist=False)
+        if self.done:
+            self._report()
+
+    def results(self) -> dict[str, list[str]]:
+        """Return the translation of every text per language, source if missing."""
+        return {
+            lang: [translator.cache.get(text, text) for text in self.texts]
+            for lang, translator in self.translators.items()
+        }
+
+
 def batch_translate(
     texts: list[str],
     target_langs: list[str],
@@ -194,64 +737,141 @@ def batch_translate(
     max_tokens: int = 800,
     delay: float | None = 1.0,
     model: str = "gpt-4o",
+    memory: TranslationMemory | None = None,
+    multi_language: bool = False,
+    prefilter: PassthroughFilter | None = None,
+    stories: list[object] | None = None,
+    sizer: BatchSizer | None = None,
+    history: HistoryPolicy | None = None,
+    glossary: Glossary | None = None,
+    checkpoint: JobLog | None = None,
+    fuzzy: FuzzyMatcher | None = None,
+    stream: bool = False,
 ) -> dict[str, list[str]]:
-    """Translate ``texts`` into ``target_langs`` using OpenAI in batches."""
-
-    results = {lang: [] for lang in target_langs}
-    translators = {
-        lang: ChatTranslator(source_lang, lang, system_prompt, model)
-        for lang in target_langs
-    }
-
-    counts: dict[str, int] = {}
-    for t in texts:
-        counts[t] = counts.get(t, 0) + 1
-
-    total = max(1, len(texts) * len(target_langs))
-    done = 0
-
-    unique_texts = list(dict.fromkeys(texts))
-
-    for lang, translator in translators.items():
-        to_translate = [t for t in unique_texts if t not in translator.cache]
-        for batch in _split_batches(to_translate, max_tokens, model):
-            marked = "\n".join(f"[[SEG{i + 1}]] {t}" for i, t in enumerate(batch))
-            prompt = (
-                f"Translate the following segments labelled [[SEG1]]..[[SEG{len(batch)}]]. "
-                "Provide the translations on separate lines using the same labels:\n" + marked
-            )
-            translator.messages.append({"role": "user", "content": prompt})
-            try:
+    """Translate ``texts`` into ``target_langs`` using OpenAI in batches.
+
+    Segments found by ``prefilter``, ``checkpoint``, ``memory`` or ``fuzzy``
+    are filled in without a request.  The rest are sent in batches labelled
+    ``[[SEGn]]`` of up to ``max_tokens`` (or the current size of ``sizer``),
+    one request per language or, with ``multi_language``, one for all of
+    them.  Segments missing from a reply are requested once more and keep
+    their source text if they are still missing.
+    """
+    if history is None:
+        history = HistoryPolicy(messages=ChatTranslator.HISTORY_LIMIT)
+
+    run = _TranslationRun(
+        texts,
+        target_langs,
+        source_lang,
+        system_prompt,
+        model,
+        memory=memory,
+        checkpoint=checkpoint,
+        stories=stories,
+        progress_callback=progress_callback,
+        max_tokens=max_tokens,
+        sizer=sizer,
+        exchanges=history.exchanges,
+    )
+    translators = run.translators
+    unique_texts = run.unique_texts
+
+    def _send(
+        translator: ChatTranslator, prompt: str, segments: _SegmentStream | None = None
+    ) -> str:
+        # an empty reply stands for a failed request; a stream cut off
+        # partway returns what arrived before
+        messages = history.build(translator, prompt, model)
+        try:
+            started = time.monotonic()
+            if segments is None:
                 response = client.chat.completions.create(
                     model=model,
-                    messages=translator.messages,
+                    messages=messages,
                     temperature=0.3,
                 )
-                if tokens_callback and getattr(response, "usage", None):
-                    tokens_callback(getattr(response.usage, "total_tokens", 0))
                 reply = response.choices[0].message.content.strip("\n")
-                translator.messages.append({"role": "assistant", "content": reply})
-                if len(translator.messages) > ChatTranslator.HISTORY_LIMIT + 1:
-                    translator.messages = [
-                        translator.messages[0]
-                    ] + translator.messages[-ChatTranslator.HISTORY_LIMIT:]
-            except Exception as e:  # pragma: no cover - network errors
-                print(f"❌ Chyba při překladu: {e}")
-                reply = "\n".join(batch)
-
-            translations = _parse_segments(reply)
-            for original, translated in zip(batch, translations):
-                translator.cache[original] = translated
-                done += counts.get(original, 1)
-                if progress_callback:
-                    progress_callback(int(done / total * 100))
-            if delay:
-                time.sleep(delay)
-
-    for text in texts:
+            else:
+                for chunk in client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.3,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                ):
+                    segments.feed(chunk)
+                segments.close()
+                response = segments
+                reply = segments.text.strip("\n")
+            _record_latency(sizer, response, time.monotonic() - started)
+            if tokens_callback and getattr(response, "usage", None):
+                tokens_callback(getattr(response.usage, "total_tokens", 0))
+        except Exception as e:  # pragma: no cover - network errors
+            print(f"❌ Chyba při překladu: {e}")
+            kind = failure_kind(e)
+            if sizer and kind:
+                sizer.record_failure(kind)
+            reply = ""
+            if segments is not None:
+                segments.close()
+                reply = segments.text.strip("\n")
+        if delay:
+            time.sleep(delay)
+        return reply
+
+    def translate_batch(lang: str, batch: list[str], follow_up: bool = True) -> None:
+        prompt = _with_terms(glossary, batch, [lang], run.prompt(lang, batch))
+        segments = run.stream_for(lang, batch) if stream else None
+        reply = _send(translators[lang], prompt, segments)
+        if segments is not None:
+            run.persist(lang, {batch[i - 1]: t for i, t in segments.parsed.items()})
+        if not reply:
+            return
+        parsed = segments.parsed if segments else _parse_segments(reply, len(batch))
+        _check_alignment(sizer, len(batch), [len(parsed)])
+        pairs = {t: parsed[i] for i, t in enumerate(batch, 1) if i in parsed}
+        history.record(translators[lang], prompt, reply, pairs)
+        if segments is None:
+            run.commit(lang, pairs)
+        # only the segments missing from the reply are asked for once more
+        missing = [t for i, t in enumerate(batch, 1) if i not in parsed]
+        if follow_up:
+            for retry in run.plan_language(lang, missing):
+                translate_batch(lang, retry, follow_up=False)
+
+    run.prefill(prefilter, fuzzy)
+
+    if multi_language and len(target_langs) > 1:
+        fanout = _fanout_translator(source_lang, target_langs, system_prompt, model)
+        pending = [
+            t for t in unique_texts
+            if any(t not in tr.cache for tr in translators.values())
+        ]
+        multi_prompt = _multi_batch_prompt([], target_langs)
+        for batch in run.plan(pending, multi_prompt, len(target_langs)):
+            prompt = _with_terms(
+                glossary, batch, target_langs, _multi_batch_prompt(batch, target_langs)
+            )
+            reply = _send(fanout, prompt)
+            parsed = _parse_language_segments(reply, target_langs, len(batch))
+            if reply:
+                _check_alignment(sizer, len(batch), [len(p) for p in parsed.values()])
+                _record_fanout(history, fanout, prompt, reply, batch, parsed[target_langs[0]])
+            for lang in target_langs:
+                cache = translators[lang].cache
+                wanted = [(i, t) for i, t in enumerate(batch, 1) if t not in cache]
+                run.commit(lang, {t: parsed[lang][i] for i, t in wanted if i in parsed[lang]})
+                missing = [t for i, t in wanted if i not in parsed[lang]]
+                for retry in run.plan_language(lang, missing):
+                    translate_batch(lang, retry, follow_up=False)
+    else:
         for lang, translator in translators.items():
-            results[lang].append(translator.cache.get(text, text))
-    return results
+            to_translate = [t for t in unique_texts if t not in translator.cache]
+            for batch in run.plan_language(lang, to_translate):
+                translate_batch(lang, batch)
+
+    return run.results()
 
 
 async def async_batch_translate(
@@ -265,76 +885,343 @@ async def async_batch_translate(
     max_tokens: int = 800,
     delay: float | None = None,
     model: str = "gpt-4o",
+    memory: TranslationMemory | None = None,
+    scheduler: RequestScheduler | None = None,
+    multi_language: bool = False,
+    prefilter: PassthroughFilter | None = None,
+    stories: list[object] | None = None,
+    sizer: BatchSizer | None = None,
+    history: HistoryPolicy | None = None,
+    glossary: Glossary | None = None,
+    checkpoint: JobLog | None = None,
+    fuzzy: FuzzyMatcher | None = None,
+    stream: bool = False,
+    api: AsyncOpenAI | None = None,
 ) -> dict[str, list[str]]:
     """Asynchronously translate ``texts`` into ``target_langs`` using OpenAI.
 
     The function mirrors :func:`batch_translate` but performs requests
     concurrently using the asynchronous OpenAI client.  It returns the same
     dictionary mapping language codes to the list of translated segments.
-    """
-
-    results = {lang: [] for lang in target_langs}
-    translators = {
-        lang: ChatTranslator(source_lang, lang, system_prompt, model)
-        for lang in target_langs
-    }
+    ``memory`` is consulted and updated the same way as in
+    :func:`batch_translate`.
 
-    counts: dict[str, int] = {}
-    for t in texts:
-        counts[t] = counts.get(t, 0) + 1
+    Requests are dispatched through ``scheduler`` which bounds concurrency,
+    enforces per-model rate budgets and retries transient failures.  A batch
+    that still fails raises :class:`TranslationError` instead of silently
+    returning the source text.  The other arguments behave as in
+    :func:`batch_translate`.  Without ``api`` a client is created for this
+    call and closed when it returns, as a client must not be shared between
+    the event loops of different jobs.
+    """
+    if scheduler is None:
+        scheduler = RequestScheduler()
+    if history is None:
+        history = HistoryPolicy(messages=ChatTranslator.HISTORY_LIMIT)
 
-    total = max(1, len(texts) * len(target_langs))
-    done = 0
+    run = _TranslationRun(
+        texts,
+        target_langs,
+        source_lang,
+        system_prompt,
+        model,
+        memory=memory,
+        checkpoint=checkpoint,
+        stories=stories,
+        progress_callback=progress_callback,
+        max_tokens=max_tokens,
+        sizer=sizer,
+        exchanges=history.exchanges,
+    )
+    translators = run.translators
+    unique_texts = run.unique_texts
 
-    unique_texts = list(dict.fromkeys(texts))
     tasks = []
 
-    async def translate_batch(
-        lang: str, translator: ChatTranslator, batch: list[str]
-    ) -> None:
-        nonlocal done
-        marked = "\n".join(f"[[SEG{i + 1}]] {t}" for i, t in enumerate(batch))
-        prompt = (
-            f"Translate the following segments labelled [[SEG1]]..[[SEG{len(batch)}]]. "
-            "Provide the translations on separate lines using the same labels:\n" + marked
+    async def _send(
+        translator: ChatTranslator,
+        prompt: str,
+        expected: list[str],
+        segments: _SegmentStream | None = None,
+    ) -> str:
+        messages = history.build(translator, prompt, model)
+        request_tokens = count_tokens(
+            [m["content"] for m in messages] + expected, model
         )
-        translator.messages.append({"role": "user", "content": prompt})
+
+        async def call():
+            started = time.monotonic()
+            try:
+                if segments is None:
+                    response = await api.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.3,
+                    )
+                else:
+                    response = segments
+                    chunks = await api.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0.3,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                    )
+                    try:
+                        async for chunk in chunks:
+                            segments.feed(chunk)
+                    except Exception as e:
+                        # a stream cut off partway keeps what arrived, the
+                        # unfinished tail is requested again by the caller
+                        if not segments.text:
+                            raise
+                        print(f"❌ Chyba při překladu: {e}")
+                    segments.close()
+            except Exception as e:
+                kind = failure_kind(e)
+                if sizer and kind:
+                    sizer.record_failure(kind)
+                raise
+            _record_latency(sizer, response, time.monotonic() - started)
+            return response
+
         try:
-            response = await async_client.chat.completions.create(
-                model=model,
-                messages=translator.messages,
-                temperature=0.3,
-            )
-            if tokens_callback and getattr(response, "usage", None):
-                tokens_callback(getattr(response.usage, "total_tokens", 0))
-            reply = response.choices[0].message.content.strip("\n")
-            translator.messages.append({"role": "assistant", "content": reply})
-            if len(translator.messages) > ChatTranslator.HISTORY_LIMIT + 1:
-                translator.messages = [
-                    translator.messages[0]
-                ] + translator.messages[-ChatTranslator.HISTORY_LIMIT:]
-        except Exception as e:  # pragma: no cover - network errors
+            response = await scheduler.run(model, request_tokens, call)
+        except TranslationError as e:
             print(f"❌ Chyba při překladu: {e}")
-            reply = "\n".join(batch)
-
-        translations = _parse_segments(reply)
-        for original, translated in zip(batch, translations):
-            translator.cache[original] = translated
-            done += counts.get(original, 1)
-            if progress_callback:
-                progress_callback(int(done / total * 100))
+            raise
+        if tokens_callback and getattr(response, "usage", None):
+            tokens_callback(getattr(response.usage, "total_tokens", 0))
+        if segments is None:
+            reply = response.choices[0].message.content.strip("\n")
+        else:
+            reply = segments.text.strip("\n")
         if delay:
             await asyncio.sleep(delay)
+        return reply
+
+    async def translate_batch(
+        lang: str, batch: list[str], follow_up: bool = True
+    ) -> None:
+        prompt = _with_terms(glossary, batch, [lang], run.prompt(lang, batch))
+        segments = run.stream_for(lang, batch) if stream else None
+        try:
+            reply = await _send(translators[lang], prompt, batch, segments)
+        finally:
+            if segments is not None:
+                run.persist(lang, {batch[i - 1]: t for i, t in segments.parsed.items()})
+        parsed = segments.parsed if segments else _parse_segments(reply, len(batch))
+        _check_alignment(sizer, len(batch), [len(parsed)])
+        pairs = {t: parsed[i] for i, t in enumerate(batch, 1) if i in parsed}
+        history.record(translators[lang], prompt, reply, pairs)
+        if segments is None:
+            run.commit(lang, pairs)
+        missing = [t for i, t in enumerate(batch, 1) if i not in parsed]
+        if follow_up and missing:
+            await asyncio.gather(*(
+                translate_batch(lang, retry, follow_up=False)
+                for retry in run.plan_language(lang, missing)
+            ))
+
+    async def translate_multi(fanout: ChatTranslator, batch: list[str]) -> None:
+        expected = batch * len(target_langs)
+        prompt = _with_terms(
+            glossary, batch, target_langs, _multi_batch_prompt(batch, target_langs)
+        )
+        reply = await _send(fanout, prompt, expected)
+        parsed = _parse_language_segments(reply, target_langs, len(batch))
+        _check_alignment(sizer, len(batch), [len(p) for p in parsed.values()])
+        _record_fanout(history, fanout, prompt, reply, batch, parsed[target_langs[0]])
+        retries = []
+        for lang in target_langs:
+            cache = translators[lang].cache
+            wanted = [(i, t) for i, t in enumerate(batch, 1) if t not in cache]
+            run.commit(lang, {t: parsed[lang][i] for i, t in wanted if i in parsed[lang]})
+            missing = [t for i, t in wanted if i not in parsed[lang]]
+            for retry in run.plan_language(lang, missing):
+                retries.append(translate_batch(lang, retry, follow_up=False))
+        if retries:
+            await asyncio.gather(*retries)
 
-    for lang, translator in translators.items():
-        to_translate = [t for t in unique_texts if t not in translator.cache]
-        for batch in _split_batches(to_translate, max_tokens, model):
-            tasks.append(translate_batch(lang, translator, batch))
+    async def drain(batches: Iterator[list[str]], translate) -> None:
+        # workers share the iterator, so every batch is cut at the size that
+        # is current when a worker becomes free
+        for batch in batches:
+            await translate(batch)
 
-    if tasks:
-        await asyncio.gather(*tasks)
+    run.prefill(prefilter, fuzzy)
 
-    for text in texts:
+    if multi_language and len(target_langs) > 1:
+        fanout = _fanout_translator(source_lang, target_langs, system_prompt, model)
+        pending = [
+            t for t in unique_texts
+            if any(t not in tr.cache for tr in translators.values())
+        ]
+        multi_prompt = _multi_batch_prompt([], target_langs)
+        batches = run.plan(pending, multi_prompt, len(target_langs))
+        tasks.extend(
+            drain(batches, functools.partial(translate_multi, fanout))
+            for _ in range(scheduler.max_concurrency)
+        )
+    else:
         for lang, translator in translators.items():
-            results[lang].append(translator.cache.get(text, text))
-    return results
+            to_translate = [t for t in unique_texts if t not in translator.cache]
+            batches = run.plan_language(lang, to_translate)
+            tasks.extend(
+                drain(batches, functools.partial(translate_batch, lang))
+                for _ in range(scheduler.max_concurrency)
+            )
+
+    own_api = api is None
+    if own_api:
+        # retries of asynchronous requests are handled by ``RequestScheduler``
+        api = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    try:
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        if own_api:
+            await api.close()
+
+    return run.results()
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+def _submit_batch_file(requests: list[dict], api: OpenAI) -> str:
+    """Upload ``requests`` as a JSONL file, start a batch and return its id."""
+    data = "\n".join(json.dumps(r, ensure_ascii=False) for r in requests) + "\n"
+    uploaded = api.files.create(
+        file=("batch.jsonl", data.encode("utf-8")), purpose="batch"
+    )
+    batch = api.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+    )
+    return batch.id
+
+
+def _wait_for_batch(batch_id: str, poll_interval: float, api: OpenAI) -> dict[str, dict]:
+    """Poll the Batch API until ``batch_id`` ends and return its results.
+
+    Returns the chat completion bodies of the successful requests keyed by
+    their ``custom_id``.  A batch that fails, expires or is cancelled raises
+    :class:`TranslationError`.
+    """
+    batch = api.batches.retrieve(batch_id)
+    while batch.status not in BATCH_FINAL_STATES:
+        time.sleep(poll_interval)
+        batch = api.batches.retrieve(batch_id)
+    if batch.status != "completed":
+        raise TranslationError(f"batch {batch.id} ended as {batch.status}")
+    bodies: dict[str, dict] = {}
+    if not batch.output_file_id:
+        return bodies
+    for line in api.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") == 200:
+            bodies[item["custom_id"]] = response["body"]
+    return bodies
+
+
+def batch_api_translate(
+    texts: list[str],
+    target_langs: list[str],
+    source_lang: str,
+    system_prompt: str | None = None,
+    progress_callback: callable | None = None,
+    tokens_callback: callable | None = None,
+    *,
+    max_tokens: int = 800,
+    model: str = "gpt-4o",
+    memory: TranslationMemory | None = None,
+    prefilter: PassthroughFilter | None = None,
+    stories: list[object] | None = None,
+    glossary: Glossary | None = None,
+    checkpoint: JobLog | None = None,
+    fuzzy: FuzzyMatcher | None = None,
+    poll_interval: float = 30.0,
+    api: OpenAI | None = None,
+) -> dict[str, list[str]]:
+    """Translate ``texts`` through the OpenAI Batch API.
+
+    The batches planned as in :func:`batch_translate` are written to one
+    JSONL file, submitted, and polled every ``poll_interval`` seconds until
+    the Batch API has processed them, outside the synchronous rate limits.
+    Replies are matched by their ``[[SEGn]]`` labels; segments missing from
+    them are submitted once more in a second file and keep their source text
+    if they are still missing.  Requests carry no conversation history.
+    ``memory``, ``prefilter``, ``stories``, ``glossary``, ``checkpoint`` and
+    ``fuzzy`` behave as in :func:`batch_translate`; in addition every
+    submitted batch is recorded in ``checkpoint``, so a resumed job polls the
+    batch it already submitted instead of submitting the segments again.  ``api`` defaults to the
+    module client, whose endpoint can be redirected with ``OPENAI_BASE_URL``.
+    """
+    api = api or client
+    run = _TranslationRun(
+        texts,
+        target_langs,
+        source_lang,
+        system_prompt,
+        model,
+        memory=memory,
+        checkpoint=checkpoint,
+        stories=stories,
+        progress_callback=progress_callback,
+        max_tokens=max_tokens,
+    )
+    translators = run.translators
+    unique_texts = run.unique_texts
+
+    run.prefill(prefilter, fuzzy)
+
+    for attempt in range(2):
+        stored = checkpoint.get_batch(attempt) if checkpoint is not None else None
+        if stored is not None:
+            batch_id, planned = stored
+        else:
+            requests = []
+            planned = {}
+            for lang, translator in translators.items():
+                system = translator.messages[0]
+                pending = [t for t in unique_texts if t not in translator.cache]
+                for number, batch in enumerate(run.plan_language(lang, pending)):
+                    prompt = _with_terms(glossary, batch, [lang], run.prompt(lang, batch))
+                    custom_id = f"{lang}:{attempt}:{number}"
+                    planned[custom_id] = (lang, batch)
+                    requests.append({
+                        "custom_id": custom_id,
+                        "method": "POST",
+                        "url": BATCH_ENDPOINT,
+                        "body": {
+                            "model": model,
+                            "messages": [system, {"role": "user", "content": prompt}],
+                            "temperature": 0.3,
+                        },
+                    })
+            if not requests:
+                break
+            batch_id = _submit_batch_file(requests, api)
+            if checkpoint is not None:
+                checkpoint.put_batch(attempt, batch_id, planned)
+        bodies = _wait_for_batch(batch_id, poll_interval, api)
+        for custom_id, (lang, batch) in planned.items():
+            body = bodies.get(custom_id)
+            cache = translators[lang].cache
+            # a resumed batch may have been read before the restart
+            wanted = [(i, t) for i, t in enumerate(batch, 1) if t not in cache]
+            if not body or not wanted:
+                continue
+            if tokens_callback and body.get("usage"):
+                tokens_callback(body["usage"].get("total_tokens", 0))
+            reply = body["choices"][0]["message"]["content"].strip("\n")
+            parsed = _parse_segments(reply, len(batch))
+            run.commit(lang, {t: parsed[i] for i, t in wanted if i in parsed})
+
+    return run.results()
@@ -0,0 +1,76 @@
+"""Detection of segments that need no translation."""
+
+from __future__ import annotations
+
+import re
+from typing import Callable
+
+from translator.token_estimator import count_tokens
+
+PLACEHOLDER = re.compile(r"\[\[(?:TAG|RUN)\d+\]\]")
+
+_CURRENCY = r"(?:[$€£¥]|Kč|Ft|zł|CZK|EUR|USD|GBP|PLN|HUF|,-)"
+
+# Each rule receives the segment with tag and run placeholders removed and
+# stripped.
+Rule = Callable[[str], bool]
+
+
+def _sku(text: str) -> bool:
+    if not any(c.isdigit() for c in text):
+        return False
+    return re.fullmatch(r"[A-Z0-9][A-Z0-9\-_/.#]*", text) is not None
+
+
+def _full(pattern: str) -> Rule:
+    regex = re.compile(pattern, re.IGNORECASE)
+    return lambda text: regex.fullmatch(text) is not None
+
+
+DEFAULT_RULES: dict[str, Rule] = {
+    "empty": lambda text: not any(c.isalnum() for c in text),
+    "number": _full(r"[+\-±]?\d[\d\s.,'’/:×x-]*%?"),
+    # a unit after the price such as "/ks" or "/ day" needs translating
+    "price": _full(rf"{_CURRENCY}?\s*[+-]?\d[\d\s.,']*\s*{_CURRENCY}?"),
+    "sku": _sku,
+    "url": _full(r"(?:https?://|www\.)\S+"),
+    "email": _full(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"),
+}
+
+
+class PassthroughFilter:
+    """Classify segments that should be copied instead of translated.
+
+    ``rules`` maps a rule name to a predicate; a segment passes through when
+    any predicate accepts it after its ``[[TAGn]]`` and ``[[RUNn]]``
+    placeholders are removed.  The default rules cover numbers, prices, SKUs,
+    URLs, e-mail addresses and segments without letters or digits such as lone
+    punctuation or placeholders.  Counters of skipped segments and their
+    tokens accumulate over every :meth:`apply` call.
+    """
+
+    def __init__(self, rules: dict[str, Rule] | None = None) -> None:
+        self.rules = dict(DEFAULT_RULES if rules is None else rules)
+        self.skipped = 0
+        self.tokens = 0
+        self.by_rule: dict[str, int] = {}
+
+    def classify(self, text: str) -> str | None:
+        """Return the name of the first rule matching ``text`` or ``None``."""
+        bare = PLACEHOLDER.sub("", text).strip()
+        for name, rule in self.rules.items():
+            if rule(bare):
+                return name
+        return None
+
+    def apply(self, texts: list[str], model: str) -> set[str]:
+        """Return the unique ``texts`` that pass through untranslated."""
+        passthrough = set()
+        for text in dict.fromkeys(texts):
+            name = self.classify(text)
+            if name is not None:
+                passthrough.add(text)
+                self.by_rule[name] = self.by_rule.get(name, 0) + 1
+        self.skipped += len(passthrough)
+        self.tokens += count_tokens(list(passthrough), model)
+        return passthrough
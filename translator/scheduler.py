@@ -0,0 +1,247 @@
+"""Rate-limit aware scheduling of asynchronous OpenAI requests."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+import openai
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+WINDOW = 60.0  # seconds covered by per-minute budgets
+
+
+class TranslationError(Exception):
+    """Raised when a batch could not be translated after all retries."""
+
+
+@dataclass
+class RateLimit:
+    """Per-minute request and token budget for a single model.
+
+    ``None`` disables the corresponding limit.
+    """
+
+    requests_per_minute: int | None = None
+    tokens_per_minute: int | None = None
+
+
+class _Budget:
+    """Sliding one-minute window of requests and tokens for one model."""
+
+    def __init__(self, limit: RateLimit) -> None:
+        self.limit = limit
+        self.events: deque[tuple[float, int]] = deque()
+        self.tokens = 0
+        self.blocked_until = 0.0
+        # shared by the event loops of all job threads
+        self.lock = threading.Lock()
+
+    def _purge(self, now: float) -> None:
+        while self.events and now - self.events[0][0] >= WINDOW:
+            _, tokens = self.events.popleft()
+            self.tokens -= tokens
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """Return how long to wait before ``tokens`` may be spent."""
+        self._purge(now)
+        wait = max(0.0, self.blocked_until - now)
+        rpm = self.limit.requests_per_minute
+        tpm = self.limit.tokens_per_minute
+        if rpm is not None and len(self.events) >= rpm:
+            wait = max(wait, self.events[0][0] + WINDOW - now)
+        if tpm is not None and self.events and self.tokens + tokens > tpm:
+            # wait until enough old requests leave the window
+            freed = 0
+            for stamp, used in self.events:
+                freed += used
+                if self.tokens - freed + tokens <= tpm:
+                    break
+            wait = max(wait, stamp + WINDOW - now)
+        return wait
+
+    def record(self, tokens: int, now: float) -> None:
+        self.events.append((now, tokens))
+        self.tokens += tokens
+
+
+class _Slots:
+    """Concurrency limit shared by the event loops of several threads.
+
+    A released slot is handed straight to the longest waiting call, which is
+    woken up in its own event loop.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.active = 0
+        self._lock = threading.Lock()
+        self._waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    async def __aenter__(self) -> None:
+        with self._lock:
+            if self.active < self.size and not self._waiters:
+                self.active += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                handed_over = (loop, waiter) not in self._waiters
+                if not handed_over:
+                    self._waiters.remove((loop, waiter))
+            if handed_over:
+                self._release()
+            raise
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._release()
+
+    def _release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(_wake, waiter)
+                    return
+            self.active -= 1
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def _retry_after(exc: BaseException) -> float | None:
+    """Return the server requested delay in seconds from ``exc`` if present."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is not None:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Return ``True`` for transient errors worth retrying."""
+    if isinstance(
+        exc,
+        (
+            openai.RateLimitError,
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.InternalServerError,
+            asyncio.TimeoutError,
+        ),
+    ):
+        return True
+    return getattr(exc, "status_code", None) in RETRYABLE_STATUS
+
+
+class RequestScheduler:
+    """Run API calls with bounded concurrency, rate budgets and retries.
+
+    At most ``max_concurrency`` calls run at the same time.  Each model has its
+    own requests/tokens per minute budget taken from ``rate_limits`` (falling
+    back to ``default_limit``).  Failed calls are retried with exponential
+    backoff and full jitter, honouring ``Retry-After`` headers; when a model is
+    rate limited every pending request for it waits for the cooldown.  After
+    ``max_retries`` failed attempts :class:`TranslationError` is raised.
+
+    The concurrency limit and the budgets are thread-safe, so one scheduler
+    can be shared by jobs running their own event loops in separate threads.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        *,
+        rate_limits: dict[str, RateLimit] | None = None,
+        default_limit: RateLimit | None = None,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limits = dict(rate_limits or {})
+        self.default_limit = default_limit or RateLimit()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self._slots = _Slots(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._budgets: dict[str, _Budget] = {}
+
+    def _budget(self, model: str) -> _Budget:
+        with self._lock:
+            if model not in self._budgets:
+                limit = self.rate_limits.get(model, self.default_limit)
+                self._budgets[model] = _Budget(limit)
+            return self._budgets[model]
+
+    def backoff(self, attempt: int) -> float:
+        """Return the jittered delay before retry number ``attempt``."""
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def _acquire(self, budget: _Budget, tokens: int) -> None:
+        while True:
+            with budget.lock:
+                now = time.monotonic()
+                wait = budget.wait_time(tokens, now)
+                if wait <= 0:
+                    budget.record(tokens, now)
+                    return
+            await asyncio.sleep(wait)
+
+    async def run(
+        self,
+        model: str,
+        tokens: int,
+        call: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Execute ``call`` for ``model`` spending ``tokens`` of its budget."""
+        budget = self._budget(model)
+        attempt = 0
+        while True:
+            async with self._slots:
+                await self._acquire(budget, tokens)
+                try:
+                    return await call()
+                except Exception as exc:
+                    if not _is_retryable(exc) or attempt >= self.max_retries:
+                        raise TranslationError(
+                            f"request failed after {attempt + 1} attempts: {exc}"
+                        ) from exc
+                    delay = self.backoff(attempt)
+                    retry_after = _retry_after(exc)
+                    if retry_after is not None:
+                        delay = max(delay, retry_after)
+                        with budget.lock:
+                            budget.blocked_until = max(
+                                budget.blocked_until, time.monotonic() + retry_after
+                            )
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,65 @@
+"""Run story parsing and rewriting in a pool of worker processes."""
+
+from __future__ import annotations
+
+import contextlib
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Iterator
+
+
+@contextlib.contextmanager
+def story_pool(workers: int) -> Iterator[ProcessPoolExecutor | None]:
+    """Yield a pool of ``workers`` processes for :func:`map_stories`.
+
+    Nothing is started for a single worker and ``None`` is yielded instead.
+    Workers are started with ``forkserver`` where the platform has it and
+    ``spawn`` otherwise, so they are never forked from a process running
+    threads such as the web server and its job workers.
+    """
+    if workers <= 1:
+        yield None
+        return
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn"
+    )
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        yield pool
+
+
+def map_stories(
+    func: Callable[..., Any],
+    jobs: list[tuple],
+    workers: int = 1,
+    progress_callback: Callable[[int, int], None] | None = None,
+    pool: Executor | None = None,
+) -> list[Any]:
+    """Call ``func(*args)`` for every tuple in ``jobs`` and return the results.
+
+    The calls run in ``pool`` when one is given, such as a :func:`story_pool`
+    shared by all documents of a job; otherwise more than one worker starts
+    a pool for this call alone.  The results are always returned in the order
+    of ``jobs`` so the output is deterministic, while
+    ``progress_callback(done, total)`` is invoked in the calling thread as
+    individual calls complete.  ``func`` must be a module-level function so
+    it can be pickled.
+    """
+    total = len(jobs)
+    if total <= 1 or (pool is None and workers <= 1):
+        results = []
+        for done, args in enumerate(jobs, 1):
+            results.append(func(*args))
+            if progress_callback:
+                progress_callback(done, total)
+        return results
+
+    if pool is None:
+        with story_pool(min(workers, total)) as own:
+            return map_stories(func, jobs, progress_callback=progress_callback, pool=own)
+
+    futures = [pool.submit(func, *args) for args in jobs]
+    for done, _ in enumerate(as_completed(futures), 1):
+        if progress_callback:
+            progress_callback(done, total)
+    return [future.result() for future in futures]
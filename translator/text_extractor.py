@@ -5,8 +5,15 @@ from __future__ import annotations
 from lxml import etree
 import html
 import re
+import zipfile
+from concurrent.futures import Executor
+from typing import BinaryIO, Callable, Iterator
+
+from translator.idml_handler import story_members
+from translator.story_pool import map_stories
 
 TAG_PATTERN = re.compile(r"<[^>]+>")
+PLACEHOLDER_PATTERN = re.compile(r"\[\[TAG(\d+)\]\]")
 
 
 def _tags_to_placeholders(text: str) -> tuple[str, list[str]]:
@@ -21,34 +28,6 @@ def _tags_to_placeholders(text: str) -> tuple[str, list[str]]:
     return TAG_PATTERN.sub(repl, text), tags
 
 
-def _placeholders_to_tags(text: str, tags: list[str]) -> str:
-    """Reinsert ``tags`` into ``text`` replacing placeholders."""
-    text = html.escape(text, quote=False)
-    for i, tag in enumerate(tags, 1):
-        text = text.replace(f"[[TAG{i}]]", tag)
-    return text
-
-
-def _set_inner_xml(el: etree._Element, xml: str) -> None:
-    """Replace contents of ``el`` with parsed ``xml``."""
-
-    for child in list(el):
-        el.remove(child)
-    el.text = None
-    wrapper = etree.fromstring(f"<wrapper>{xml}</wrapper>")
-    el.text = wrapper.text
-    for child in wrapper:
-        el.append(child)
-
-
-def load_story_xml(story_path: str) -> etree._ElementTree:
-    """Load a Story XML file and return an ``ElementTree`` instance."""
-
-    parser = etree.XMLParser(remove_blank_text=False)
-    tree = etree.parse(str(story_path), parser)
-    return tree
-
-
 def extract_content_elements(
     tree: etree._ElementTree,
 ) -> list[tuple[etree._Element, str, list[str]]]:
@@ -68,16 +47,371 @@ def extract_content_elements(
     return result
 
 
-def update_content_elements(
-    content_list: list[tuple[etree._Element, str, list[str]]],
-    translations: list[str],
+RUN_PATTERN = re.compile(r"\[\[RUN(\d+)\]\]")
+
+
+def _paragraph_groups(
+    tree: etree._ElementTree, elements: list[etree._Element]
+) -> list[list[int]]:
+    """Group indices of ``elements`` that form one line of a paragraph.
+
+    Consecutive Content elements share a group when they belong to the same
+    ``ParagraphStyleRange`` and no ``<Br/>`` separates them.
+    """
+    lines: dict[etree._Element, tuple[etree._Element, int] | None] = {}
+    line = 0
+    for el in tree.iter("{*}Br", "{*}Content"):
+        if etree.QName(el).localname == "Br":
+            line += 1
+            continue
+        para = next(el.iterancestors("{*}ParagraphStyleRange"), None)
+        lines[el] = None if para is None else (para, line)
+
+    groups: list[list[int]] = []
+    previous = None
+    for index, el in enumerate(elements):
+        key = lines.get(el)
+        if key is not None and groups and key == previous:
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+        previous = key
+    return groups
+
+
+def _shift_placeholders(text: str, offset: int, count: int | None = None) -> str:
+    """Renumber ``[[TAGn]]`` in ``text`` by ``offset``.
+
+    When ``count`` is given, placeholders falling outside ``1..count`` after
+    the shift are dropped; their tags belong to another run.
+    """
+
+    def repl(match: re.Match[str]) -> str:
+        index = int(match.group(1)) + offset
+        if count is not None and not 0 < index <= count:
+            return ""
+        return f"[[TAG{index}]]"
+
+    return PLACEHOLDER_PATTERN.sub(repl, text)
+
+
+def join_runs(runs: list[tuple[str, list[str]]]) -> str:
+    """Join the ``(text, tags)`` of Content runs into one segment.
+
+    Runs are separated by ``[[RUNn]]`` markers, ``n`` being the index of the
+    following run, and tag placeholders are numbered across the whole
+    segment.
+    """
+    parts = []
+    offset = 0
+    for index, (text, tags) in enumerate(runs):
+        if index:
+            parts.append(f"[[RUN{index}]]")
+        parts.append(_shift_placeholders(text, offset) if offset else text)
+        offset += len(tags)
+    return "".join(parts)
+
+
+def split_runs(text: str, runs: list[tuple[str, list[str]]]) -> list[str]:
+    """Split a translated segment built by :func:`join_runs` back into runs.
+
+    When the ``[[RUNn]]`` markers are missing or out of order, the whole
+    translation goes to the first run and the remaining runs are emptied.
+    """
+    if len(runs) == 1:
+        return [text]
+    pieces = RUN_PATTERN.split(text)
+    order = [int(i) for i in pieces[1::2]]
+    if order == list(range(1, len(runs))):
+        pieces = pieces[::2]
+    else:
+        pieces = [RUN_PATTERN.sub("", text)] + [""] * (len(runs) - 1)
+    result = []
+    offset = 0
+    for piece, (_, tags) in zip(pieces, runs):
+        result.append(_shift_placeholders(piece, -offset, len(tags)))
+        offset += len(tags)
+    return result
+
+
+SLOT_START = "\ue000"
+SLOT_END = "\ue001"
+SLOT_PATTERN = re.compile(f"{SLOT_START}(\\d+){SLOT_END}")
+
+
+def _safe_inner_xml(text: str, tags: list[str]) -> str:
+    """Return inner XML for ``text`` that is guaranteed to be well formed.
+
+    The original tags form a well-formed sequence, so the result is valid as
+    long as every placeholder appears exactly once and in the original order.
+    Otherwise the placeholders are dropped and the tags are appended in their
+    original order after the text.
+    """
+    text = html.escape(text, quote=False)
+    if not tags and "[[TAG" not in text:
+        return text
+    # a single split both checks the placeholders and places the tags
+    parts = PLACEHOLDER_PATTERN.split(text)
+    if [int(i) for i in parts[1::2]] == list(range(1, len(tags) + 1)):
+        parts[1::2] = tags
+        return "".join(parts)
+    return "".join(parts[::2]) + "".join(tags)
+
+
+class StoryTemplate:
+    """A serialized story with empty slots in place of translatable Content.
+
+    The story is parsed only once; every language is then rendered by joining
+    the static XML fragments with the translated slot contents, without
+    copying or re-parsing the document.  Instances hold only strings so they
+    can be passed between processes.
+
+    ``groups`` lists the slot indices translated together as one segment;
+    by default every slot is a segment of its own.
+    """
+
+    def __init__(
+        self,
+        fragments: list[str],
+        segments: list[tuple[str, list[str]]],
+        groups: list[list[int]] | None = None,
+    ) -> None:
+        self.fragments = fragments
+        self.segments = segments
+        self.groups = groups
+
+    @classmethod
+    def from_tree(
+        cls, tree: etree._ElementTree, merge_runs: bool = False
+    ) -> "StoryTemplate":
+        """Build a template from ``tree``; the tree is modified in place.
+
+        With ``merge_runs`` the Content runs of each paragraph line are
+        grouped into a single segment, see :func:`join_runs`.
+        """
+        segments = []
+        elements = extract_content_elements(tree)
+        groups = (
+            _paragraph_groups(tree, [el for el, _, _ in elements])
+            if merge_runs
+            else None
+        )
+        for index, (el, text, tags) in enumerate(elements):
+            for child in list(el):
+                el.remove(child)
+            el.text = f"{SLOT_START}{index}{SLOT_END}"
+            segments.append((text, tags))
+        xml = etree.tostring(
+            tree, encoding="UTF-8", pretty_print=True, xml_declaration=True
+        ).decode("utf-8")
+        # split() keeps the slot numbers at odd positions
+        fragments = SLOT_PATTERN.split(xml)[::2]
+        return cls(fragments, segments, groups)
+
+    @property
+    def texts(self) -> list[str]:
+        """Return the placeholder texts of all segments in document order."""
+        if self.groups is None:
+            return [text for text, _ in self.segments]
+        return [
+            join_runs([self.segments[i] for i in group]) for group in self.groups
+        ]
+
+    def render(self, translations: list[str]) -> bytes:
+        """Return the story XML with slots filled by ``translations``.
+
+        ``translations`` align with :attr:`texts`; missing translations keep
+        the source text of their slots.
+        """
+        slot_texts = [text for text, _ in self.segments]
+        if self.groups is None:
+            slot_texts[:len(translations)] = translations[:len(slot_texts)]
+        else:
+            for group, new_text in zip(self.groups, translations):
+                runs = [self.segments[i] for i in group]
+                for i, run_text in zip(group, split_runs(new_text, runs)):
+                    slot_texts[i] = run_text
+        parts = [self.fragments[0]]
+        for index, (new_text, (_, tags)) in enumerate(zip(slot_texts, self.segments)):
+            parts.append(_safe_inner_xml(new_text, tags))
+            parts.append(self.fragments[index + 1])
+        return "".join(parts).encode("utf-8")
+
+
+def parse_story_bytes(data: bytes) -> etree._ElementTree:
+    """Parse Story XML held in memory and return an ``ElementTree``."""
+
+    parser = etree.XMLParser(remove_blank_text=False)
+    return etree.ElementTree(etree.fromstring(data, parser))
+
+
+def story_template_from_bytes(data: bytes, merge_runs: bool = False) -> StoryTemplate:
+    """Parse Story XML held in memory into its :class:`StoryTemplate`."""
+    return StoryTemplate.from_tree(parse_story_bytes(data), merge_runs)
+
+
+def load_zipped_story_templates(
+    idml_path: str,
+    members: list[str],
+    stream_threshold: int | None = None,
+    merge_runs: bool = False,
+    workers: int = 1,
+    pool: Executor | None = None,
+) -> "list[StoryTemplate | StreamedStory]":
+    """Return the templates of ``members`` of ``idml_path`` in their order.
+
+    The archive is opened once.  Stories larger than ``stream_threshold``
+    uncompressed bytes are not parsed into a tree but returned as
+    :class:`StreamedStory` objects, which always keep one segment per Content
+    element; ``merge_runs`` only applies to templates.  The others are read
+    from the open archive and parsed from their bytes in ``pool``, or by
+    ``workers`` processes, with :func:`~translator.story_pool.map_stories`.
+    """
+    results: list = [None] * len(members)
+    jobs = []
+    positions = []
+    with zipfile.ZipFile(idml_path, "r") as zip_ref:
+        for position, member in enumerate(members):
+            size = zip_ref.getinfo(member).file_size
+            if stream_threshold is not None and size > stream_threshold:
+                with zip_ref.open(member) as story:
+                    segments = list(iter_content_texts(story))
+                results[position] = StreamedStory(idml_path, member, segments)
+            else:
+                positions.append(position)
+                jobs.append((zip_ref.read(member), merge_runs))
+    for position, template in zip(
+        positions, map_stories(story_template_from_bytes, jobs, workers, pool=pool)
+    ):
+        results[position] = template
+    return results
+
+
+def iter_content_texts(source) -> Iterator[tuple[str, list[str]]]:
+    """Yield ``(text, tags)`` for translatable Content read from ``source``.
+
+    ``source`` is a path or binary file object.  The story is read with
+    ``iterparse`` and every processed element is cleared, so no full tree is
+    built.  The results match :func:`extract_content_elements`.
+    """
+    for _, el in etree.iterparse(source, events=("end",), tag="{*}Content"):
+        inner = (el.text or '') + ''.join(
+            etree.tostring(child, encoding='unicode') for child in el
+        )
+        if inner.strip():
+            yield _tags_to_placeholders(inner)
+        el.clear(keep_tail=True)
+        # drop everything already processed, including the earlier siblings
+        # of every ancestor, so the partial tree stays small; comments and
+        # processing instructions before the root element have no parent
+        for node in (el, *el.iterancestors()):
+            parent = node.getparent()
+            if parent is None:
+                break
+            while node.getprevious() is not None:
+                del parent[0]
+
+
+def collect_idml_texts(idml) -> list[str]:
+    """Return the translatable texts of all stories in an IDML archive.
+
+    ``idml`` is a path or seekable binary file object; story members are
+    decompressed and parsed as streams without extracting the archive.
+    """
+    texts: list[str] = []
+    with zipfile.ZipFile(idml, "r") as zip_ref:
+        for member in story_members(zip_ref):
+            with zip_ref.open(member) as story:
+                texts.extend(text for text, _ in iter_content_texts(story))
+    return texts
+
+
+# the attributes are matched lazily so ``<Content />`` ends at its own ``/>``
+CONTENT_ELEMENT = re.compile(rb"<Content(?:\s[^>]*?)?(?:/>|>.*?</Content\s*>)", re.S)
+_CONTENT_PREFIX = b"<Content"
+_STREAM_CHUNK = 1024 * 1024
+
+
+def _translate_content_snippet(
+    snippet: bytes, translations: Iterator[str]
+) -> bytes:
+    """Return ``snippet`` with its inner XML replaced by the next translation."""
+    el = etree.fromstring(snippet)
+    inner = (el.text or '') + ''.join(
+        etree.tostring(child, encoding='unicode') for child in el
+    )
+    if not inner.strip():
+        return snippet
+    text, tags = _tags_to_placeholders(inner)
+    new_text = next(translations, text)
+    start_tag = snippet[:snippet.index(b">") + 1]
+    return start_tag + _safe_inner_xml(new_text, tags).encode("utf-8") + b"</Content>"
+
+
+def _pending_content(buffer: bytes, pos: int) -> int:
+    """Return where an unfinished Content element (or partial tag) starts."""
+    start = buffer.find(_CONTENT_PREFIX, pos)
+    while start != -1:
+        after = buffer[start + len(_CONTENT_PREFIX):start + len(_CONTENT_PREFIX) + 1]
+        if not after or after in b" \t\r\n>/":
+            return start
+        # a longer tag name such as <ContentX> is copied through
+        start = buffer.find(_CONTENT_PREFIX, start + 1)
+    return max(pos, len(buffer) - len(_CONTENT_PREFIX))
+
+
+def write_translated_story(
+    source: BinaryIO, output: BinaryIO, translations: list[str]
 ) -> None:
-    """Replace the ``<Content>`` elements with their translated counterparts."""
-    for (el, _, tags), new_text in zip(content_list, translations):
-        xml = _placeholders_to_tags(new_text, tags)
-        _set_inner_xml(el, xml)
+    """Stream the story in ``source`` to ``output`` with ``translations`` applied.
+
+    Counterpart of :func:`iter_content_texts` for stories too large to hold in
+    memory: the input is copied in chunks and only the Content elements are
+    rewritten, so memory use stays bounded by the chunk size.
+    """
+    remaining = iter(translations)
+    buffer = b""
+    while True:
+        chunk = source.read(_STREAM_CHUNK)
+        buffer += chunk
+        pos = 0
+        for match in CONTENT_ELEMENT.finditer(buffer):
+            output.write(buffer[pos:match.start()])
+            output.write(_translate_content_snippet(match.group(0), remaining))
+            pos = match.end()
+        if not chunk:
+            output.write(buffer[pos:])
+            return
+        pending = _pending_content(buffer, pos)
+        output.write(buffer[pos:pending])
+        buffer = buffer[pending:]
+
+
+class StreamedStory:
+    """Low-memory stand-in for :class:`StoryTemplate` used for huge stories.
+
+    Only the extracted segments are kept; rendering re-reads the story from
+    the archive and streams the translated XML into the output member.
+    """
+
+    def __init__(
+        self, idml_path: str, member: str, segments: list[tuple[str, list[str]]]
+    ) -> None:
+        self.idml_path = idml_path
+        self.member = member
+        self.segments = segments
+
+    @property
+    def texts(self) -> list[str]:
+        """Return the placeholder texts of all segments in document order."""
+        return [text for text, _ in self.segments]
+
+    def render(self, translations: list[str]) -> Callable[[BinaryIO], None]:
+        """Return a writer streaming the translated story into a file object."""
 
+        def write(output: BinaryIO) -> None:
+            with zipfile.ZipFile(self.idml_path, "r") as zip_ref:
+                with zip_ref.open(self.member) as source:
+                    write_translated_story(source, output, translations)
 
-def save_story_xml(tree: etree._ElementTree, output_path: str) -> None:
-    """Write ``tree`` back to ``output_path`` preserving formatting."""
-    tree.write(str(output_path), encoding='UTF-8', pretty_print=True, xml_declaration=True)
+        return write
@@ -2,6 +2,9 @@
 
 from __future__ import annotations
 
+import threading
+from collections import OrderedDict
+
 import tiktoken
 
 # approximate rates per 1k tokens in USD
@@ -11,6 +14,14 @@ MODEL_RATES: dict[str, float] = {
     "gpt-4o": 0.005,
 }
 
+# context window and maximum reply length in tokens
+MODEL_LIMITS: dict[str, tuple[int, int]] = {
+    "gpt-3.5-turbo": (16_385, 4_096),
+    "gpt-4": (8_192, 8_192),
+    "gpt-4o": (128_000, 16_384),
+}
+DEFAULT_MODEL_LIMITS = (8_192, 4_096)
+
 # Same default system prompt used in the translator client. Duplicated here to
 # avoid cross-module imports.
 DEFAULT_SYSTEM_PROMPT = (
@@ -21,18 +32,65 @@ DEFAULT_SYSTEM_PROMPT = (
 )
 
 
+# Encoder shared by all callers; created on first use.
+_ENCODER = None
+# LRU memo of per-segment token counts shared by the estimator and batch
+# planner, which may run in several job threads at once.
+_TOKEN_COUNTS: OrderedDict[str, int] = OrderedDict()
+_TOKEN_LOCK = threading.Lock()
+MAX_MEMO_SIZE = 200_000
+ENCODE_THREADS = 8
+
+
+def _get_encoder():
+    """Return the cached ``cl100k_base`` encoder or ``None`` if unavailable."""
+    global _ENCODER
+    if _ENCODER is None:
+        # ``encoding_for_model`` may try to download data which is blocked in
+        # tests so we rely on the base encoding used by chat models.
+        try:
+            _ENCODER = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # remember the failure, loading may stall on every call offline
+            _ENCODER = False
+    return _ENCODER or None
+
+
+def token_counts(texts: list[str], model: str) -> list[int]:
+    """Return the number of tokens of every text in ``texts``.
+
+    Counts are memoised per text, keeping the ``MAX_MEMO_SIZE`` most
+    recently used, and missing ones are encoded together with
+    ``encode_batch`` which spreads the work over several threads.
+    """
+    enc = _get_encoder()
+    if enc is None:
+        return [0] * len(texts)
+    counts: dict[str, int] = {}
+    with _TOKEN_LOCK:
+        for text in dict.fromkeys(texts):
+            if text in _TOKEN_COUNTS:
+                _TOKEN_COUNTS.move_to_end(text)
+                counts[text] = _TOKEN_COUNTS[text]
+    missing = [t for t in dict.fromkeys(texts) if t not in counts]
+    if missing:
+        encode_batch = getattr(enc, "encode_batch", None)
+        if encode_batch is not None and len(missing) > 1:
+            encoded = encode_batch(missing, num_threads=ENCODE_THREADS)
+        else:
+            encoded = [enc.encode(text) for text in missing]
+        fresh = {text: len(tokens) for text, tokens in zip(missing, encoded)}
+        counts.update(fresh)
+        with _TOKEN_LOCK:
+            _TOKEN_COUNTS.update(fresh)
+            while len(_TOKEN_COUNTS) > MAX_MEMO_SIZE:
+                _TOKEN_COUNTS.popitem(last=False)
+    return [counts[t] for t in texts]
+
+
 def count_tokens(texts: list[str], model: str) -> int:
     """Return the total number of tokens for ``texts`` using ``model`` encoding."""
-    # ``encoding_for_model`` may try to download data which is blocked in tests
-    # so we rely on the base encoding used by chat models.
-    try:
-        enc = tiktoken.get_encoding("cl100k_base")
-    except Exception:
-        return 0
-    total = 0
-    for text in texts:
-        total += len(enc.encode(text))
-    return total
+    return sum(token_counts(texts, model))
 
 
 def estimate_cost(tokens: int, model: str, languages: int = 1) -> float:
@@ -56,7 +114,8 @@ def estimate_total_tokens(
     unique = list(dict.fromkeys(texts))
 
     # Tokens for the user's request
-    tokens = count_tokens(unique, model)
+    text_tokens = count_tokens(unique, model)
+    tokens = text_tokens
     tokens += count_tokens([system_prompt], model)
     tokens += count_tokens(
         [
@@ -73,7 +132,7 @@ def estimate_total_tokens(
     tokens += overhead * 2  # user + assistant
 
     # Assume replies are roughly the same length as the source
-    response_tokens = count_tokens(unique, model)
+    response_tokens = text_tokens
 
     total = (tokens + response_tokens + overhead) * max(1, languages)
     return total
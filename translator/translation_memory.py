@@ -0,0 +1,303 @@
+"""Persistent translation memory backed by SQLite."""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+from translator.fuzzy import minhash_bands
+
+
+def _hash(text: str) -> str:
+    """Return a stable hex digest for ``text``."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TranslationMemory:
+    """Disk-backed cache of translated segments shared across jobs.
+
+    Entries are keyed on the hash of the source text together with the source
+    and target language, the model and the hash of the system prompt, so that a
+    changed prompt or model never returns stale translations.  The least
+    recently used entries are evicted once ``max_entries`` is exceeded,
+    leaving a tenth of it free so that eviction does not run on every write,
+    and entries unused for longer than ``max_age`` seconds are dropped by
+    :meth:`evict` and are never returned.
+
+    With ``fuzzy`` enabled every stored entry is also indexed by the MinHash
+    bands of its source text, which :meth:`fuzzy_many` uses to find similar
+    earlier segments.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int | None = 500_000,
+        max_age: float | None = None,
+        fuzzy: bool = False,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.fuzzy = fuzzy
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS memory (
+                key TEXT PRIMARY KEY,
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                source TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS memory_last_used ON memory (last_used)"
+        )
+        if fuzzy:
+            # band rows disappear with their entry, also on INSERT OR REPLACE
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bands (
+                    band INTEGER NOT NULL,
+                    key TEXT NOT NULL REFERENCES memory (key) ON DELETE CASCADE
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS bands_band ON bands (band)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands (key)")
+        self._conn.commit()
+        # upper bound of the stored entries, exact again after every eviction
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+
+    @staticmethod
+    def make_key(
+        text: str, source_lang: str, target_lang: str, model: str, prompt: str
+    ) -> str:
+        """Return the lookup key for ``text`` in the given translation setup."""
+        parts = (_hash(text), source_lang, target_lang, model, _hash(prompt))
+        return _hash("\x1f".join(parts))
+
+    @staticmethod
+    def _scope(source_lang: str, target_lang: str, model: str, prompt: str) -> str:
+        return "\x1f".join((source_lang, target_lang, model, _hash(prompt)))
+
+    def get_many(
+        self,
+        texts: list[str],
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        prompt: str,
+    ) -> dict[str, str]:
+        """Return stored translations for ``texts`` that are present."""
+        keys = {
+            self.make_key(t, source_lang, target_lang, model, prompt): t
+            for t in texts
+        }
+        found: dict[str, str] = {}
+        now = time.time()
+        with self._lock:
+            items = list(keys)
+            for start in range(0, len(items), 500):
+                chunk = items[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, translation, last_used FROM memory WHERE key IN ({marks})",
+                    chunk,
+                ).fetchall()
+                fresh = []
+                for key, translation, last_used in rows:
+                    if self.max_age is not None and now - last_used > self.max_age:
+                        continue
+                    found[keys[key]] = translation
+                    fresh.append((now, key))
+                self._conn.executemany(
+                    "UPDATE memory SET last_used = ? WHERE key = ?", fresh
+                )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(
+        self,
+        text: str,
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        prompt: str,
+    ) -> str | None:
+        """Return the stored translation of ``text`` or ``None``."""
+        return self.get_many([text], source_lang, target_lang, model, prompt).get(text)
+
+    def fuzzy_many(
+        self,
+        texts: list[str],
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        prompt: str,
+        limit: int = 20,
+    ) -> dict[str, list[tuple[str, str]]]:
+        """Return up to ``limit`` ``(source, translation)`` candidates per text.
+
+        Candidates share at least one MinHash band with the text, those
+        sharing the most bands come first.  Without ``fuzzy`` nothing is
+        indexed and an empty result is returned.
+        """
+        if not self.fuzzy:
+            return {}
+        scope = self._scope(source_lang, target_lang, model, prompt)
+        found: dict[str, list[tuple[str, str]]] = {}
+        with self._lock:
+            for text in texts:
+                bands = minhash_bands(text, scope)
+                marks = ",".join("?" * len(bands))
+                rows = self._conn.execute(
+                    f"""
+                    SELECT m.source, m.translation FROM bands b
+                    JOIN memory m ON m.key = b.key
+                    WHERE b.band IN ({marks})
+                    GROUP BY b.key ORDER BY COUNT(*) DESC LIMIT ?
+                    """,
+                    [*bands, limit],
+                ).fetchall()
+                if rows:
+                    found[text] = rows
+        return found
+
+    def put_many(
+        self,
+        pairs: dict[str, str],
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        prompt: str,
+    ) -> None:
+        """Store ``pairs`` mapping source texts to their translations."""
+        if not pairs:
+            return
+        now = time.time()
+        prompt_hash = _hash(prompt)
+        rows = [
+            (
+                self.make_key(src, source_lang, target_lang, model, prompt),
+                source_lang,
+                target_lang,
+                model,
+                prompt_hash,
+                src,
+                dst,
+                now,
+                now,
+            )
+            for src, dst in pairs.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO memory VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if self.fuzzy:
+                scope = self._scope(source_lang, target_lang, model, prompt)
+                self._conn.executemany(
+                    "INSERT INTO bands VALUES (?, ?)",
+                    [
+                        (band, row[0])
+                        for row in rows
+                        for band in minhash_bands(row[5], scope)
+                    ],
+                )
+            self._entries += len(rows)
+            if self.max_entries is not None and self._entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def evict(self) -> None:
+        """Drop expired entries and trim the memory below ``max_entries``."""
+        with self._lock:
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if self.max_age is not None:
+            self._conn.execute(
+                "DELETE FROM memory WHERE last_used < ?",
+                (time.time() - self.max_age,),
+            )
+        if self.max_entries is not None:
+            self._conn.execute(
+                """
+                DELETE FROM memory WHERE key IN (
+                    SELECT key FROM memory ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries - self.max_entries // 10,),
+            )
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0]
+
+    def stats(self) -> dict[str, int]:
+        """Return hit/miss counters and the number of stored entries."""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+    def job(self) -> "JobMemory":
+        """Return a view of this memory counting the hits of a single job."""
+        return JobMemory(self)
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class JobMemory:
+    """Lookups of one job in a shared :class:`TranslationMemory`.
+
+    This is what :func:`translator.openai_client.batch_translate` takes as
+    ``memory``; ``hits`` and ``misses`` only count the lookups made through
+    this view, unlike the counters of the memory, which concurrent jobs share.
+    """
+
+    def __init__(self, memory: TranslationMemory) -> None:
+        self.memory = memory
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(
+        self,
+        texts: list[str],
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        prompt: str,
+    ) -> dict[str, str]:
+        found = self.memory.get_many(texts, source_lang, target_lang, model, prompt)
+        self.hits += len(found)
+        self.misses += len(set(texts)) - len(found)
+        return found
+
+    def put_many(
+        self,
+        pairs: dict[str, str],
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        prompt: str,
+    ) -> None:
+        self.memory.put_many(pairs, source_lang, target_lang, model, prompt)